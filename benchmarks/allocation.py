@@ -0,0 +1,165 @@
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Measure the memory allocated by a L{tubes.tube.series} as it delivers a large
+number of items, with L{tracemalloc}.
+
+Two things are measured for a tube which returns a one-item L{list} for each
+input:
+
+    - while its drain accepts every item, how much the peak traced memory
+      grows, which should be nothing once the pipeline has warmed up; and
+
+    - while its drain is paused, how many bytes are kept for each buffered
+      item, beyond the L{list} which the tube itself returned.
+
+Run from the root of a checkout with
+C{PYTHONPATH=. python benchmarks/allocation.py [items]}.
+"""
+
+from __future__ import print_function
+
+import sys
+import tracemalloc
+from timeit import default_timer
+
+from zope.interface import implementer
+
+from tubes.itube import IDrain
+from tubes.kit import beginFlowingFrom
+from tubes.tube import tube, series
+from tubes.test.util import FakeFount
+
+
+
+@tube
+class Wrap(object):
+    """
+    A tube which returns each input in a one-item L{list}.
+    """
+
+    def received(self, item):
+        """
+        Wrap an item in a L{list}.
+
+        @param item: anything
+
+        @return: C{[item]}
+        """
+        return [item]
+
+
+
+@implementer(IDrain)
+class CountingDrain(object):
+    """
+    A drain which only counts what it receives, so that it allocates nothing.
+    """
+
+    inputType = None
+    fount = None
+    count = 0
+
+    def flowingFrom(self, fount):
+        """
+        Flow from a fount.
+
+        @param fount: see L{IDrain}
+        """
+        beginFlowingFrom(self, fount)
+
+
+    def receive(self, item):
+        """
+        Count an item.
+
+        @param item: see L{IDrain}
+        """
+        self.count += 1
+
+
+    def flowStopped(self, reason):
+        """
+        The flow stopped.
+
+        @param reason: see L{IDrain}
+        """
+
+
+
+def steadyState(items):
+    """
+    Deliver C{items} items through a L{Wrap} to a L{CountingDrain}, once
+    to time it and once more while tracing memory allocations.
+
+    @param items: the number of items.
+    @type items: L{int}
+
+    @return: seconds per item and the growth in peak traced memory, in bytes.
+    @rtype: 2-L{tuple} of L{float}, L{int}
+    """
+    ff = FakeFount()
+    fd = CountingDrain()
+    ff.flowTo(series(Wrap())).flowTo(fd)
+    receive = ff.drain.receive
+    inputs = range(items)
+    start = default_timer()
+    for each in inputs:
+        receive(each)
+    elapsed = default_timer() - start
+    tracemalloc.start()
+    before, ignored = tracemalloc.get_traced_memory()
+    for each in inputs:
+        receive(each)
+    ignored, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert fd.count == items * 2
+    return elapsed / items, peak - before
+
+
+
+def buffered(items):
+    """
+    Deliver C{items} items through a L{Wrap} to a paused L{CountingDrain}.
+
+    @param items: the number of items.
+    @type items: L{int}
+
+    @return: bytes retained per buffered item, beyond the tube's own
+        L{list}.
+    @rtype: L{float}
+    """
+    ff = FakeFount()
+    fd = CountingDrain()
+    ff.flowTo(series(Wrap())).flowTo(fd)
+    pause = fd.fount.pauseFlow()
+    receive = ff.drain.receive
+    inputs = [None] * items
+    tracemalloc.start()
+    before, ignored = tracemalloc.get_traced_memory()
+    for each in inputs:
+        receive(each)
+    after, ignored = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    pause.unpause()
+    assert fd.count == items
+    return float(after - before) / items - sys.getsizeof([None])
+
+
+
+def main():
+    """
+    Print the measurements.
+    """
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    perItem, growth = steadyState(items)
+    print("{} items: {:.2f} us/item, peak traced memory grew {} bytes"
+          .format(items, perItem * 1e6, growth))
+    print("paused: {:.1f} bytes kept per buffered item besides its list"
+          .format(buffered(items)))
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Measure the memory used by each idle connection whose data flows through a
+typical 4-stage pipeline, with L{tracemalloc}.
+
+Each connection is a L{tubes.protocol._ProtocolPlumbing} connected to a
+L{StringTransport}, whose fount flows through a L{series} of a line parser, a
+stateful tube, a stateless receiver and a line serializer, back to its drain.
+The transports are created before measuring, so only the memory allocated
+by L{tubes} (and by connecting the protocol to its transport) is counted.
+
+Run from the root of a checkout with
+C{PYTHONPATH=. python benchmarks/connections.py [connections]}.
+"""
+
+from __future__ import print_function
+
+import sys
+import tracemalloc
+
+from twisted.internet.testing import StringTransport
+
+from tubes.framing import bytesToLines, linesToBytes
+from tubes.protocol import _factoryFromFlow
+from tubes.tube import tube, receiver, series
+
+
+
+@tube
+class Counter(object):
+    """
+    A stateful tube which numbers each line.
+    """
+
+    def __init__(self):
+        """
+        Start counting from 0.
+        """
+        self.count = 0
+
+
+    def received(self, line):
+        """
+        Number a line.
+
+        @param line: a line.
+        @type line: L{bytes}
+
+        @return: the numbered line.
+        """
+        self.count += 1
+        return [b"%d %s" % (self.count, line)]
+
+
+
+@receiver()
+def upper(line):
+    """
+    Upper-case a line.
+
+    @param line: a line.
+    @type line: L{bytes}
+
+    @return: the upper-cased line.
+    """
+    return [line.upper()]
+
+
+
+def flow(fount, drain):
+    """
+    Connect the pipeline for a connection.
+
+    @param fount: the connection's fount.
+
+    @param drain: the connection's drain.
+    """
+    fount.flowTo(series(bytesToLines(), Counter(), upper, linesToBytes(),
+                        drain))
+
+
+
+def perConnection(connections):
+    """
+    Establish some idle connections.
+
+    @param connections: the number of connections.
+    @type connections: L{int}
+
+    @return: bytes allocated for each connection.
+    @rtype: L{float}
+    """
+    factory = _factoryFromFlow(flow)
+    transports = [StringTransport() for ignored in range(connections)]
+    protocols = []
+    tracemalloc.start()
+    before, ignored = tracemalloc.get_traced_memory()
+    for transport in transports:
+        protocol = factory.buildProtocol(None)
+        protocol.makeConnection(transport)
+        protocols.append(protocol)
+    after, ignored = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    transports[0].protocol = protocols[0]
+    protocols[0].dataReceived(b"hello\n")
+    assert transports[0].value() == b"1 HELLO\r\n"
+    return float(after - before) / connections
+
+
+
+def main():
+    """
+    Print the number of bytes used for each connection.
+    """
+    connections = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    print("{} connections: {:.0f} bytes per idle connection"
+          .format(connections, perConnection(connections)))
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Measure the cost of pausing and resuming the fount of a L{tubes.fan.In} with
+many inputs, and of inputs leaving it.
+
+For each number of inputs, the time to pause and resume the L{In}'s fount is
+printed, while 1% of the inputs deliver an item while it is paused, both
+for an L{In} which pauses every input eagerly and for one with a buffer of
+one item for each input, which pauses inputs lazily.  Then the time for one
+input to stop is printed.
+
+Run from the root of a checkout with
+C{PYTHONPATH=. python benchmarks/fanin.py}.
+"""
+
+from __future__ import print_function
+
+from timeit import default_timer
+
+from tubes.fan import In
+from tubes.test.util import FakeFount, FakeDrain
+
+
+
+def pauseResume(inputCount, bufferSize, rounds=5):
+    """
+    Time pausing and resuming the fount of an L{In}.
+
+    @param inputCount: the number of inputs.
+    @type inputCount: L{int}
+
+    @param bufferSize: see L{In}
+
+    @param rounds: the number of times to pause and resume.
+    @type rounds: L{int}
+
+    @return: seconds per pause and resume.
+    @rtype: L{float}
+    """
+    fanIn = In(bufferSize)
+    fd = FakeDrain()
+    fanIn.fount.flowTo(fd)
+    founts = []
+    for ignored in range(inputCount):
+        ff = FakeFount()
+        ff.flowTo(fanIn.newDrain())
+        founts.append(ff)
+    busy = founts[::100]
+    before = default_timer()
+    for ignored in range(rounds):
+        pause = fd.fount.pauseFlow()
+        for ff in busy:
+            if not ff.flowIsPaused:
+                ff.drain.receive(None)
+        pause.unpause()
+    return (default_timer() - before) / rounds
+
+
+
+def stopping(inputCount, stops=1000):
+    """
+    Time inputs stopping.
+
+    @param inputCount: the number of inputs.
+    @type inputCount: L{int}
+
+    @param stops: the number of inputs to stop.
+    @type stops: L{int}
+
+    @return: seconds per input stopped.
+    @rtype: L{float}
+    """
+    fanIn = In()
+    fanIn.fount.flowTo(FakeDrain())
+    drains = [fanIn.newDrain() for ignored in range(inputCount)]
+    before = default_timer()
+    for drain in drains[inputCount // 2:inputCount // 2 + stops]:
+        drain.flowStopped(None)
+    return (default_timer() - before) / stops
+
+
+
+def main():
+    """
+    Print a table of pause, resume and stop times.
+    """
+    print("{:>8} {:>18} {:>18} {:>14}".format(
+        "inputs", "eager pause (ms)", "lazy pause (ms)", "stop (us)"))
+    for inputCount in [10000, 50000, 100000]:
+        print("{:>8} {:>18.2f} {:>18.2f} {:>14.2f}".format(
+            inputCount,
+            pauseResume(inputCount, None) * 1e3,
+            pauseResume(inputCount, 1) * 1e3,
+            stopping(inputCount) * 1e6))
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Measure the cost of broadcasting through a L{tubes.fan.Out} as the number of
+subscribers grows, with and without churn.
+
+For each number of subscribers, the time to broadcast an item is printed,
+divided by the number of subscribers, first with a fixed set of
+subscribers, and then with one subscriber leaving and another joining
+before every item.  Both should stay roughly constant as the number of
+subscribers grows.
+
+Run from the root of a checkout with
+C{PYTHONPATH=. python benchmarks/fanout.py}.
+"""
+
+from __future__ import print_function
+
+from timeit import default_timer
+
+from tubes.fan import Out
+from tubes.test.util import FakeFount
+from tubes.itube import IDrain
+
+from zope.interface import implementer
+
+
+
+@implementer(IDrain)
+class NullDrain(object):
+    """
+    A drain which discards everything it receives.
+    """
+
+    inputType = None
+    fount = None
+
+    def flowingFrom(self, fount):
+        self.fount = fount
+
+
+    def receive(self, item):
+        pass
+
+
+    def flowStopped(self, reason):
+        pass
+
+
+
+def perDelivery(subscriberCount, items, churn):
+    """
+    Time the broadcast of C{items} items to C{subscriberCount} subscribers.
+
+    @param subscriberCount: the number of subscribers.
+    @type subscriberCount: L{int}
+
+    @param items: the number of items to broadcast.
+    @type items: L{int}
+
+    @param churn: if L{True}, before each item, stop the oldest subscriber
+        and add a new one.
+    @type churn: L{bool}
+
+    @return: seconds per delivery to one subscriber.
+    @rtype: L{float}
+    """
+    out = Out()
+    founts = []
+    for ignored in range(subscriberCount):
+        fount = out.newFount()
+        fount.flowTo(NullDrain())
+        founts.append(fount)
+    ff = FakeFount()
+    ff.flowTo(out.drain)
+    receive = ff.drain.receive
+    before = default_timer()
+    for item in range(items):
+        if churn:
+            founts[item % subscriberCount].stopFlow()
+            fount = out.newFount()
+            fount.flowTo(NullDrain())
+            founts[item % subscriberCount] = fount
+        receive(item)
+    return (default_timer() - before) / (items * subscriberCount)
+
+
+
+def main():
+    """
+    Print a table of per-delivery broadcast times.
+    """
+    print("{:>12} {:>14} {:>14}".format("subscribers", "steady (ns)",
+                                        "churn (ns)"))
+    for subscriberCount in [1, 10, 100, 1000, 10000, 100000]:
+        items = max(10, 1000000 // subscriberCount)
+        print("{:>12} {:>14.1f} {:>14.1f}".format(
+            subscriberCount,
+            perDelivery(subscriberCount, items, False) * 1e9,
+            perDelivery(subscriberCount, items, True) * 1e9))
+
+
+
+if __name__ == '__main__':
+    main()
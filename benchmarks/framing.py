@@ -0,0 +1,163 @@
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Measure the throughput of the parsers in L{tubes.framing}, and of the
+L{twisted.protocols.basic} receivers which they replaced.
+
+Each parser is given a stream of 64-byte frames, cut into segments of a few
+sizes, and the number of megabytes of segments it parses each second is
+printed.  The old parsers are driven the way L{tubes.framing} used to drive
+them: by calling C{dataReceived} and collecting the frames that it passes to
+a replacement for C{stringReceived}.
+
+The varint-prefixed parser is compared with the 32-bit-prefixed one in the
+same way, for 64-byte frames, whose varint prefixes are 1 byte long, and for
+1000-byte frames, whose varint prefixes are 2 bytes long.
+
+Run from the root of a checkout with
+C{PYTHONPATH=. python benchmarks/framing.py [megabytes]}.
+"""
+
+from __future__ import print_function
+
+import sys
+from struct import pack
+from timeit import default_timer
+
+from twisted.protocols.basic import (
+    LineOnlyReceiver, NetstringReceiver, Int32StringReceiver
+)
+
+from tubes.framing import (
+    bytesDelimitedBy, netstringsToBytes, bytesToIntPrefixed,
+    bytesToVarintPrefixed, varintPrefixedToBytes
+)
+
+
+
+class NotDisconnecting(object):
+    """
+    Enough of a transport to pretend to not be disconnecting.
+    """
+    disconnecting = False
+
+
+
+def shim(receiver, receivedMethodName="stringReceived"):
+    """
+    Create a parsing function from a receiver, in the way that
+    L{tubes.framing} used to.
+
+    @param receiver: a protocol from L{twisted.protocols.basic}.
+
+    @param receivedMethodName: the name of the method which C{receiver} calls
+        with each frame.
+
+    @return: a 1-argument callable taking a segment and returning a L{list}
+        of frames.
+    """
+    frames = []
+    setattr(receiver, receivedMethodName, frames.append)
+    receiver.makeConnection(NotDisconnecting())
+    def parse(segment):
+        receiver.dataReceived(segment)
+        result = frames[:]
+        del frames[:]
+        return result
+    return parse
+
+
+
+def stream(encode, megabytes, frameSize=64):
+    """
+    Encode enough frames for a stream of a given size.
+
+    @param encode: a 1-argument callable which frames some L{bytes}.
+
+    @param megabytes: the size of the stream.
+
+    @param frameSize: the size of each frame.
+
+    @return: the stream, and the number of frames in it.
+    @rtype: 2-L{tuple} of L{bytes}, L{int}
+    """
+    frame = encode(b"x" * frameSize)
+    count = megabytes * 1024 * 1024 // len(frame)
+    return frame * count, count
+
+
+
+def throughput(parse, data, count, segmentSize):
+    """
+    Parse a stream.
+
+    @param parse: a 1-argument callable taking a segment and returning a
+        L{list} of frames.
+
+    @param data: the stream.
+
+    @param count: the number of frames in the stream.
+
+    @param segmentSize: the size of the segments to cut C{data} into.
+
+    @return: megabytes parsed per second.
+    @rtype: L{float}
+    """
+    segments = [data[offset:offset + segmentSize]
+                for offset in range(0, len(data), segmentSize)]
+    parsed = 0
+    start = default_timer()
+    for segment in segments:
+        parsed += len(parse(segment))
+    elapsed = default_timer() - start
+    assert parsed == count, (parsed, count)
+    return len(data) / elapsed / (1024 * 1024)
+
+
+
+def main():
+    """
+    Print the throughput of each parser.
+    """
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    lines = LineOnlyReceiver()
+    lines.delimiter = b"\n"
+    formats = [
+        ("lines", lambda frame: frame + b"\n",
+         lambda: shim(lines, "lineReceived"),
+         lambda: bytesDelimitedBy(b"\n").received),
+        ("netstrings", lambda frame: b"%d:%s," % (len(frame), frame),
+         lambda: shim(NetstringReceiver()),
+         lambda: netstringsToBytes().received),
+        ("int32", lambda frame: pack("!I", len(frame)) + frame,
+         lambda: shim(Int32StringReceiver()),
+         lambda: bytesToIntPrefixed(32).received),
+    ]
+    for name, encode, old, new in formats:
+        data, count = stream(encode, megabytes)
+        for segmentSize in [16, 1024, 65536]:
+            print("{:>10} {:>6}-byte segments: {:8.1f} MB/s before, "
+                  "{:8.1f} MB/s after"
+                  .format(name, segmentSize,
+                          throughput(old(), data, count, segmentSize),
+                          throughput(new(), data, count, segmentSize)))
+    encodeVarint = varintPrefixedToBytes().received
+    for frameSize in [64, 1000]:
+        int32, int32Count = stream(lambda frame: pack("!I", len(frame)) +
+                                   frame, megabytes, frameSize)
+        varint, varintCount = stream(lambda frame: encodeVarint(frame)[0],
+                                     megabytes, frameSize)
+        for segmentSize in [1024, 65536]:
+            print("{:>4}-byte frames {:>6}-byte segments: {:8.1f} MB/s "
+                  "int32, {:8.1f} MB/s varint"
+                  .format(frameSize, segmentSize,
+                          throughput(bytesToIntPrefixed(32).received, int32,
+                                     int32Count, segmentSize),
+                          throughput(bytesToVarintPrefixed().received, varint,
+                                     varintCount, segmentSize)))
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Compare the per-item cost of a L{tubes.tube.series} of stateless receivers
+when they are fused into a single stage and when each has its own stage.
+
+Run from the root of a checkout with
+C{PYTHONPATH=. python benchmarks/fusion.py}.
+"""
+
+from __future__ import print_function
+
+from timeit import default_timer
+
+from tubes.tube import receiver, series
+from tubes.test.util import FakeDrain, FakeFount
+
+
+
+@receiver()
+def addOne(item):
+    """
+    A cheap stateless receiver.
+
+    @param item: an L{int}
+
+    @return: a L{list} of C{item + 1}
+    """
+    return [item + 1]
+
+
+
+def perItem(fused, length, items=20000):
+    """
+    Time the delivery of C{items} items through a chain of receivers.
+
+    @param fused: whether to let L{series} fuse the receivers.
+    @type fused: L{bool}
+
+    @param length: the number of receivers in the chain.
+    @type length: L{int}
+
+    @param items: the number of items to send.
+    @type items: L{int}
+
+    @return: seconds per item.
+    @rtype: L{float}
+    """
+    if fused:
+        stages = [addOne] * length
+    else:
+        stages = [series(addOne) for ignored in range(length)]
+    ff = FakeFount()
+    fd = FakeDrain()
+    ff.flowTo(series(*stages)).flowTo(fd)
+    receive = ff.drain.receive
+    before = default_timer()
+    for each in range(items):
+        receive(each)
+    elapsed = default_timer() - before
+    assert fd.received[-1] == items - 1 + length
+    return elapsed / items
+
+
+
+def main():
+    """
+    Print a table of per-item times for chains of various lengths.
+    """
+    print("{:>8} {:>14} {:>14}".format("stages", "unfused (us)",
+                                       "fused (us)"))
+    for length in [2, 5, 10, 20]:
+        print("{:>8} {:>14.2f} {:>14.2f}".format(
+            length, perItem(False, length) * 1e6,
+            perItem(True, length) * 1e6))
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Measure the per-item cost of dispatching through a L{tubes.routing.Router} as
+the number of routes grows, with and without C{indexed=True}.
+
+Run from the root of a checkout with
+C{PYTHONPATH=. python benchmarks/routing.py}.
+"""
+
+from __future__ import print_function
+
+from timeit import default_timer
+
+from tubes.routing import Router, to
+from tubes.test.util import FakeDrain, FakeFount
+
+
+
+def perItem(indexed, routeCount, items):
+    """
+    Time the delivery of C{items} routed items through a router with
+    C{routeCount} routes.
+
+    @param indexed: see L{Router}
+
+    @param routeCount: the number of routes to create.
+    @type routeCount: L{int}
+
+    @param items: the number of items to send.
+    @type items: L{int}
+
+    @return: seconds per item.
+    @rtype: L{float}
+    """
+    router = Router(indexed=indexed)
+    routes = []
+    for ignored in range(routeCount):
+        route = router.newRoute()
+        route.flowTo(FakeDrain())
+        routes.append(route)
+    ff = FakeFount()
+    ff.flowTo(router.drain)
+    receive = ff.drain.receive
+    envelopes = [to(routes[n % routeCount], n) for n in range(items)]
+    before = default_timer()
+    for envelope in envelopes:
+        receive(envelope)
+    return (default_timer() - before) / items
+
+
+
+def main():
+    """
+    Print a table of per-item dispatch times.
+    """
+    print("{:>8} {:>14} {:>14}".format("routes", "filter (us)",
+                                       "indexed (us)"))
+    for routeCount in [1, 10, 100, 1000, 10000]:
+        filtered = perItem(False, routeCount, max(20, 20000 // routeCount))
+        indexed = perItem(True, routeCount, 20000)
+        print("{:>8} {:>14.2f} {:>14.2f}".format(
+            routeCount, filtered * 1e6, indexed * 1e6))
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Compare the cost of creating a per-connection pipeline with
+L{tubes.tube.series} and with L{tubes.tube.PipelineTemplate}.
+
+Run from the root of a checkout with
+C{PYTHONPATH=. python benchmarks/template.py}.
+"""
+
+from __future__ import print_function
+
+from timeit import default_timer
+
+from tubes.itube import IFrame
+from tubes.tube import tube, series, PipelineTemplate
+from tubes.framing import bytesToNetstrings, netstringsToBytes
+
+
+
+@tube
+class Reverser(object):
+    """
+    A stateful-looking tube, such as a protocol parser.
+    """
+
+    inputType = IFrame
+    outputType = IFrame
+
+    def received(self, item):
+        """
+        Reverse an item.
+
+        @param item: a frame.
+
+        @return: a L{list} of the reversed frame.
+        """
+        return [item[::-1]]
+
+
+
+def perPipeline(create, count=20000):
+    """
+    Time the creation of C{count} pipelines.
+
+    @param create: a 0-argument callable that creates a pipeline.
+
+    @param count: the number of pipelines to create.
+    @type count: L{int}
+
+    @return: seconds per pipeline.
+    @rtype: L{float}
+    """
+    before = default_timer()
+    for ignored in range(count):
+        create()
+    return (default_timer() - before) / count
+
+
+
+def main():
+    """
+    Print the time taken to create a pipeline each way.
+    """
+    template = PipelineTemplate(netstringsToBytes, Reverser,
+                                bytesToNetstrings)
+    def withSeries():
+        return series(netstringsToBytes(), Reverser(), bytesToNetstrings())
+    print("series():              {:8.2f} us".format(
+        perPipeline(withSeries) * 1e6))
+    print("PipelineTemplate:      {:8.2f} us".format(
+        perPipeline(template.newDrain) * 1e6))
+
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
-# -*- test-case-name: tubes.test.test_tube -*-
+# -*- test-case-name: tubes.test.test_components -*-
 # Copyright (c) Twisted Matrix Laboratories.
 # See LICENSE for details.
 
@@ -6,9 +6,8 @@
 Various component utilities.
 """
 
+from zope.interface import providedBy
 from zope.interface.adapter import AdapterRegistry
-from twisted.python.components import _addHook, _removeHook
-from contextlib import contextmanager
 
 if 0:
     from zope.interface.interfaces import IInterface
@@ -16,29 +15,50 @@ if 0:
 
 
 
-@contextmanager
-def _registryActive(registry):
+def _adapterUsing(registry, interface):
     """
-    A context manager that activates and deactivates a zope adapter registry
-    for the duration of the call.
+    Create a function which adapts objects to an interface using a zope
+    adapter registry, without making that registry visible anywhere else.
 
     For example, if you wanted to have a function that could adapt C{IFoo} to
     C{IBar}, but doesn't expose that adapter outside of itself::
 
-        def convertToBar(maybeFoo):
-            with _registryActive(_registryAdapting((IFoo, IBar, fooToBar))):
-                return IBar(maybeFoo)
+        convertToBar = _adapterUsing(_registryAdapting((IFoo, IBar, fooToBar)),
+                                     IBar)
 
-    @note: This isn't thread safe, so other threads will be affected as well.
+    Unlike activating C{registry} with a global adapter hook, this has no
+    effect on other callers of C{interface}, so it is safe to call from any
+    thread.  Adapters are looked up once for each distinct specification
+    provided by the objects being adapted (in practice, once for each class),
+    and then cached.
 
-    @param registry: The registry to activate.
+    @param registry: The registry to look up adapters in.
     @type registry: L{AdapterRegistry}
 
-    @rtype:
+    @param interface: The interface to adapt to.
+    @type interface: L{IInterface}
+
+    @return: a 1-argument callable which returns its argument if it already
+        provides C{interface}, or the result of adapting it to C{interface}
+        with an adapter from C{registry}, or failing that, any globally
+        registered adapter.  If no adapter is found, it raises L{TypeError},
+        just as calling C{interface} would.
     """
-    hook = _addHook(registry)
-    yield
-    _removeHook(hook)
+    cache = {}
+    def adapt(original):
+        if interface.providedBy(original):
+            return original
+        spec = providedBy(original)
+        try:
+            adapter = cache[spec]
+        except KeyError:
+            adapter = cache[spec] = registry.lookup1(spec, interface)
+        if adapter is not None:
+            adapted = adapter(original)
+            if adapted is not None:
+                return adapted
+        return interface(original)
+    return adapt
 
 
 
@@ -10,9 +10,9 @@ from collections import deque
 
 from zope.interface import implementer
 
-from .itube import IDrain, IFount, ITube
+from .itube import IDrain, IFount, ITube, IBatchDrain, IDivertable
 from .kit import Pauser, beginFlowingFrom, beginFlowingTo, NoPause, OncePause
-from ._components import _registryAdapting
+from ._components import _registryAdapting, _adapterUsing
 
 from twisted.python.failure import Failure
 
@@ -29,6 +29,11 @@ def suspended():
 
 
 
+_sequences = (list, tuple)
+_sequenceIterators = (type(iter([])), type(iter(())))
+
+
+
 def finished():
     """
     A token value meaning that L{SiphonPendingValues} has no more values in its
@@ -50,14 +55,57 @@ class SiphonPendingValues(object):
     A queue of pending values which can be suspended and resumed, for
     representing values pending delivery for a L{_Siphon}.
 
-    @ivar _deque: a deque containing iterators containing queued values.
+    Values are queued as the iterables returned by a tube, without wrapping
+    them: a L{list} or L{tuple} is indexed directly, and an iterator (such as
+    a generator) is advanced with C{next}.  The first iterable in the queue is
+    kept in C{_head} rather than in C{_deque}, so that in the common case of
+    a single iterable being queued and immediately delivered, queueing it
+    allocates nothing.
+
+    @ivar _head: the iterable currently being delivered from, or L{None}.
+
+    @ivar _index: if C{_head} is a L{list} or L{tuple}, the index of the next
+        value to deliver from it.
+    @type _index: L{int}
+
+    @ivar _peeked: a value which was produced by an iterator just as this
+        L{SiphonPendingValues} was suspended, and so will be delivered before
+        any others; or C{whatever}, if there is no such value.
+
+    @ivar _deque: a deque containing the rest of the queued iterables, or
+        L{None} if no more than one has ever been queued at once.
 
     @ivar _suspended: Is this L{SiphonPendingValues} currently suspended?
+
+    @ivar _sizeOf: a 1-argument callable returning the size of a value, or
+        L{None} to count each value as 1.
+
+    @ivar occupancy: the total size of the values in this queue which have
+        already been produced, i.e. those from L{list}s or L{tuple}s, as
+        measured by C{_sizeOf}.  Values which a generator has not yet yielded
+        do not occupy any space.
+    @type occupancy: L{int}
+
+    @ivar lazy: the number of iterators in this queue which are not over a
+        L{list} or L{tuple}, and so may produce any number of further values.
+    @type lazy: L{int}
     """
 
-    def __init__(self):
-        self._deque = deque()
+    __slots__ = ("_head", "_index", "_peeked", "_deque", "_suspended",
+                 "_sizeOf", "occupancy", "lazy")
+
+    def __init__(self, sizeOf=None):
+        """
+        @param sizeOf: see L{SiphonPendingValues._sizeOf}
+        """
+        self._head = None
+        self._index = 0
+        self._peeked = whatever
+        self._deque = None
         self._suspended = False
+        self._sizeOf = sizeOf
+        self.occupancy = 0
+        self.lazy = 0
 
 
     def suspend(self):
@@ -74,55 +122,166 @@ class SiphonPendingValues(object):
         self._suspended = False
 
 
-    def prepend(self, iterator):
+    def _sizeOfAll(self, values):
+        """
+        Compute the size of some values.
+
+        @param values: a L{list} or L{tuple} of values.
+
+        @return: the sum of the sizes of C{values}.
         """
-        Add the given iterator to the beginning of the queue.
+        sizeOf = self._sizeOf
+        if sizeOf is None:
+            return len(values)
+        return sum([sizeOf(value) for value in values if value is not skip])
 
-        @param iterator: an iterator of values to deliver via popPendingValue.
+
+    def _sizeOfOne(self, value):
         """
-        self._deque.appendleft(iterator)
+        Compute the size of a value.
 
+        @param value: a value.
 
-    def append(self, iterator):
+        @return: the size of C{value}.
         """
-        Add the given iterator to the end of the queue.
+        sizeOf = self._sizeOf
+        if sizeOf is None:
+            return 1
+        if value is skip:
+            return 0
+        return sizeOf(value)
+
 
-        @param iterator: an iterator of values to deliver via popPendingValue.
+    def append(self, values):
         """
-        self._deque.append(iterator)
+        Add the given values to the end of the queue.
+
+        @param values: an iterable of values to deliver via popPendingValue.
+        """
+        kind = type(values)
+        if kind in _sequences:
+            self.occupancy += self._sizeOfAll(values)
+        elif kind in _sequenceIterators:
+            values = list(values)
+            self.occupancy += self._sizeOfAll(values)
+        else:
+            values = iter(values)
+            self.lazy += 1
+        if self._head is None and not self._deque:
+            self._head = values
+            self._index = 0
+        elif self._deque is None:
+            self._deque = deque([values])
+        else:
+            self._deque.append(values)
 
 
     def clear(self):
         """
         Clear the entire queue.
         """
-        self._deque.clear()
+        self._head = None
+        self._peeked = whatever
+        self._deque = None
+        self.occupancy = 0
+        self.lazy = 0
+
+
+    def _advance(self):
+        """
+        Move on from the exhausted C{_head} to the next queued iterable.
+
+        @return: the new C{_head}, or L{None} if the queue is empty.
+        """
+        if type(self._head) not in _sequences:
+            self.lazy -= 1
+        if self._deque:
+            head = self._head = self._deque.popleft()
+            self._index = 0
+        else:
+            head = self._head = None
+        return head
+
+
+    def popPendingBatch(self):
+        """
+        Get all the values from the L{list}s and L{tuple}s at the beginning
+        of the queue.
+
+        Since producing the rest of the values from such a sequence can't have
+        any side effects, they may all be delivered at once; unlike
+        generators, which might (for example) pause their own siphon after
+        yielding a value.
+
+        @return: a L{list} of values, omitting L{skip}; L{None} if the first
+            iterable in the queue is not a L{list} or L{tuple}, or the queue
+            is empty; or L{suspended} if this L{SiphonPendingValues} is
+            suspended.
+        """
+        if self._suspended:
+            return suspended
+        head = self._head
+        if self._peeked is not whatever or type(head) not in _sequences:
+            return None
+        index = self._index
+        deque = self._deque
+        if type(head) is list and not index and (
+                not deque or type(deque[0]) not in _sequences):
+            batch = head
+        else:
+            batch = list(head[index:])
+            while deque and type(deque[0]) in _sequences:
+                batch.extend(deque.popleft())
+        if deque:
+            self._head = deque.popleft()
+            self._index = 0
+        else:
+            self._head = None
+        self.occupancy -= self._sizeOfAll(batch)
+        for value in batch:
+            if value is skip:
+                return [value for value in batch if value is not skip]
+        return batch
 
 
     def popPendingValue(self, evenIfSuspended=False):
         """
-        Get the next value in the leftmost iterator in the deque.
+        Get the next value in the queue.
 
         @param evenIfSuspended: return the next pending value regardless of
             whether this L{SiphonPendingValues} is suspended or not.
         @type evenIfSuspended: L{bool}
 
-        @return: The next value yielded by the first iterator in the queue,
+        @return: The next value produced by the first iterable in the queue,
             L{suspended} if this L{SiphonPendingValues} is suspended and
             C{evenIfSuspended} was not passed, or L{finished} if the queue is
             empty.
         """
         if self._suspended and not evenIfSuspended:
             return suspended
-        while self._deque:
-            result = next(self._deque[0], whatever)
-            if self._suspended and not evenIfSuspended:
-                self.prepend(iter([result]))
-                return suspended
-            if result is whatever:
-                self._deque.popleft()
+        result = self._peeked
+        if result is not whatever:
+            self._peeked = whatever
+            self.occupancy -= self._sizeOfOne(result)
+            return result
+        head = self._head
+        while head is not None:
+            if type(head) in _sequences:
+                index = self._index
+                if index < len(head):
+                    self._index = index + 1
+                    result = head[index]
+                    self.occupancy -= self._sizeOfOne(result)
+                    return result
             else:
-                return result
+                result = next(head, whatever)
+                if result is not whatever:
+                    if self._suspended and not evenIfSuspended:
+                        self._peeked = result
+                        self.occupancy += self._sizeOfOne(result)
+                        return suspended
+                    return result
+            head = self._advance()
         return finished
 
 
@@ -131,6 +290,8 @@ class _SiphonPiece(object):
     """
     Shared functionality between L{_SiphonFount} and L{_SiphonDrain}
     """
+    __slots__ = ("_siphon",)
+
     def __init__(self, siphon):
         self._siphon = siphon
 
@@ -159,31 +320,44 @@ class _SiphonFount(_SiphonPiece):
     @ivar drain: the implementation of the L{IFount.drain} attribute.  The
         L{IDrain} to which this L{_Siphon}'s L{IFount} implementation is
         flowing.
+
+    @ivar _receiveBatch: C{drain.receiveBatch} if C{drain} provides
+        L{IBatchDrain}, otherwise L{None}.  Output from an L{IDivertable} is
+        never batched, since diverting it must be able to reassemble all of
+        the output which has not yet been delivered.
     """
-    drain = None
+    __slots__ = ("drain", "_receiveBatch", "_upstreamPause", "_pauser")
 
     def __init__(self, siphon):
         super(_SiphonFount, self).__init__(siphon)
+        self.drain = None
+        self._receiveBatch = None
+        self._upstreamPause = None
+        self._pauser = Pauser(self._actuallyPause, self._actuallyResume)
 
-        def _actuallyPause():
-            fount = self._siphon._tdrain.fount
-            self._siphon._pending.suspend()
-            if fount is not None:
-                pbpc = fount.pauseFlow()
-            else:
-                pbpc = NoPause()
-            self._siphon._pauseBecausePauseCalled = pbpc
 
-        def _actuallyResume():
-            fp = self._siphon._pauseBecausePauseCalled
-            self._siphon._pauseBecausePauseCalled = None
+    def _actuallyPause(self):
+        """
+        Suspend delivery, and pause the upstream fount unless the siphon
+        buffers its output up to a high water mark.
+        """
+        self._siphon._pending.suspend()
+        if self._siphon._highWater is None:
+            self._upstreamPause = self._siphon._upstreamPauser.pause()
 
-            self._siphon._pending.resume()
-            self._siphon._unbufferIterator()
 
-            fp.unpause()
+    def _actuallyResume(self):
+        """
+        Resume delivery, then resume the upstream fount if it was paused.
+        """
+        up = self._upstreamPause
+        self._upstreamPause = None
+
+        self._siphon._pending.resume()
+        self._siphon._unbufferIterator()
 
-        self._pauser = Pauser(_actuallyPause, _actuallyResume)
+        if up is not None:
+            up.unpause()
 
 
     def __repr__(self):
@@ -212,6 +386,11 @@ class _SiphonFount(_SiphonPiece):
         @return: an L{IFount} that emits items of the output-type of this
             siphon's tube.
         """
+        if (IBatchDrain.providedBy(drain) and
+                not IDivertable.providedBy(self._tube)):
+            self._receiveBatch = drain.receiveBatch
+        else:
+            self._receiveBatch = None
         result = beginFlowingTo(self, drain)
         self._siphon._pauseBecauseNoDrain.maybeUnpause()
         self._siphon._unbufferIterator()
@@ -241,12 +420,17 @@ class _SiphonFount(_SiphonPiece):
 
 
 
-@implementer(IDrain)
+@implementer(IBatchDrain)
 class _SiphonDrain(_SiphonPiece):
     """
     Implementation of L{IDrain} for L{_Siphon}.
     """
-    fount = None
+    __slots__ = ("fount",)
+
+    def __init__(self, siphon):
+        super(_SiphonDrain, self).__init__(siphon)
+        self.fount = None
+
 
     def __repr__(self):
         """
@@ -255,6 +439,17 @@ class _SiphonDrain(_SiphonPiece):
         return '<Drain for {0}>'.format(self._siphon._tube)
 
 
+    @property
+    def occupancy(self):
+        """
+        The total size of the output which has been buffered while waiting to
+        be delivered.
+
+        @return: see L{SiphonPendingValues.occupancy}
+        """
+        return self._siphon._pending.occupancy
+
+
     @property
     def inputType(self):
         """
@@ -304,9 +499,54 @@ class _SiphonDrain(_SiphonPiece):
 
         @param item: an item to deliver to the tube.
         """
-        def tubeReceivedItem():
-            return self._tube.received(item)
-        self._siphon._deliverFrom(tubeReceivedItem)
+        siphon = self._siphon
+        if siphon._unreceived is not None:
+            siphon._unreceived.append(item)
+            return
+        try:
+            iterableOrNot = siphon._tube.received(item)
+        except:
+            siphon._deliveryFailed(siphon._tube.received)
+            return
+        if iterableOrNot is not None:
+            siphon._pending.append(iterableOrNot)
+            siphon._deliverPending()
+
+
+    def receiveBatch(self, items):
+        """
+        Several items were received.  Pass each of them on to the tube for
+        processing in turn, delivering the results of each before passing on
+        the next, exactly as L{_SiphonDrain.receive} would.
+
+        Just as the upstream fount would stop delivering single items, no more
+        items are processed once the flow has been stopped, and once the
+        upstream fount has been paused, the rest are kept until it resumes.
+
+        @param items: see L{IBatchDrain.receiveBatch}
+        """
+        siphon = self._siphon
+        if siphon._unreceived is not None:
+            siphon._unreceived.extend(items)
+            return
+        received = siphon._tube.received
+        items = iter(items)
+        for item in items:
+            if not siphon._canStillProcessInput:
+                return
+            try:
+                iterableOrNot = received(item)
+            except:
+                siphon._deliveryFailed(received)
+                return
+            if iterableOrNot is not None:
+                siphon._pending.append(iterableOrNot)
+                siphon._deliverPending()
+            if siphon._pauseBecausePauseCalled is not None:
+                rest = deque(items)
+                if rest:
+                    siphon._unreceived = rest
+                return
 
 
     def flowStopped(self, reason):
@@ -316,8 +556,24 @@ class _SiphonDrain(_SiphonPiece):
         yield the result of it's C{_tube}'s C{stopped} method, then communicate
         the end of flow to its downstream drain.
 
+        If items from a batch are still waiting to be processed, this happens
+        once they have been.
+
+        @param reason: the reason why our fount stopped the flow.
+        """
+        if self._siphon._unreceived is not None:
+            self._siphon._stopWhenReceived = lambda: self.flowStopped(reason)
+            return
+        self._flowStopped(reason)
+
+
+    def _flowStopped(self, reason):
+        """
+        Finish the flow; see L{_SiphonDrain.flowStopped}.
+
         @param reason: the reason why our fount stopped the flow.
         """
+
         self._siphon._noMore(input=True, output=False)
         self._siphon._flowStoppingReason = reason
         def tubeStopped():
@@ -352,12 +608,48 @@ class _Siphon(object):
     @ivar _everStarted: Has this L{_Siphon} ever called C{started} on its
         L{ITube}?
     @type _everStarted: L{bool}
+
+    @ivar _upstreamPauser: a L{Pauser} which pauses the upstream fount,
+        either because this siphon's own fount is paused or because too many
+        values are pending delivery.
+
+    @ivar _highWater: if L{None}, the upstream fount is paused whenever this
+        siphon's own fount is.  Otherwise, it is paused only when the
+        occupancy of the pending values exceeds this size, or when a pending
+        generator might produce any number of further values.
+    @type _highWater: L{int} or L{None}
+
+    @ivar _lowWater: once the upstream fount has been paused because of
+        C{_highWater}, it is resumed when the occupancy of the pending values
+        is no more than this size.
+    @type _lowWater: L{int} or L{None}
+
+    @ivar _unreceived: the rest of a batch of input which arrived after the
+        upstream fount was paused, to be processed when it resumes, or
+        L{None}.
+    @type _unreceived: L{deque} or L{None}
+
+    @ivar _stopWhenReceived: a 0-argument callable which finishes the flow,
+        if it stopped while C{_unreceived} was waiting, otherwise L{None}.
     """
 
-    def __init__(self, tube):
+    __slots__ = ("_canStillProcessInput", "_pauseBecausePauseCalled", "_tube",
+                 "_everStarted", "_unbuffering", "_flowStoppingReason",
+                 "_highWater", "_lowWater", "_upstreamPauser",
+                 "_pauseBecauseFull", "_tfount", "_pauseBecauseNoDrain",
+                 "_tdrain", "_pending", "_unreceived", "_stopWhenReceived")
+
+    def __init__(self, tube, highWater=None, lowWater=None, sizeOf=None):
         """
         Initialize this L{_Siphon} with the given L{ITube} to control its
         behavior.
+
+        @param highWater: see L{_Siphon._highWater}
+
+        @param lowWater: see L{_Siphon._lowWater}; by default, half of
+            C{highWater}.
+
+        @param sizeOf: see L{SiphonPendingValues._sizeOf}
         """
         self._canStillProcessInput = True
         self._pauseBecausePauseCalled = None
@@ -365,12 +657,67 @@ class _Siphon(object):
         self._everStarted = False
         self._unbuffering = False
         self._flowStoppingReason = None
-
+        if lowWater is None and highWater is not None:
+            lowWater = highWater // 2
+        self._highWater = highWater
+        self._lowWater = lowWater
+
+        self._upstreamPauser = Pauser(self._pauseUpstream,
+                                      self._resumeUpstream)
+        if highWater is None:
+            self._pauseBecauseFull = None
+        else:
+            self._pauseBecauseFull = OncePause(self._upstreamPauser)
         self._tfount = _SiphonFount(self)
         self._pauseBecauseNoDrain = OncePause(self._tfount._pauser)
         self._tdrain = _SiphonDrain(self)
         self._tube = tube
-        self._pending = SiphonPendingValues()
+        self._pending = SiphonPendingValues(sizeOf)
+        self._unreceived = None
+        self._stopWhenReceived = None
+
+
+    def _pauseUpstream(self):
+        """
+        Pause the upstream fount, or remember to do that when a fount is
+        attached, if it isn't yet.
+        """
+        fount = self._tdrain.fount
+        if fount is not None:
+            pbpc = fount.pauseFlow()
+        else:
+            pbpc = NoPause()
+        self._pauseBecausePauseCalled = pbpc
+
+
+    def _resumeUpstream(self):
+        """
+        Process the rest of any batch which arrived after the upstream fount
+        was paused, then resume the upstream fount.
+        """
+        fp = self._pauseBecausePauseCalled
+        self._pauseBecausePauseCalled = None
+        unreceived, self._unreceived = self._unreceived, None
+        if unreceived is not None:
+            self._tdrain.receiveBatch(unreceived)
+            stop = self._stopWhenReceived
+            if self._unreceived is None and stop is not None:
+                self._stopWhenReceived = None
+                stop()
+        fp.unpause()
+
+
+    def _checkWatermarks(self):
+        """
+        Pause the upstream fount if the values pending delivery occupy more
+        than the high water mark or include a generator, or resume it if they
+        have drained to the low water mark.
+        """
+        occupancy = self._pending.occupancy
+        if occupancy > self._highWater or self._pending.lazy:
+            self._pauseBecauseFull.pauseOnce()
+        elif occupancy <= self._lowWater:
+            self._pauseBecauseFull.maybeUnpause()
 
 
     def _noMore(self, input, output):
@@ -383,6 +730,8 @@ class _Siphon(object):
         """
         if input:
             self._canStillProcessInput = False
+            self._unreceived = None
+            self._stopWhenReceived = None
         if output:
             self._pending.clear()
 
@@ -404,17 +753,37 @@ class _Siphon(object):
         try:
             iterableOrNot = deliverySource()
         except:
-            f = Failure()
-            log.err(f, "Exception raised when delivering from {0!r}"
-                    .format(deliverySource))
-            self._tdrain.fount.stopFlow()
-            downstream = self._tfount.drain
-            if downstream is not None:
-                downstream.flowStopped(f)
+            self._deliveryFailed(deliverySource)
             return
         if iterableOrNot is None:
             return
-        self._pending.append(iter(iterableOrNot))
+        self._pending.append(iterableOrNot)
+        self._deliverPending()
+
+
+    def _deliveryFailed(self, deliverySource):
+        """
+        The tube raised an exception while producing values to deliver; log
+        it, stop the upstream fount, and stop the downstream drain's flow.
+
+        This must be called while the exception is being handled.
+
+        @param deliverySource: the callable which raised, for the log message.
+        """
+        f = Failure()
+        log.err(f, "Exception raised when delivering from {0!r}"
+                .format(deliverySource))
+        self._tdrain.fount.stopFlow()
+        downstream = self._tfount.drain
+        if downstream is not None:
+            downstream.flowStopped(f)
+
+
+    def _deliverPending(self):
+        """
+        Some values have been added to C{self._pending}; deliver them if we
+        can, or pause until we have a drain to deliver them to.
+        """
         if self._tfount.drain is None:
             self._pauseBecauseNoDrain.pauseOnce()
         self._unbufferIterator()
@@ -424,6 +793,10 @@ class _Siphon(object):
         """
         Un-buffer some items buffered in C{self._pending} and actually deliver
         them, as long as we're not paused.
+
+        If our drain provides L{IBatchDrain}, values returned from the tube in
+        a L{list} or L{tuple} are delivered to it in batches; otherwise, values
+        are delivered one at a time.
         """
         if self._unbuffering:
             return
@@ -431,6 +804,15 @@ class _Siphon(object):
         self._unbuffering = True
 
         while True:
+            receiveBatch = self._tfount._receiveBatch
+            if receiveBatch is not None:
+                batch = self._pending.popPendingBatch()
+                if batch is suspended:
+                    break
+                if batch is not None:
+                    if batch:
+                        receiveBatch(batch)
+                    continue
             value = self._pending.popPendingValue()
             if value is suspended:
                 break
@@ -444,6 +826,8 @@ class _Siphon(object):
                 self._tfount.drain.receive(value)
 
         self._unbuffering = False
+        if self._highWater is not None:
+            self._checkWatermarks()
 
 
     def _endOfLine(self, flowStoppingReason):
@@ -493,3 +877,5 @@ def _tube2drain(tube):
 _tubeRegistry = _registryAdapting(
     (ITube, IDrain, _tube2drain),
 )
+
+_tubeToDrain = _adapterUsing(_tubeRegistry, IDrain)
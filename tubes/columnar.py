@@ -0,0 +1,247 @@
+# -*- test-case-name: tubes.test.test_columnar -*-
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Gather streams of records into columnar NumPy batches, so that downstream
+stages can process many records at once with vectorized operations.
+
+This module requires NumPy, which is installed along with Tubes by the
+C{numpy} extra: C{pip install Tubes[numpy]}.
+
+@see: L{recordsToColumns}
+"""
+
+import numpy
+
+from .kit import _Stage
+
+__all__ = [
+    "recordsToColumns",
+]
+
+
+
+class _ColumnBatcher(_Stage):
+    """
+    A L{_ColumnBatcher} fills preallocated NumPy arrays, one for each column,
+    with the fields of the records it receives, and emits them as a batch
+    when they are full, or when a batch has been filling for long enough.
+    The upstream fount is paused while any batch is waiting in C{_ready} to
+    be emitted.
+
+    @ivar drain: the drain which receives records.
+    @type drain: L{_StageBatchDrain}
+
+    @ivar fount: the fount which emits batches.
+    @type fount: L{_StageFount}
+
+    @ivar _columns: the name of each column.
+    @type _columns: L{tuple} of L{str}
+
+    @ivar _dtypes: the NumPy data type of each column.
+    @type _dtypes: L{list}
+
+    @ivar _rows: the number of rows in a full batch.
+    @type _rows: L{int}
+
+    @ivar _maxDelay: the number of seconds after a batch's first record
+        arrives that it is emitted, even if it is not full, or L{None}.
+
+    @ivar _reactor: the reactor to measure delays with.
+
+    @ivar _arrays: the arrays for the batch being filled.
+    @type _arrays: L{list}
+
+    @ivar _filled: the number of rows filled in C{_arrays}.
+    @type _filled: L{int}
+
+    @ivar _call: the delayed call which will emit the batch being filled, or
+        L{None}.
+    """
+
+    def __init__(self, columns, rows, maxDelay, dtypes, reactor):
+        """
+        @param columns: see L{_ColumnBatcher._columns}
+
+        @param rows: see L{_ColumnBatcher._rows}
+
+        @param maxDelay: see L{_ColumnBatcher._maxDelay}
+
+        @param dtypes: a mapping of column names to NumPy data types.
+
+        @param reactor: see L{_ColumnBatcher._reactor}
+        """
+        if rows < 1:
+            raise ValueError("rows must be at least 1, not {0!r}"
+                             .format(rows))
+        super(_ColumnBatcher, self).__init__(batches=True)
+        self._columns = tuple(columns)
+        self._dtypes = [numpy.dtype(dtypes.get(column, numpy.float64))
+                        for column in self._columns]
+        self._rows = rows
+        self._maxDelay = maxDelay
+        self._reactor = reactor
+        self._arrays = self._allocate()
+        self._filled = 0
+        self._call = None
+
+
+    def _allocate(self):
+        """
+        Allocate the arrays for a new batch.
+
+        @return: an empty array for each column.
+        @rtype: L{list}
+        """
+        return [numpy.empty(self._rows, dtype) for dtype in self._dtypes]
+
+
+    def _receive(self, record):
+        """
+        Add a record to the batch being filled.
+
+        @param record: a L{tuple} of values in the order of the columns, or a
+            L{dict} mapping column names to values.
+        """
+        self._receiveBatch([record])
+
+
+    def _receiveBatch(self, records):
+        """
+        Fill the batch with some records, emitting it each time it is full.
+
+        @param records: a sequence of L{tuple}s, or of L{dict}s.
+
+        @raise TypeError: if C{records} mixes L{dict}s with other records; no
+            records are added.
+        """
+        if self._done:
+            return
+        records = list(records)
+        if not records:
+            return
+        byName = isinstance(records[0], dict)
+        for record in records:
+            if isinstance(record, dict) is not byName:
+                raise TypeError(
+                    "records received together must all be dicts or all be "
+                    "tuples, not {0!r}".format(records)
+                )
+        columns = self._columns
+        start = 0
+        while start < len(records):
+            if self._filled == 0 and self._maxDelay is not None:
+                self._call = self._reactor.callLater(self._maxDelay,
+                                                     self._expired)
+            space = self._rows - self._filled
+            chunk = records[start:start + space]
+            filled = self._filled
+            end = filled + len(chunk)
+            if byName:
+                for array, column in zip(self._arrays, columns):
+                    array[filled:end] = [record[column] for record in chunk]
+            else:
+                for index, array in enumerate(self._arrays):
+                    array[filled:end] = [record[index] for record in chunk]
+            self._filled = end
+            start += len(chunk)
+            if end == self._rows:
+                self._finishBatch()
+        self._deliver()
+
+
+    def _expired(self):
+        """
+        The batch being filled has been filling for long enough; emit it.
+        """
+        self._call = None
+        self._finishBatch()
+        self._deliver()
+
+
+    def _finishBatch(self):
+        """
+        Move the batch being filled, if it has any rows, to the batches which
+        are ready to emit, and start a new one.
+        """
+        if self._call is not None:
+            self._call.cancel()
+            self._call = None
+        if not self._filled:
+            return
+        filled = self._filled
+        batch = {column: (array if filled == self._rows else array[:filled])
+                 for column, array in zip(self._columns, self._arrays)}
+        self._ready.append(batch)
+        self._arrays = self._allocate()
+        self._filled = 0
+
+
+    def _flowStopped(self, reason):
+        """
+        The flow has stopped; emit the batch being filled, then stop the
+        downstream flow.
+
+        @param reason: see L{tubes.itube.IDrain.flowStopped}
+        """
+        self._finishBatch()
+        super(_ColumnBatcher, self)._flowStopped(reason)
+
+
+    def _discard(self):
+        """
+        Discard the batch being filled and any batches waiting to be emitted.
+        """
+        self._done = True
+        if self._call is not None:
+            self._call.cancel()
+            self._call = None
+        self._filled = 0
+        self._ready.clear()
+
+
+
+def recordsToColumns(columns, rows=1024, maxDelay=None, dtypes=None,
+                     reactor=None):
+    """
+    Gather records into columnar batches.
+
+    Each record is a L{tuple} of values in the order of C{columns}, or a
+    L{dict} mapping the names in C{columns} to values.  The values are copied
+    into a NumPy array for each column, preallocated to hold C{rows} values.
+    When the arrays are full, they are emitted as a batch: a L{dict} mapping
+    each column name to its array.  If C{maxDelay} is given, a batch is also
+    emitted that many seconds after its first record arrived, even if it is
+    not full; then, its arrays only have as many values as it has records.
+    When the flow stops, any records gathered so far are emitted as a final
+    batch.
+
+    Backpressure is applied a batch at a time: while the downstream drain is
+    paused, records are still accepted until the batch being filled is full,
+    and then the upstream fount is paused until the batch has been emitted.
+
+    @param columns: the name of each column.
+    @type columns: iterable of L{str}
+
+    @param rows: the number of rows in a full batch.
+    @type rows: L{int}
+
+    @param maxDelay: the longest time, in seconds, to wait for a batch to fill,
+        or L{None} to always wait.
+    @type maxDelay: L{float} or L{None}
+
+    @param dtypes: the NumPy data type of some of the columns, by name; by
+        default, a column's values are 64-bit floats.
+    @type dtypes: L{dict}
+
+    @param reactor: if C{maxDelay} is given, the reactor to measure it with;
+        by default, the global reactor.
+
+    @return: a drain for records, whose fount emits batches.
+    @rtype: L{IDrain}
+    """
+    if reactor is None and maxDelay is not None:
+        from twisted.internet import reactor
+    return _ColumnBatcher(columns, rows, maxDelay, dtypes or {},
+                          reactor).drain
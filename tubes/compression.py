@@ -0,0 +1,364 @@
+# -*- test-case-name: tubes.test.test_compression -*-
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Tubes that compress and decompress streams of bytes.
+
+@see: L{bytesToCompressed}, L{compressedToBytes}
+"""
+
+import bz2
+import lzma
+import zlib
+
+from .itube import ISegment
+from .tube import tube
+from .framing import _Coalescer
+from .kit import _DrainFactory
+from ._siphon import _tube2drain
+
+__all__ = [
+    "DecompressionLimitExceeded",
+    "bytesToCompressed",
+    "compressedToBytes",
+]
+
+_MAX_DECOMPRESSED_SEGMENT = 2 ** 24
+_MAX_COALESCED_LENGTH = 65536
+
+
+
+class DecompressionLimitExceeded(Exception):
+    """
+    Decompressing a segment produced more output than the decompressor's
+    limit, as a maliciously compressed stream (a "zip bomb") would.
+
+    @ivar maxOutput: the decompressor's limit.
+    @type maxOutput: L{int}
+    """
+
+    def __init__(self, maxOutput):
+        """
+        @param maxOutput: see L{DecompressionLimitExceeded.maxOutput}
+        """
+        super(DecompressionLimitExceeded, self).__init__(
+            "a segment decompressed to more than {0} bytes".format(maxOutput)
+        )
+        self.maxOutput = maxOutput
+
+
+
+class _Compressor(object):
+    """
+    A L{_Compressor} compresses a stream in one of the supported formats, and
+    can flush what it has compressed so far, so that it can be decompressed
+    without waiting for the rest of the stream.
+
+    @ivar _format: the name of the format.
+    @type _format: L{str}
+
+    @ivar _level: the compression level, or L{None} for the default.
+
+    @ivar _compressor: the compressor for the current stream.
+    """
+
+    def __init__(self, format, level):
+        """
+        @param format: see L{_Compressor._format}
+
+        @param level: see L{_Compressor._level}
+        """
+        if format not in _compressors:
+            raise ValueError("unknown compression format {0!r}"
+                             .format(format))
+        self._format = format
+        self._level = level
+        self._compressor = _compressors[format](level)
+
+
+    def compress(self, data):
+        """
+        Compress some data.
+
+        @param data: the data.
+        @type data: L{bytes}
+
+        @return: as much compressed data as is ready.
+        @rtype: L{bytes}
+        """
+        return self._compressor.compress(data)
+
+
+    def flush(self):
+        """
+        Emit all of the data compressed so far.
+
+        zlib and gzip streams are flushed in place.  lzma and bz2 cannot
+        flush a stream without ending it, so their stream is ended and a new
+        one started; decompressors for both formats accept concatenated
+        streams.
+
+        @return: the rest of the data compressed so far.
+        @rtype: L{bytes}
+        """
+        if self._format in ("zlib", "gzip"):
+            return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        ended = self._compressor.flush()
+        self._compressor = _compressors[self._format](self._level)
+        return ended
+
+
+    def finish(self):
+        """
+        End the stream.
+
+        @return: the rest of the compressed stream.
+        @rtype: L{bytes}
+        """
+        return self._compressor.flush()
+
+
+
+def _zlibCompressor(wbits):
+    """
+    Create a factory for zlib compressors with the given window bits.
+
+    @param wbits: the C{wbits} argument to L{zlib.compressobj}.
+
+    @return: a 1-argument callable taking a compression level or L{None}.
+    """
+    def compressor(level):
+        return zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION
+                                if level is None else level,
+                                zlib.DEFLATED, wbits)
+    return compressor
+
+
+
+_compressors = {
+    "zlib": _zlibCompressor(zlib.MAX_WBITS),
+    "gzip": _zlibCompressor(16 + zlib.MAX_WBITS),
+    "lzma": lambda level: lzma.LZMACompressor(preset=level),
+    "bz2": lambda level: bz2.BZ2Compressor(9 if level is None else level),
+}
+
+_decompressors = {
+    "zlib": lambda: zlib.decompressobj(zlib.MAX_WBITS),
+    "gzip": lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+    "lzma": lzma.LZMADecompressor,
+    "bz2": bz2.BZ2Decompressor,
+}
+
+
+
+@tube
+class _Compress(object):
+    """
+    Compress segments, flushing the compressed stream after a given number
+    of bytes.
+
+    @ivar _compressor: the compressor.
+    @type _compressor: L{_Compressor}
+
+    @ivar _flushBytes: the number of bytes to compress between flushes, or
+        L{None} to never flush until the flow stops.
+
+    @ivar _unflushed: the number of bytes compressed since the last flush.
+    @type _unflushed: L{int}
+    """
+
+    inputType = ISegment
+    outputType = ISegment
+
+    def __init__(self, compressor, flushBytes):
+        """
+        @param compressor: see L{_Compress._compressor}
+
+        @param flushBytes: see L{_Compress._flushBytes}
+        """
+        self._compressor = compressor
+        self._flushBytes = flushBytes
+        self._unflushed = 0
+
+
+    def received(self, segment):
+        """
+        Compress a segment, and flush if enough bytes have been compressed.
+
+        @param segment: a segment.
+        @type segment: L{bytes}
+
+        @return: the compressed data which is ready, if any.
+        @rtype: L{list} of L{bytes}
+        """
+        output = self._compressor.compress(segment)
+        self._unflushed += len(segment)
+        if self._flushBytes is not None and (self._unflushed >=
+                                             self._flushBytes):
+            output += self._compressor.flush()
+            self._unflushed = 0
+        return [output] if output else []
+
+
+    def stopped(self, reason):
+        """
+        End the compressed stream.
+
+        @param reason: the reason the flow stopped.
+
+        @return: the end of the compressed stream.
+        @rtype: L{list} of L{bytes}
+        """
+        return [self._compressor.finish()]
+
+
+
+@tube
+class _Decompress(object):
+    """
+    Decompress segments, limiting how much output each one may produce.
+
+    @ivar _format: the name of the format.
+    @type _format: L{str}
+
+    @ivar _maxOutput: the largest number of bytes one segment may decompress
+        to.
+    @type _maxOutput: L{int}
+
+    @ivar _decompressor: the decompressor for the current stream.
+    """
+
+    inputType = ISegment
+    outputType = ISegment
+
+    def __init__(self, format, maxOutput):
+        """
+        @param format: see L{_Decompress._format}
+
+        @param maxOutput: see L{_Decompress._maxOutput}
+        """
+        if format not in _decompressors:
+            raise ValueError("unknown compression format {0!r}"
+                             .format(format))
+        self._format = format
+        self._maxOutput = maxOutput
+        self._decompressor = _decompressors[format]()
+
+
+    def received(self, segment):
+        """
+        Decompress a segment.  Once a compressed stream ends, any data after
+        it is decompressed as a new stream.
+
+        @param segment: a segment of compressed data.
+        @type segment: L{bytes}
+
+        @return: the decompressed data, if any.
+        @rtype: L{list} of L{bytes}
+
+        @raise DecompressionLimitExceeded: if C{segment} decompresses to more
+            than C{maxOutput} bytes.
+        """
+        remaining = self._maxOutput
+        output = []
+        while segment:
+            decompressor = self._decompressor
+            data = decompressor.decompress(segment, remaining + 1)
+            remaining -= len(data)
+            if remaining < 0:
+                raise DecompressionLimitExceeded(self._maxOutput)
+            output.append(data)
+            # Having stopped short of its limit, the decompressor has
+            # consumed all of its input, unless its stream ended.
+            segment = b""
+            if decompressor.eof:
+                segment = decompressor.unused_data
+                self._decompressor = _decompressors[self._format]()
+        output = b"".join(output)
+        return [output] if output else []
+
+
+
+def bytesToCompressed(format="zlib", level=None, flush="segment",
+                      reactor=None):
+    """
+    Create a stage which compresses a stream of segments.
+
+    How often the compressed stream is flushed, so that everything received
+    so far can be decompressed, is decided by C{flush}:
+
+        - C{"segment"}: after every segment, for the lowest latency;
+
+        - an L{int}: after at least that many bytes have been received since
+          the last flush;
+
+        - C{"idle"}: when the input goes idle, which is at the end of each
+          turn of the reactor, or when the downstream drain resumes after
+          being paused; every segment compressed in the same turn is emitted
+          as one;
+
+        - L{None}: only when the flow stops, for the best compression.
+
+    zlib and gzip streams are flushed with C{Z_SYNC_FLUSH}; lzma and bz2
+    streams cannot be flushed, so they are ended and a new stream started,
+    which their decompressors read as one.
+
+    @param format: C{"zlib"}, C{"gzip"}, C{"lzma"} or C{"bz2"}.
+    @type format: L{str}
+
+    @param level: the compression level (the preset, for lzma), or L{None}
+        for the format's default.
+    @type level: L{int} or L{None}
+
+    @param flush: the flush policy, as above.
+
+    @param reactor: if C{flush} is C{"idle"}, the reactor whose turns to
+        follow; by default, the global reactor.
+
+    @return: a stage which, like a tube, may be passed to
+        L{tubes.tube.series} or used as a stage of a
+        L{tubes.tube.PipelineTemplate} any number of times, with a new
+        compressed stream each time.
+    """
+    if format not in _compressors:
+        raise ValueError("unknown compression format {0!r}".format(format))
+    if flush == "idle":
+        if reactor is None:
+            from twisted.internet import reactor
+        def newDrain():
+            compressor = _Compressor(format, level)
+            return _Coalescer(compressor.compress, _MAX_COALESCED_LENGTH,
+                              reactor, suffix=compressor.flush,
+                              final=compressor.finish,
+                              inputType=ISegment).drain
+        return _DrainFactory(newDrain)
+    if flush == "segment":
+        flush = 1
+    elif flush is not None and not isinstance(flush, int):
+        raise ValueError("unknown flush policy {0!r}".format(flush))
+    return _DrainFactory(
+        lambda: _tube2drain(_Compress(_Compressor(format, level), flush))
+    )
+
+
+
+def compressedToBytes(format="zlib", maxOutput=_MAX_DECOMPRESSED_SEGMENT):
+    """
+    Create a tube which decompresses a stream of segments.
+
+    Each segment may decompress to at most C{maxOutput} bytes; if one would
+    decompress to more, the flow fails with L{DecompressionLimitExceeded}, so
+    that a small, maliciously compressed segment can't exhaust memory.
+
+    @param format: C{"zlib"}, C{"gzip"}, C{"lzma"} or C{"bz2"}.
+    @type format: L{str}
+
+    @param maxOutput: the largest number of bytes one segment may
+        decompress to.
+    @type maxOutput: L{int}
+
+    @return: a tube.
+    @rtype: L{ITube}
+    """
+    return _Decompress(format, maxOutput)
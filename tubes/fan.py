@@ -7,32 +7,61 @@ Tools for turning L{founts <IFount>} and L{drains <IDrain>} into multiple
 founts and drains.
 """
 
-from itertools import count
+from collections import deque
+from itertools import count, islice
 
 from zope.interface import implementer
 
 from twisted.python.components import proxyForInterface
+from twisted.python.failure import Failure
 
 from .kit import Pauser, beginFlowingTo, beginFlowingFrom, OncePause
-from .itube import IDrain, IFount
+from .itube import IDrain, IFount, IBatchDrain
+from .tube import series
 
 
 @implementer(IDrain)
 class _InDrain(object):
     """
     The one of the drains associated with an fan.L{In}.
+
+    @ivar _presentPause: an L{IPause} from this drain's fount: while the
+        L{In}'s fount is paused, or, if the L{In} has buffers, while this
+        drain's buffer is full.
+
+    @ivar _weight: the number of items delivered from this drain's buffer in
+        each round, if the L{In} has buffers.
+    @type _weight: L{int}
+
+    @ivar _buffer: the items received from this drain's fount which have not
+        been delivered yet, if the L{In} has buffers.
+    @type _buffer: L{deque}
+
+    @ivar _scheduled: is this drain in its L{In}'s queue of drains with
+        buffered items?
+    @type _scheduled: L{bool}
+
+    @ivar _credit: the number of items left in this drain's turn, if
+        delivery paused during it, otherwise 0.
+    @type _credit: L{int}
     """
 
     inputType = None
 
     fount = None
 
-    def __init__(self, fanIn):
+    def __init__(self, fanIn, weight=1):
         """
         Create an L{_InDrain} with an L{In}.
+
+        @param weight: see L{_InDrain._weight}
         """
         self._in = fanIn
         self._presentPause = None
+        self._weight = weight
+        self._buffer = deque()
+        self._scheduled = False
+        self._credit = 0
 
 
     def flowingFrom(self, fount):
@@ -47,10 +76,14 @@ class _InDrain(object):
         if fount is self.fount:
             return
         beginFlowingFrom(self, fount)
-        if self._presentPause is not None:
+        wasPaused = self._presentPause is not None
+        if wasPaused:
             p, self._presentPause = self._presentPause, None
             p.unpause()
-        if self._in.fount._isPaused:
+        if self._in._bufferSize is not None:
+            if wasPaused and fount is not None:
+                self._presentPause = fount.pauseFlow()
+        elif self._in.fount._isPaused and fount is not None:
             self._presentPause = fount.pauseFlow()
         return None
 
@@ -58,22 +91,50 @@ class _InDrain(object):
     def receive(self, item):
         """
         Pass along any received item to the drain that the L{In}'s fount is
-        flowing to.
+        flowing to; or, if the L{In} has buffers and can't deliver it right
+        away, buffer it, pausing this drain's fount if its buffer is full.
 
         @param item: any object
 
-        @return: passed through from the active drain.
+        @return: passed through from the active drain, if it was delivered.
+        """
+        fanIn = self._in
+        if fanIn._bufferSize is None:
+            return fanIn.fount.drain.receive(item)
+        fount = fanIn.fount
+        if not (fanIn._scheduled or fanIn._delivering or fount._isPaused or
+                fount.drain is None):
+            return fount.drain.receive(item)
+        self._buffer.append(item)
+        if not self._scheduled:
+            self._scheduled = True
+            fanIn._scheduled.append(self)
+        if (len(self._buffer) >= fanIn._bufferSize and
+                self._presentPause is None and self.fount is not None):
+            self._presentPause = self.fount.pauseFlow()
+        fanIn._deliverBuffered()
+
+
+    def _relieve(self):
         """
-        return self._in.fount.drain.receive(item)
+        Resume this drain's fount if it was paused because this drain's buffer
+        was full, and there is room in the buffer again.
+        """
+        if (self._presentPause is not None and
+                len(self._buffer) < self._in._bufferSize):
+            p, self._presentPause = self._presentPause, None
+            p.unpause()
 
 
     def flowStopped(self, reason):
         """
-        Remove this drain from its attached L{In}.
+        Remove this drain from its attached L{In}.  Any items in its buffer
+        are still delivered.
 
         @param reason: the reason the flow stopped.
         """
-        self._in._drains.remove(self)
+        self._presentPause = None
+        self._in._drains.pop(self, None)
 
 
 
@@ -95,13 +156,20 @@ class _InFount(object):
         self._isPaused = False
         def doPause():
             self._isPaused = True
+            if self._in._bufferSize is not None:
+                return
             for drain in self._in._drains:
-                drain._presentPause = drain.fount.pauseFlow()
+                if drain.fount is not None:
+                    drain._presentPause = drain.fount.pauseFlow()
         def doResume():
             self._isPaused = False
+            if self._in._bufferSize is not None:
+                self._in._deliverBuffered()
+                return
             for drain in self._in._drains:
                 drain._presentPause, currentPause = None, drain._presentPause
-                currentPause.unpause()
+                if currentPause is not None:
+                    currentPause.unpause()
         self._pauser = Pauser(doPause, doResume)
         self._pauseBecauseNoDrain = OncePause(self._pauser)
         self._pauseBecauseNoDrain.pauseOnce()
@@ -138,11 +206,17 @@ class _InFount(object):
         """
         Stop the flow of all founts flowing into L{_InDrain}s for this L{In}.
         """
-        while self._in._drains:
-            it = self._in._drains[0]
-            it.fount.stopFlow()
-            if it in self._in._drains:
-                self._in._drains.remove(it)
+        drains = self._in._drains
+        while drains:
+            for it in list(drains):
+                drains.pop(it, None)
+                if it.fount is not None:
+                    it.fount.stopFlow()
+        for it in self._in._scheduled:
+            it._buffer.clear()
+            it._scheduled = False
+            it._credit = 0
+        self._in._scheduled.clear()
 
 
 
@@ -157,56 +231,203 @@ class In(object):
                                         /
         your fount ---> In.newDrain()--/
 
+    By default, each item is passed straight through as it is received, and
+    pausing the L{In}'s fount pauses every fount flowing into it.  Given a
+    C{bufferSize}, each of its drains instead buffers up to that many items
+    which can't be delivered right away, because the L{In}'s fount is paused
+    or other drains' items are waiting, and only a drain whose buffer is
+    full pauses its own fount.  Buffered items are delivered in rounds, in
+    which each drain with buffered items delivers as many of them as its
+    weight; so a fount which floods its drain gets no more than its share,
+    and items from quieter founts never wait behind the flood.
+
+    Pausing and resuming the fount of an L{In} with a C{bufferSize} is also
+    cheap however many drains it has: pausing it pauses nothing right away,
+    as a fount is only paused once it fills its drain's buffer, and resuming
+    it only involves the drains with buffered items.  With a C{bufferSize}
+    of 1, this amounts to lazily pausing only the founts which deliver an
+    item while the L{In}'s fount is paused.  Without one, both cost a call
+    to every fount flowing into the L{In}.
+
     @ivar fount: The fount which produces all new attributes.
     @type fount: L{IFount}
+
+    @ivar _bufferSize: the size of each drain's buffer, or L{None}.
+
+    @ivar _drains: the drains whose founts have not stopped, as the keys of
+        a L{dict}, so that they can be added and removed in constant time.
+    @type _drains: L{dict}
+
+    @ivar _scheduled: the drains with buffered items, in the order they will
+        next deliver them.
+    @type _scheduled: L{deque} of L{_InDrain}
+
+    @ivar _delivering: are buffered items being delivered?
+    @type _delivering: L{bool}
     """
-    def __init__(self):
-        self._drains = []
+    def __init__(self, bufferSize=None):
+        """
+        Create an L{In}.
+
+        @param bufferSize: the number of items each drain buffers before
+            pausing its fount, or L{None} to pass items straight through.
+        @type bufferSize: L{int} or L{None}
+        """
+        if bufferSize is not None and bufferSize < 1:
+            raise ValueError("bufferSize must be at least 1, not {0!r}"
+                             .format(bufferSize))
+        self._bufferSize = bufferSize
+        self._scheduled = deque()
+        self._delivering = False
+        self._drains = {}
         self.fount = _InFount(self)
 
 
-    def newDrain(self):
+    def newDrain(self, weight=1):
         """
         Create a new L{drains <IDrain>} which will send its
         inputs out via C{self.fount}.
 
+        @param weight: if this L{In} has buffers, the number of buffered
+            items the new drain delivers in each round.
+        @type weight: L{int}
+
         @return: a drain.
         """
-        it = _InDrain(self)
-        self._drains.append(it)
+        if weight < 1:
+            raise ValueError("weight must be at least 1, not {0!r}"
+                             .format(weight))
+        it = _InDrain(self, weight)
+        self._drains[it] = None
         return it
 
 
+    def _deliverBuffered(self):
+        """
+        Deliver buffered items, round by round, until none are left or the
+        fount is paused.
+        """
+        if self._delivering:
+            return
+        self._delivering = True
+        scheduled = self._scheduled
+        fount = self.fount
+        while scheduled and not fount._isPaused and fount.drain is not None:
+            drain = scheduled.popleft()
+            buffer = drain._buffer
+            quantum = drain._credit or drain._weight
+            drain._credit = 0
+            while (buffer and quantum and not fount._isPaused and
+                   fount.drain is not None):
+                fount.drain.receive(buffer.popleft())
+                quantum -= 1
+            if not buffer:
+                drain._scheduled = False
+            elif quantum:
+                # Paused in the middle of this drain's turn; finish it first.
+                drain._credit = quantum
+                scheduled.appendleft(drain)
+            else:
+                scheduled.append(drain)
+            drain._relieve()
+        self._delivering = False
+
+
+
+class SlowDrain(Exception):
+    """
+    A drain flowing from a fount of a fan.L{Out} with the C{"disconnect"}
+    overflow policy fell so far behind that the fount's buffer overflowed,
+    so the fount stopped flowing to it.
+
+    @ivar bufferSize: the size of the buffer which overflowed.
+    @type bufferSize: L{int}
+    """
+
+    def __init__(self, bufferSize):
+        """
+        @param bufferSize: see L{SlowDrain.bufferSize}
+        """
+        super(SlowDrain, self).__init__(
+            "more than {0} items were buffered for a paused drain"
+            .format(bufferSize)
+        )
+        self.bufferSize = bufferSize
+
+
+
+_overflowPolicies = ("pause", "dropOldest", "dropNewest", "disconnect")
+
+
 
 @implementer(IFount)
 class _OutFount(object):
     """
     The concrete fount type returned by L{Out.newFount}.
+
+    @ivar _receiveBatch: C{drain.receiveBatch} if C{drain} provides
+        L{IBatchDrain}, otherwise L{None}.
+
+    @ivar _out: the L{Out} whose buffering policy and counters this fount
+        uses, or L{None} to pause the upstream fount whenever this fount is
+        paused.
+
+    @ivar _paused: is this fount paused, if it has a buffer?
+
+    @ivar _overflowPause: an L{IPause} from the upstream pauser while this
+        fount's buffer is full under the C{"pause"} policy, otherwise
+        L{None}.
+
+    @ivar _stopping: the reason the flow stopped, if it stopped while items
+        were buffered, otherwise L{None}.
+
+    @ivar dropped: the number of items this fount has dropped because its
+        buffer was full.
+    @type dropped: L{int}
     """
     drain = None
+    _receiveBatch = None
 
     outputType = None
 
-    def __init__(self, upstreamPauser, stopper):
+    def __init__(self, upstreamPauser, stopper, out=None):
         """
         @param upstreamPauser: A L{Pauser} which will pause the upstream fount
             flowing into our L{Out}.
 
         @param stopper: A 0-argument callback to execute on
             L{IFount.stopFlow}
+
+        @param out: see L{_OutFount._out}
         """
-        self._receivedWhilePaused = []
+        self._receivedWhilePaused = deque()
         self._myPause = None
         self._stopper = stopper
+        self._upstreamPauser = upstreamPauser
+        if out is not None and out._bufferSize is None:
+            out = None
+        self._out = out
+        self._paused = False
+        self._overflowPause = None
+        self._stopping = None
+        self.dropped = 0
 
         def actuallyPause():
+            if self._out is not None:
+                self._paused = True
+                return
             self._myPause = upstreamPauser.pause()
 
         def actuallyUnpause():
+            if self._out is not None:
+                self._paused = False
+                self._flushBuffer()
+                return
             aPause = self._myPause
             self._myPause = None
-            if self._receivedWhilePaused:
-                self.drain.receive(self._receivedWhilePaused.pop(0))
+            buffer = self._receivedWhilePaused
+            while buffer and self._myPause is None and self.drain is not None:
+                self.drain.receive(buffer.popleft())
             aPause.unpause()
 
         self._pauser = Pauser(actuallyPause, actuallyUnpause)
@@ -221,6 +442,10 @@ class _OutFount(object):
 
         @return: the result of C{drain.flowingFrom}
         """
+        if IBatchDrain.providedBy(drain):
+            self._receiveBatch = drain.receiveBatch
+        else:
+            self._receiveBatch = None
         return beginFlowingTo(self, drain)
 
 
@@ -251,14 +476,197 @@ class _OutFount(object):
         """
         if self.drain is None:
             return
-        if self._myPause is not None:
+        if self._out is not None:
+            if self._paused or self._receivedWhilePaused:
+                self._buffer(item)
+                return
+        elif self._myPause is not None or self._receivedWhilePaused:
             self._receivedWhilePaused.append(item)
             return
         self.drain.receive(item)
 
 
+    def _buffer(self, item):
+        """
+        Add an item to this fount's buffer while its drain is paused, applying
+        the overflow policy of its L{Out} if the buffer is full.
 
-@implementer(IDrain)
+        @param item: An item that the upstream would like to pass on.
+        """
+        out = self._out
+        buffer = self._receivedWhilePaused
+        if len(buffer) < out._bufferSize:
+            buffer.append(item)
+            return
+        policy = out._overflow
+        if policy == "pause":
+            buffer.append(item)
+            if self._overflowPause is None:
+                out.overflowPauses += 1
+                self._overflowPause = self._upstreamPauser.pause()
+        elif policy == "dropOldest":
+            buffer.popleft()
+            buffer.append(item)
+            self.dropped += 1
+            out.dropped += 1
+        elif policy == "dropNewest":
+            self.dropped += 1
+            out.dropped += 1
+        else:
+            self._disconnect()
+
+
+    def _flushBuffer(self):
+        """
+        Deliver buffered items to this fount's drain until it pauses again,
+        then release the upstream fount if it was paused because the buffer
+        was full, and stop the flow if it stopped while items were buffered.
+        """
+        buffer = self._receivedWhilePaused
+        while buffer and not self._paused and self.drain is not None:
+            self.drain.receive(buffer.popleft())
+        if buffer:
+            return
+        if self._overflowPause is not None:
+            pause, self._overflowPause = self._overflowPause, None
+            pause.unpause()
+        if self._stopping is not None and self.drain is not None:
+            reason, self._stopping = self._stopping, None
+            self.drain.flowStopped(reason)
+
+
+    def _disconnect(self):
+        """
+        This fount's buffer overflowed under the C{"disconnect"} policy; stop
+        delivering to its drain, and tell the drain why.
+        """
+        self._out.disconnected += 1
+        self._receivedWhilePaused.clear()
+        drain = self.drain
+        self._stopper(self)
+        self.drain = None
+        drain.flowStopped(Failure(SlowDrain(self._out._bufferSize)))
+
+
+    def _flowStopped(self, reason):
+        """
+        The flow to this fount's L{Out} has stopped; tell this fount's drain,
+        once any items buffered for it have been delivered.
+
+        @param reason: the reason that the flow stopped.
+        """
+        if self.drain is None:
+            return
+        if self._out is not None and self._receivedWhilePaused:
+            self._stopping = reason
+            return
+        self.drain.flowStopped(reason)
+
+
+    def _deliverBatch(self, items):
+        """
+        Deliver several items to this fount's drain; all at once, if it
+        provides L{IBatchDrain} and we are not paused, otherwise one at a time.
+
+        @param items: Items that the upstream would like to pass on.
+        @type items: L{list}
+        """
+        if (self._receiveBatch is not None and self._myPause is None and
+                not self._paused and not self._receivedWhilePaused):
+            self._receiveBatch(items)
+            return
+        for item in items:
+            self._deliverOne(item)
+
+
+
+class _Subscribers(object):
+    """
+    The founts of a fan.L{Out}, in the order they were added.
+
+    Founts can be added and removed in constant time, even while the founts
+    are being iterated over, and iterating over them does not copy them: a
+    removed fount leaves a hole in the list, which iteration skips, and once
+    holes make up half of the list, the founts which remain are copied to a
+    new list, leaving any iteration under way with the old one.
+
+    Founts added during an iteration are not included in it.  Founts removed
+    during an iteration are skipped if they have not been reached yet,
+    unless the list was replaced in the meantime.
+
+    @ivar _founts: the founts, with L{None} in place of removed founts; as
+        founts are never false, holes are skipped by filtering out false
+        values.
+    @type _founts: L{list}
+
+    @ivar _indexes: a mapping of each fount to its index in C{_founts}.
+    @type _indexes: L{dict}
+    """
+
+    def __init__(self):
+        """
+        Create an empty L{_Subscribers}.
+        """
+        self._founts = []
+        self._indexes = {}
+
+
+    def add(self, fount):
+        """
+        Add a fount.
+
+        @param fount: the fount.
+        """
+        self._indexes[fount] = len(self._founts)
+        self._founts.append(fount)
+
+
+    def remove(self, fount):
+        """
+        Remove a fount, if it has not already been removed.
+
+        @param fount: the fount.
+        """
+        index = self._indexes.pop(fount, None)
+        if index is None:
+            return
+        self._founts[index] = None
+        if len(self._indexes) * 2 <= len(self._founts):
+            self._founts = list(self._indexes)
+            self._indexes = {fount: index
+                             for index, fount in enumerate(self._founts)}
+
+
+    def __contains__(self, fount):
+        """
+        @param fount: a fount.
+
+        @return: has C{fount} been added and not removed?
+        @rtype: L{bool}
+        """
+        return fount in self._indexes
+
+
+    def __len__(self):
+        """
+        @return: the number of founts.
+        @rtype: L{int}
+        """
+        return len(self._indexes)
+
+
+    def __iter__(self):
+        """
+        Iterate over the founts present when iteration starts.
+
+        @return: an iterator of founts.
+        """
+        founts = self._founts
+        return filter(None, islice(founts, len(founts)))
+
+
+
+@implementer(IBatchDrain)
 class _OutDrain(object):
     """
     An L{_OutDrain} is the single L{IDrain} associated with an L{Out}.
@@ -272,7 +680,7 @@ class _OutDrain(object):
         and an output type.
 
         @param founts: the founts whose drains we should flow to.
-        @type founts: L{list} of L{IFount}
+        @type founts: L{_Subscribers}
         """
         self._pause = None
         self._paused = False
@@ -334,10 +742,21 @@ class _OutDrain(object):
 
         @param item: any object
         """
-        for fount in self._founts[:]:
+        for fount in self._founts:
             fount._deliverOne(item)
 
 
+    def receiveBatch(self, items):
+        """
+        Deliver several items to each L{IDrain} attached to the L{Out} via
+        C{Out().newFount().flowTo(...)}.
+
+        @param items: see L{IBatchDrain.receiveBatch}
+        """
+        for fount in self._founts:
+            fount._deliverBatch(items)
+
+
     def flowStopped(self, reason):
         """
         Deliver an item to each L{IDrain} attached to the L{Out} via
@@ -345,9 +764,8 @@ class _OutDrain(object):
 
         @param reason: the reason that the flow stopped.
         """
-        for fount in self._founts[:]:
-            if fount.drain is not None:
-                fount.drain.flowStopped(reason)
+        for fount in self._founts:
+            fount._flowStopped(reason)
 
 
 
@@ -362,16 +780,68 @@ class Out(object):
                                           \
                                            \--> Out.newFount() --> your drain
 
+    By default, pausing any of an L{Out}'s founts pauses the fount flowing
+    into it, so the slowest drain sets the pace for every other drain.  Given
+    a C{bufferSize}, each fount instead buffers up to that many items while
+    its own drain is paused, and delivers them when it resumes; what happens
+    when a buffer is full is decided by C{overflow}:
+
+        - C{"pause"}: the fount flowing into the L{Out} is paused until the
+          buffer has been delivered;
+
+        - C{"dropOldest"}: the oldest buffered item is dropped to make room;
+
+        - C{"dropNewest"}: the new item is dropped;
+
+        - C{"disconnect"}: the fount stops flowing to its drain, whose
+          C{flowStopped} is called with a L{SlowDrain} failure.
+
     @ivar drain: The fount which produces all new attributes.
     @type drain: L{IDrain}
+
+    @ivar dropped: the number of items dropped by all of this L{Out}'s founts
+        because their buffers were full.
+    @type dropped: L{int}
+
+    @ivar disconnected: the number of founts which stopped flowing to their
+        drains because their buffers overflowed.
+    @type disconnected: L{int}
+
+    @ivar overflowPauses: the number of times the fount flowing into this
+        L{Out} was paused because a buffer was full.
+    @type overflowPauses: L{int}
     """
 
-    def __init__(self):
+    def __init__(self, bufferSize=None, overflow="pause"):
         """
         Create an L{Out}.
-        """
-        self._founts = []
-        self.drain = _OutDrain(self._founts)
+
+        @param bufferSize: the number of items each fount buffers while its
+            drain is paused, or L{None} to pause the fount flowing into this
+            L{Out} instead.
+        @type bufferSize: L{int} or L{None}
+
+        @param overflow: the overflow policy, as above.
+        @type overflow: L{str}
+
+        @raise ValueError: if C{overflow} is not a known policy, or is not
+            C{"pause"} without a C{bufferSize}.
+        """
+        if overflow not in _overflowPolicies:
+            raise ValueError("unknown overflow policy {0!r}".format(overflow))
+        if bufferSize is None and overflow != "pause":
+            raise ValueError("the {0!r} overflow policy requires a bufferSize"
+                             .format(overflow))
+        if bufferSize is not None and bufferSize < 1:
+            raise ValueError("bufferSize must be at least 1, not {0!r}"
+                             .format(bufferSize))
+        self._bufferSize = bufferSize
+        self._overflow = overflow
+        self.dropped = 0
+        self.disconnected = 0
+        self.overflowPauses = 0
+        self._founts = _Subscribers()
+        self._outDrain = self.drain = _OutDrain(self._founts)
 
 
     def newFount(self):
@@ -382,12 +852,54 @@ class Out(object):
         @return: a fount associated with this fan-L{Out}.
         @rtype: L{IFount}.
         """
-        f = _OutFount(self.drain._pauser, self._founts.remove)
-        self._founts.append(f)
+        f = _OutFount(self._outDrain._pauser, self._founts.remove, self)
+        self._founts.add(f)
         return f
 
 
 
+class Broadcast(Out):
+    r"""
+    A fan.L{Broadcast} is a fan.L{Out} whose drain passes each item through
+    some stages I{once}, before fanning their outputs out::
+
+                                                      /--> newFount() --> ...
+                                                     /
+        your fount --> drain --> stages --> Broadcast <--> newFount() --> ...
+                                                     \
+                                                      \--> newFount() --> ...
+
+    Stages which would otherwise be repeated downstream of every fount, such
+    as serializing a message and framing it, run only once for each item, no
+    matter how many founts there are; and each fount's drain receives the
+    very same output object, such as one immutable L{bytes} segment, which a
+    transport can write as-is.  For example, rather than flowing each fount
+    of an L{Out} to C{series(commandsToLines, linesToBytes(), transport)},
+    flow C{Broadcast(commandsToLines, linesToBytes())}'s founts to each
+    transport's drain.
+
+    Only stages whose output is the same for every recipient can be shared
+    this way; anything which depends on the recipient must stay downstream
+    of the fount.
+    """
+
+    def __init__(self, *stages, bufferSize=None, overflow="pause"):
+        """
+        Create a L{Broadcast}.
+
+        @param stages: the tubes or drains to share, as for
+            L{series <tubes.tube.series>}.
+
+        @param bufferSize: see L{Out}
+
+        @param overflow: see L{Out}
+        """
+        super(Broadcast, self).__init__(bufferSize, overflow)
+        if stages:
+            self.drain = series(*(stages + (self._outDrain,)))
+
+
+
 class Thru(proxyForInterface(IDrain, "_outDrain")):
     r"""
     A fan.L{Thru} takes an input and fans it I{thru} multiple
@@ -6,242 +6,994 @@
 Tubes that can convert streams of data into discrete chunks and back again.
 """
 
+from struct import Struct
+
 from zope.interface import implementer
 
 from .itube import IDivertable, IFrame, ISegment
-from .tube import tube, series, Diverter
-from twisted.protocols.basic import (
-    LineOnlyReceiver, NetstringReceiver, Int8StringReceiver,
-    Int16StringReceiver, Int32StringReceiver
-)
+from .kit import _Stage, _DrainFactory
+from .tube import tube, Diverter
+from twisted.protocols.basic import NetstringParseError, StringTooLongError
+from twisted.python import log
+from twisted.python.failure import Failure
 
-if 0:
-    # Workaround for inability of pydoctor to resolve references.
-    from twisted.internet.interfaces import ITransport
-    ITransport
-    from twisted.protocols import basic
-    basic
 
 
+_MAX_LINE_LENGTH = 16384
+_MAX_NETSTRING_LENGTH = 99999
+_MAX_PREFIXED_LENGTH = 99999
+
 
-class _Transporter(object):
-    """
-    Just enough of a mock of L{ITransport} to work
-    with the protocols in L{basic}, as a wrapper around a
-    callable taking some data.
 
-    @ivar _dataWritten: 1-argument callable taking L{bytes}, a chunk of data
-        from a stream.
+class FrameTooLong(Exception):
     """
+    A frame being parsed is longer than the parser's maximum length.
 
-    def __init__(self, dataWritten):
-        self._dataWritten = dataWritten
+    @ivar length: the length of the frame, or as much of it as was received
+        before it was known to be too long, or L{None} if the frame's length
+        header was too long to parse.
+    @type length: L{int} or L{None}
 
+    @ivar maxLength: the parser's maximum length.
+    @type maxLength: L{int}
+    """
 
-    def write(self, data):
+    def __init__(self, length, maxLength):
         """
-        Call the C{_dataWritten} callback.
+        @param length: see L{FrameTooLong.length}
 
-        @param data: The data to write.
-        @type data: L{bytes}
+        @param maxLength: see L{FrameTooLong.maxLength}
         """
-        self._dataWritten(data)
+        if length is None:
+            message = ("frame length header is too long for the maximum of "
+                       "{1} bytes")
+        else:
+            message = "{0}-byte frame is longer than the maximum of {1} bytes"
+        super(FrameTooLong, self).__init__(message.format(length, maxLength))
+        self.length = length
+        self.maxLength = maxLength
+
+
+
+class FrameHeader(object):
+    """
+    The start of a frame whose body is delivered in chunks, by
+    L{bytesToIntPrefixed} with C{chunked=True}.
 
+    @ivar length: the length of the frame's body.
+    @type length: L{int}
+    """
+    __slots__ = ("length",)
 
-    def writeSequence(self, dati):
+    def __init__(self, length):
+        """
+        @param length: see L{FrameHeader.length}
         """
-        Call the C{_dataWritten} callback for each element.
+        self.length = length
+
 
-        @param dati: The sequence of data to write.
-        @type dati: L{list} of L{bytes}
+    def __repr__(self):
         """
-        for data in dati:
-            self._dataWritten(data)
+        Nice string representation.
+        """
+        return "<FrameHeader length={0}>".format(self.length)
 
 
 
+@implementer(IDivertable)
 @tube
-class _FramesToSegments(object):
+class _DelimitedParser(object):
     """
-    A tube which could convert "L{frames <IFrame>}" - discrete chunks of data -
-    into "L{segments <ISegment>}" - parts of a raw data stream, with framing
-    headers or delimiters attached.
+    Split a stream of segments into the frames separated by a delimiter.
 
-    @param _received: the C{sendString} method, a 1-argument callable taking
-        L{bytes}.
-    @type _received: L{callable}
+    @ivar _delimiter: the delimiter.
+    @type _delimiter: L{bytes}
+
+    @ivar _maxLength: the length of the longest allowed frame.
+    @type _maxLength: L{int}
+
+    @ivar _buffer: the data received after the last delimiter.
+    @type _buffer: L{bytearray}
     """
 
-    inputType = IFrame
-    outputType = ISegment
+    inputType = ISegment
+    outputType = IFrame
 
-    def __init__(self, stringReceiver, sendMethodName="sendString"):
-        stringReceiver.makeConnection(_Transporter(self._unflush))
-        self._received = getattr(stringReceiver, sendMethodName)
+    def __init__(self, delimiter, maxLength):
+        """
+        @param delimiter: see L{_DelimitedParser._delimiter}
 
+        @param maxLength: see L{_DelimitedParser._maxLength}
+        """
+        self._delimiter = delimiter
+        self._maxLength = maxLength
+        self._buffer = bytearray()
 
-    def started(self):
+
+    def received(self, segment):
         """
-        Flush any greeting data that has come from the wrapped framing parser.
+        Some data was received on the wire.
 
-        @return: any bytes written by makeConnection
+        @param segment: a segment, to be parsed into frames.
+        @type segment: L{bytes}
+
+        @return: the frames completed by C{segment}.
+        @rtype: L{list} of L{bytes}
+
+        @raise FrameTooLong: if a frame is longer than the maximum length.
         """
-        self._buf = []
-        return self._flush()
+        buffer = self._buffer
+        delimiter = self._delimiter
+        if buffer:
+            # Only the end of the buffer might hold the start of a delimiter.
+            searchFrom = max(0, len(buffer) - len(delimiter) + 1)
+            buffer += segment
+            if buffer.find(delimiter, searchFrom) == -1:
+                if len(buffer) > self._maxLength:
+                    raise FrameTooLong(len(buffer), self._maxLength)
+                return ()
+            data = bytes(buffer)
+            del buffer[:]
+        else:
+            data = segment
+        frames = self._split(data)
+        rest = frames.pop()
+        if len(data) > self._maxLength:
+            longest = max(len(rest), max(map(len, frames)) if frames else 0)
+            if longest > self._maxLength:
+                raise FrameTooLong(longest, self._maxLength)
+        buffer += rest
+        return frames
+
+
+    def _split(self, data):
+        """
+        Split some data, which contains at least one delimiter, into frames.
 
+        @param data: the data.
+        @type data: L{bytes}
 
-    def received(self, data):
+        @return: the frames, followed by the data after the last delimiter.
+        @rtype: L{list} of L{bytes}
         """
-        A frame was received, manipulate it and yield a segment or segments.
+        return data.split(self._delimiter)
 
-        @param data: a frame.
 
-        @return: a sequence of segments with appropriate framing information
-            embedded to frame C{data}.
+    def reassemble(self, frames):
         """
-        self._received(data)
-        return self._flush()
+        Take the given sequence of frames, previously emitted by this parser,
+        combine it with any un-parsed data still in the input buffer, and
+        return a list of segments.
 
+        @param frames: L{list} of L{bytes} representing frames.
 
-    def _unflush(self, input):
+        @return: L{list} of L{bytes} representing segments.
         """
-        Put the given segments into the output buffer.
+        frames = list(frames)
+        frames.append(bytes(self._buffer))
+        del self._buffer[:]
+        return [self._delimiter.join(frames)]
+
+
+
+class _LineParser(_DelimitedParser):
+    """
+    Split a stream of segments into lines delimited by LF or CRLF.
 
-        @param input: some values written to the underlying receiver's
-            transport.
-        @type input: L{bytes}
+    @ivar _lastData: the most recent data split into lines, so that the lines
+        can be reassembled with their carriage returns.
+    @type _lastData: L{bytes}
+    """
+
+    def __init__(self, maxLength):
+        """
+        @param maxLength: see L{_DelimitedParser._maxLength}
         """
-        self._buf.append(input)
+        super(_LineParser, self).__init__(b"\n", maxLength)
+        self._lastData = b""
 
 
-    def _flush(self):
+    def _split(self, data):
         """
-        Clear the output buffer and return its previous contents.
+        Split some data into lines, removing each line's trailing carriage
+        return, if present.
+
+        @param data: the data.
+        @type data: L{bytes}
 
-        @return: the current output buffer.
-        @rtype: L{list} of L{bytes}, each representing a segment.
+        @return: the lines, followed by the data after the last line feed.
+        @rtype: L{list} of L{bytes}
         """
-        self._buf, x = [], self._buf
-        return x
+        if b"\r" in data:
+            lines = data.replace(b"\r\n", b"\n").split(b"\n")
+        else:
+            lines = data.split(b"\n")
+        if len(lines) > 1:
+            self._lastData = data
+        return lines
+
+
+    def reassemble(self, lines):
+        """
+        Take the given sequence of lines, previously emitted by this parser,
+        restore the carriage returns removed from them, and combine them with
+        any un-parsed data still in the input buffer.
+
+        Lines emitted from earlier segments than the most recent one, which
+        can only still be pending if the flow was paused, are delimited by LF
+        alone.
 
+        @param lines: L{list} of L{bytes} representing lines.
+
+        @return: L{list} of L{bytes} representing segments.
+        """
+        lines = list(lines)
+        raw = self._lastData.split(b"\n")
+        raw.pop()
+        count = min(len(lines), len(raw))
+        lines[len(lines) - count:] = raw[len(raw) - count:]
+        return super(_LineParser, self).reassemble(lines)
 
 
-class _NotDisconnecting(object):
+
+@tube
+class _NetstringParser(object):
     """
-    Enough of a transport to pretend to not be disconnecting.
+    Parse a stream of segments containing DJB-style netstrings into frames.
+
+    @ivar _maxLength: the length of the longest allowed frame.
+    @type _maxLength: L{int}
+
+    @ivar _maxDigits: the number of digits in C{_maxLength}.
+    @type _maxDigits: L{int}
+
+    @ivar _buffer: the data received after the last complete netstring.
+    @type _buffer: L{bytearray}
     """
-    disconnecting = False
+
+    inputType = ISegment
+    outputType = IFrame
+
+    def __init__(self, maxLength):
+        """
+        @param maxLength: see L{_NetstringParser._maxLength}
+        """
+        self._maxLength = maxLength
+        self._maxDigits = len(str(maxLength))
+        self._buffer = bytearray()
+
+
+    def received(self, segment):
+        """
+        Some data was received on the wire.
+
+        @param segment: a segment, to be parsed into frames.
+        @type segment: L{bytes}
+
+        @return: the frames completed by C{segment}.
+        @rtype: L{list} of L{bytes}
+
+        @raise NetstringParseError: if the data is not a netstring.
+
+        @raise FrameTooLong: if a netstring is longer than the maximum length.
+        """
+        buffer = self._buffer
+        if buffer:
+            buffer += segment
+            data = buffer
+        else:
+            data = segment
+        maxDigits = self._maxDigits
+        end = len(data)
+        offset = 0
+        frames = []
+        with memoryview(data) as view:
+            while offset < end:
+                colon = data.find(b":", offset, offset + maxDigits + 2)
+                if colon == -1:
+                    header = data[offset:offset + maxDigits + 2]
+                    if not header.isdigit():
+                        raise NetstringParseError("Invalid netstring length.")
+                    if len(header) > maxDigits + 1:
+                        raise FrameTooLong(None, self._maxLength)
+                    break
+                header = data[offset:colon]
+                if not header.isdigit() or (header[0] == 0x30 and
+                                            colon - offset > 1):
+                    raise NetstringParseError("Invalid netstring length.")
+                length = int(header)
+                if length > self._maxLength:
+                    raise FrameTooLong(length, self._maxLength)
+                stop = colon + 1 + length
+                if stop >= end:
+                    break
+                if data[stop] != 0x2c:
+                    raise NetstringParseError(
+                        "The received netstring is not terminated by a comma."
+                    )
+                frames.append(view[colon + 1:stop].tobytes())
+                offset = stop + 1
+            if data is not buffer:
+                buffer += view[offset:]
+        if data is buffer:
+            del buffer[:offset]
+        return frames
 
 
 
-@implementer(IDivertable)
 @tube
-class _SegmentsToFrames(object):
+class _IntPrefixedParser(object):
     """
-    Convert segments into frames by parsing them.
+    Parse a stream of segments containing frames with packed, network-endian
+    length prefixes.
+
+    @ivar _prefix: the format of the length prefix.
+    @type _prefix: L{Struct}
+
+    @ivar _maxLength: the length of the longest allowed frame.
+    @type _maxLength: L{int}
+
+    @ivar _buffer: the data received after the last complete frame.
+    @type _buffer: L{bytearray}
     """
 
     inputType = ISegment
     outputType = IFrame
 
-    def __init__(self, stringReceiver,
-                 receivedMethodName="stringReceived"):
-        self._stringReceiver = stringReceiver
-        self._ugh = []
-        setattr(self._stringReceiver, receivedMethodName,
-                lambda aaaugh: self._ugh.append(aaaugh))
-        self._stringReceiver.makeConnection(_NotDisconnecting())
+    def __init__(self, prefix, maxLength):
+        """
+        @param prefix: see L{_IntPrefixedParser._prefix}
 
+        @param maxLength: see L{_IntPrefixedParser._maxLength}
+        """
+        self._prefix = prefix
+        self._maxLength = maxLength
+        self._buffer = bytearray()
 
-    def received(self, string):
+
+    def received(self, segment):
         """
         Some data was received on the wire.
 
-        @param string: a segment, to be parsed into frames.
+        @param segment: a segment, to be parsed into frames.
+        @type segment: L{bytes}
+
+        @return: the frames completed by C{segment}.
+        @rtype: L{list} of L{bytes}
 
-        @return: an iterable of frames.
+        @raise FrameTooLong: if a frame is longer than the maximum length.
         """
-        self._stringReceiver.dataReceived(string)
-        u, self._ugh = self._ugh, []
-        return u
+        buffer = self._buffer
+        if buffer:
+            buffer += segment
+            data = buffer
+        else:
+            data = segment
+        unpackFrom = self._prefix.unpack_from
+        size = self._prefix.size
+        end = len(data)
+        offset = 0
+        frames = []
+        with memoryview(data) as view:
+            while end - offset >= size:
+                length = unpackFrom(data, offset)[0]
+                if length > self._maxLength:
+                    raise FrameTooLong(length, self._maxLength)
+                start = offset + size
+                stop = start + length
+                if stop > end:
+                    break
+                frames.append(view[start:stop].tobytes())
+                offset = stop
+            if data is not buffer:
+                buffer += view[offset:]
+        if data is buffer:
+            del buffer[:offset]
+        return frames
+
+
+
+class _ChunkedIntPrefixedParser(_IntPrefixedParser):
+    """
+    Parse a stream of segments containing frames with packed, network-endian
+    length prefixes into a L{FrameHeader} for each frame, followed by the
+    parts of its body in each segment, without buffering the body.
 
+    @ivar _remaining: the number of bytes of the current frame's body which
+        have not yet been received.
+    @type _remaining: L{int}
+    """
+
+    outputType = None
 
-    def reassemble(self, datas):
+    def __init__(self, prefix, maxLength):
         """
-        Take the given sequence of frames, previously emitted by this
-        L{_SegmentsToFrames}, combine it with any un-parsed data still in the
-        input buffer, and return a list of segments.
+        @param prefix: see L{_IntPrefixedParser._prefix}
 
-        @param datas: L{list} of L{bytes} representing frames.
+        @param maxLength: see L{_IntPrefixedParser._maxLength}
+        """
+        super(_ChunkedIntPrefixedParser, self).__init__(prefix, maxLength)
+        self._remaining = 0
 
-        @return: L{list} of L{bytes} representing segments.
+
+    def received(self, segment):
         """
-        delimiter = self._stringReceiver.delimiter
-        # TODO: we don't clear the buffer here (and requiring that we do so is
-        # just a bug magnet) so Diverter needs to be changed to have only one
-        # input and only one output, and be able to discard the flow in
-        # between.
+        Some data was received on the wire.
+
+        @param segment: a segment, to be parsed into frame headers and chunks
+            of frame bodies.
+        @type segment: L{bytes}
+
+        @return: a L{FrameHeader} for each frame started in C{segment}, each
+            followed by the L{bytes} of its body in C{segment}, if any.
+        @rtype: L{list}
 
-        # TODO: won't work for anything that doesn't have a delimiter
-        # attribute, so... pretty much nothing but LineReceiver.
-        return [delimiter.join(list(datas) + [self._stringReceiver._buffer])]
+        @raise FrameTooLong: if a frame is longer than the maximum length.
+        """
+        buffer = self._buffer
+        if buffer:
+            buffer += segment
+            data = bytes(buffer)
+            del buffer[:]
+        else:
+            data = segment
+        unpackFrom = self._prefix.unpack_from
+        size = self._prefix.size
+        end = len(data)
+        offset = 0
+        remaining = self._remaining
+        results = []
+        with memoryview(data) as view:
+            while offset < end:
+                if remaining:
+                    stop = min(end, offset + remaining)
+                    results.append(view[offset:stop].tobytes())
+                    remaining -= stop - offset
+                    offset = stop
+                    continue
+                if end - offset < size:
+                    buffer += view[offset:]
+                    break
+                remaining = unpackFrom(data, offset)[0]
+                if remaining > self._maxLength:
+                    raise FrameTooLong(remaining, self._maxLength)
+                results.append(FrameHeader(remaining))
+                offset += size
+        self._remaining = remaining
+        return results
 
 
 
-def bytesToNetstrings():
+@tube
+class _VarintPrefixedParser(object):
     """
-    Create a new tube for converting a stream of byte segments containing
-    DJB-style netstrings into bytes.
+    Parse a stream of segments containing frames with base-128 varint length
+    prefixes, as used for length-delimited protocol buffers.
 
-    @return: a L{tube <ITube>} that splits a stream of L{segments <ISegment>}
-        containing nestrings into L{frame <IFrame>}.
+    @ivar _maxLength: the length of the longest allowed frame.
+    @type _maxLength: L{int}
+
+    @ivar _buffer: the data received after the last complete frame.
+    @type _buffer: L{bytearray}
     """
-    return _FramesToSegments(NetstringReceiver())
 
+    inputType = ISegment
+    outputType = IFrame
+
+    def __init__(self, maxLength):
+        """
+        @param maxLength: see L{_VarintPrefixedParser._maxLength}
+        """
+        self._maxLength = maxLength
+        self._buffer = bytearray()
 
 
-def netstringsToBytes():
+    def received(self, segment):
+        """
+        Some data was received on the wire.
+
+        @param segment: a segment, to be parsed into frames.
+        @type segment: L{bytes}
+
+        @return: the frames completed by C{segment}.
+        @rtype: L{list} of L{bytes}
+
+        @raise FrameTooLong: if a frame is longer than the maximum length.
+
+        @raise ValueError: if a length prefix is longer than 10 bytes.
+        """
+        buffer = self._buffer
+        if buffer:
+            buffer += segment
+            data = buffer
+        else:
+            data = segment
+        maxLength = self._maxLength
+        end = len(data)
+        offset = 0
+        frames = []
+        with memoryview(data) as view:
+            while offset < end:
+                length = data[offset]
+                start = offset + 1
+                if length & 0x80:
+                    length &= 0x7f
+                    shift = 7
+                    while True:
+                        if start == end:
+                            length = None
+                            break
+                        byte = data[start]
+                        start += 1
+                        length |= (byte & 0x7f) << shift
+                        if not byte & 0x80:
+                            break
+                        shift += 7
+                        if shift == 70:
+                            raise ValueError(
+                                "Varint length prefix is longer than 10 "
+                                "bytes.")
+                    if length is None:
+                        break
+                if length > maxLength:
+                    raise FrameTooLong(length, maxLength)
+                stop = start + length
+                if stop > end:
+                    break
+                frames.append(view[start:stop].tobytes())
+                offset = stop
+            if data is not buffer:
+                buffer += view[offset:]
+        if data is buffer:
+            del buffer[:offset]
+        return frames
+
+
+
+@tube
+class _RecordParser(object):
     """
-    Create a new tube for encoding a sequence of discrete frames of bytes into
-    DJB-style netstrings on the wire.
+    Parse a stream of segments containing fixed-size binary records into
+    tuples of their fields.
 
-    @return: a L{tube <ITube>} that puts netstring length encoding around
-        L{frames <IFrame>} to produce L{segments <ISegment>}.
+    @ivar _struct: the format of each record.
+    @type _struct: L{Struct}
+
+    @ivar _size: the size of each record.
+    @type _size: L{int}
+
+    @ivar _buffer: the data received after the last complete record.
+    @type _buffer: L{bytearray}
     """
-    return _SegmentsToFrames(NetstringReceiver())
+
+    inputType = ISegment
+    outputType = None
+
+    def __init__(self, recordFormat):
+        """
+        @param recordFormat: see L{_RecordParser._struct}
+
+        @raise ValueError: if C{recordFormat} describes zero-byte records.
+        """
+        self._struct = Struct(recordFormat)
+        self._size = self._struct.size
+        if not self._size:
+            raise ValueError("record format {0!r} has a size of zero bytes"
+                             .format(recordFormat))
+        self._buffer = bytearray()
+
+
+    def received(self, segment):
+        """
+        Some data was received on the wire.
+
+        @param segment: a segment, to be parsed into records.
+        @type segment: L{bytes}
+
+        @return: the records completed by C{segment}.
+        """
+        buffer = self._buffer
+        if buffer:
+            buffer += segment
+            data = buffer
+        else:
+            data = segment
+        complete = len(data) - len(data) % self._size
+        if not complete:
+            if data is not buffer:
+                buffer += data
+            return ()
+        with memoryview(data) as view:
+            records = self._unpack(view[:complete], data is buffer)
+            if data is not buffer:
+                buffer += view[complete:]
+        if data is buffer:
+            del buffer[:complete]
+        return records
+
+
+    def _unpack(self, view, borrowed):
+        """
+        Unpack some complete records.
+
+        @param view: the records.
+        @type view: L{memoryview}
+
+        @param borrowed: is C{view} a view of this parser's buffer, which will
+            be modified, rather than of an immutable segment?
+        @type borrowed: L{bool}
+
+        @return: a tuple of fields for each record.
+        @rtype: L{list} of L{tuple}
+        """
+        return list(self._struct.iter_unpack(view))
 
 
 
-def linesToBytes():
+class _RecordArrayParser(_RecordParser):
     """
-    Convert lines into bytes.
+    Parse a stream of segments containing fixed-size binary records into
+    NumPy structured arrays.
+
+    @ivar _dtype: the NumPy data type of each record.
 
-    @return: Create a new tube for adding CRLF delimiters to a sequence of
-        lines (frames) to produce bytes (segments).
+    @ivar _frombuffer: L{numpy.frombuffer}
     """
-    return _FramesToSegments(LineOnlyReceiver(), "sendLine")
+
+    def __init__(self, dtype):
+        """
+        @param dtype: see L{_RecordArrayParser._dtype}
+
+        @raise ValueError: if C{dtype} describes zero-byte records.
+        """
+        import numpy
+        self._frombuffer = numpy.frombuffer
+        self._dtype = numpy.dtype(dtype)
+        self._size = self._dtype.itemsize
+        if not self._size:
+            raise ValueError("record type {0!r} has a size of zero bytes"
+                             .format(dtype))
+        self._buffer = bytearray()
+
+
+    def _unpack(self, view, borrowed):
+        """
+        Wrap some complete records in an array.
+
+        @param view: see L{_RecordParser._unpack}
+
+        @param borrowed: see L{_RecordParser._unpack}
+
+        @return: a 1-L{list} of an array of the records, which shares memory
+            with the segment they arrived in, if possible.
+        """
+        records = self._frombuffer(view, self._dtype)
+        if borrowed:
+            records = records.copy()
+        return [records]
 
 
 
 @tube
-class _CarriageReturnRemover(object):
+class _FrameEncoder(object):
     """
-    Automatically fix newlines, because hacker news.
+    Encode each frame as one segment, with a function.
+
+    @ivar _encode: a 1-argument callable taking a frame and returning a
+        segment.
     """
 
     inputType = IFrame
-    outputType = IFrame
+    outputType = ISegment
 
-    def received(self, value):
+    def __init__(self, encode):
+        """
+        @param encode: see L{_FrameEncoder._encode}
         """
-        Remove a trailing linefeed, if present, from value and yield it.
+        self._encode = encode
 
-        @param value: a line that has already been split up on \\n.
+
+    def received(self, frame):
         """
-        if value.endswith(b'\r'):
-            yield value[:-1]
-        else:
-            yield value
+        Encode a frame.
+
+        @param frame: a frame.
+        @type frame: L{bytes}
+
+        @return: a segment.
+        @rtype: L{list} of one L{bytes}
+        """
+        return [self._encode(frame)]
+
+
+
+class _Coalescer(_Stage):
+    """
+    A L{_Coalescer} encodes frames into segments, and joins all the segments
+    encoded in one turn of the reactor into one, to reduce the number of
+    writes to a transport.
+
+    @ivar drain: the drain which receives frames.
+    @type drain: L{_StageBatchDrain}
+
+    @ivar fount: the fount which emits segments.
+    @type fount: L{_StageFount}
+
+    @ivar _encode: a 1-argument callable taking a frame and returning a
+        segment.
+
+    @ivar _maxBytes: the size at which the segment being gathered is emitted
+        right away, rather than at the end of the reactor turn.
+    @type _maxBytes: L{int}
+
+    @ivar _reactor: the reactor.
+
+    @ivar _suffix: a 0-argument callable returning a segment to add to the
+        end of the gathered segments each time they are emitted, or L{None}.
+
+    @ivar _final: a 0-argument callable returning a segment to emit when the
+        flow stops, or L{None}.
+
+    @ivar _segments: the segments being gathered.
+    @type _segments: L{list} of L{bytes}
+
+    @ivar _size: the total length of C{_segments}.
+    @type _size: L{int}
+
+    @ivar _call: the delayed call which will emit the gathered segment, or
+        L{None}.
+    """
+
+    def __init__(self, encode, maxBytes, reactor, suffix=None, final=None,
+                 inputType=IFrame):
+        """
+        @param encode: see L{_Coalescer._encode}
+
+        @param maxBytes: see L{_Coalescer._maxBytes}
+
+        @param reactor: see L{_Coalescer._reactor}
+
+        @param suffix: see L{_Coalescer._suffix}
+
+        @param final: see L{_Coalescer._final}
+
+        @param inputType: the type of the inputs to encode.
+        """
+        super(_Coalescer, self).__init__(inputType, ISegment, batches=True)
+        self._encode = encode
+        self._maxBytes = maxBytes
+        self._reactor = reactor
+        self._suffix = suffix
+        self._final = final
+        self._segments = []
+        self._size = 0
+        self._call = None
+
+
+    def _receive(self, frame):
+        """
+        Encode a frame, and add it to the segment being gathered.
+
+        @param frame: a frame.
+        @type frame: L{bytes}
+        """
+        try:
+            segment = self._encode(frame)
+        except:
+            self._fail()
+            return
+        self._segments.append(segment)
+        self._size += len(segment)
+        self._added()
+
+
+    def _receiveBatch(self, frames):
+        """
+        Encode several frames, and add them to the segment being gathered.
+
+        @param frames: a sequence of frames.
+        """
+        try:
+            segments = list(map(self._encode, frames))
+        except:
+            self._fail()
+            return
+        self._segments.extend(segments)
+        self._size += sum(map(len, segments))
+        self._added()
+
+
+    def _pause(self):
+        """
+        Stop emitting segments, and pause the upstream fount.
+        """
+        self._paused = True
+        self._pauseUpstream()
+
+
+    def _resume(self):
+        """
+        Emit the segment gathered while paused, and resume the upstream fount.
+        """
+        self._paused = False
+        self._deliver()
+        self._resumeUpstream()
+
+
+    def _added(self):
+        """
+        Segments were added; emit them if there are enough, or otherwise make
+        sure they will be emitted at the end of this reactor turn.
+        """
+        if self._size >= self._maxBytes:
+            self._deliver()
+        elif self._call is None:
+            self._call = self._reactor.callLater(0, self._deliver)
+
+
+    def _deliver(self):
+        """
+        Emit the gathered segments as one segment, if the fount is flowing,
+        then stop the downstream flow if the upstream flow has stopped.
+        """
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self._call = None
+        drain = self.fount.drain
+        if self._paused or self._done or drain is None:
+            return
+        if self._segments:
+            segments, self._segments = self._segments, []
+            self._size = 0
+            if self._suffix is not None:
+                segments.append(self._suffix())
+            drain.receive(b"".join(segments))
+        if self._stopping is not None and not self._segments:
+            self._done = True
+            if self._final is not None:
+                final = self._final()
+                if final:
+                    drain.receive(final)
+            drain.flowStopped(self._stopping)
+
+
+    def _fail(self):
+        """
+        Encoding a frame raised an exception; log it, and stop the flow in
+        both directions.
+
+        This must be called while the exception is being handled.
+        """
+        f = Failure()
+        log.err(f, "Exception raised when encoding a frame")
+        self._done = True
+        self._discard()
+        fount = self.drain.fount
+        if fount is not None:
+            fount.stopFlow()
+        drain = self.fount.drain
+        if drain is not None:
+            drain.flowStopped(f)
+
+
+    def _discard(self):
+        """
+        Discard the segments being gathered.
+        """
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self._call = None
+        self._segments = []
+        self._size = 0
+
+
+
+def _encoderFor(encode, coalesce, reactor):
+    """
+    Create a tube, or a drain, which encodes frames into segments.
+
+    @param encode: a 1-argument callable taking a frame and returning a
+        segment.
+
+    @param coalesce: see L{linesToBytes}
+
+    @param reactor: see L{linesToBytes}
+
+    @return: a L{_FrameEncoder}, or if C{coalesce} is not L{None}, a
+        L{_DrainFactory} creating a new L{_Coalescer} each time it is used.
+    """
+    if coalesce is None:
+        return _FrameEncoder(encode)
+    if reactor is None:
+        from twisted.internet import reactor
+    return _DrainFactory(lambda: _Coalescer(encode, coalesce, reactor).drain)
+
+
+
+def _encodeNetstring(frame):
+    """
+    Encode a frame as a netstring.
+
+    @param frame: a frame.
+    @type frame: L{bytes}
+
+    @return: the netstring.
+    @rtype: L{bytes}
+    """
+    return b"%d:%s," % (len(frame), frame)
+
+
+
+def _encodeLine(line):
+    """
+    Encode a frame as a CRLF-delimited line.
+
+    @param line: a frame.
+    @type line: L{bytes}
+
+    @return: the line, with its delimiter.
+    @rtype: L{bytes}
+    """
+    return line + b"\r\n"
+
+
+
+def bytesToNetstrings(coalesce=None, reactor=None):
+    """
+    Create a new tube for converting a stream of byte segments containing
+    DJB-style netstrings into bytes.
+
+    @param coalesce: see L{linesToBytes}
+
+    @param reactor: see L{linesToBytes}
+
+    @return: a new L{ITube} that puts netstring length encoding around
+        L{frames <IFrame>} to produce L{segments <ISegment>}, or, if
+        C{coalesce} is given, a stage which does the same, as for
+        L{linesToBytes}.
+    """
+    return _encoderFor(_encodeNetstring, coalesce, reactor)
+
+
+
+def netstringsToBytes():
+    """
+    Create a new tube for encoding a sequence of discrete frames of bytes into
+    DJB-style netstrings on the wire.
+
+    @return: a L{tube <ITube>} that puts netstring length encoding around
+        L{frames <IFrame>} to produce L{segments <ISegment>}.
+    """
+    return _NetstringParser(_MAX_NETSTRING_LENGTH)
+
+
+
+def linesToBytes(coalesce=None, reactor=None):
+    """
+    Convert lines into bytes.
+
+    By default, each line becomes one segment, so a transport is written to
+    once for each line.  Pass C{coalesce} to join all the lines received in
+    one turn of the reactor into one segment instead, which is emitted at the
+    end of the turn, or as soon as it is at least C{coalesce} bytes long.
+    This saves a great many writes for protocols which send lots of small
+    lines in response to each input.
+
+    @param coalesce: the size at which a segment of joined lines is emitted
+        before the end of the reactor turn, or L{None} to not join lines.
+    @type coalesce: L{int} or L{None}
+
+    @param reactor: if C{coalesce} is given, the reactor whose turns to join
+        lines over; by default, the global reactor.
+
+    @return: a new L{ITube} for adding CRLF delimiters to a sequence of
+        lines (frames) to produce bytes (segments).  If C{coalesce} is given,
+        the result is not an L{ITube}, since it must emit at the end of the
+        reactor turn, but like one, it may be passed to L{tubes.tube.series}
+        or used as a stage of a L{tubes.tube.PipelineTemplate} any number of
+        times, creating a new stage each time.
+    """
+    return _encoderFor(_encodeLine, coalesce, reactor)
 
 
 
@@ -257,9 +1009,7 @@ def bytesDelimitedBy(delimiter):
     @return: a tube that converts a stream of bytes into a sequence of frames.
     @rtype: L{ITube}
     """
-    receiver = LineOnlyReceiver()
-    receiver.delimiter = delimiter
-    return _SegmentsToFrames(receiver, "lineReceived")
+    return _DelimitedParser(delimiter, _MAX_LINE_LENGTH)
 
 
 
@@ -268,33 +1018,58 @@ def bytesToLines():
     Create a drain that consumes a stream of bytes and produces frames
     delimited by LF or CRLF.
 
+    The drain is a L{Diverter}, so the rest of the stream, including any lines
+    not yet delivered, can be diverted elsewhere; for example, when a
+    line-based protocol switches to a raw mode.
+
     @return: a new L{IDrain} that does the given conversion.
+    @rtype: L{Diverter}
     """
-    return series(Diverter(bytesDelimitedBy(b"\n")), _CarriageReturnRemover())
+    return Diverter(_LineParser(_MAX_LINE_LENGTH))
 
 
 
-_packedPrefixProtocols = {
-    8: Int8StringReceiver,
-    16: Int16StringReceiver,
-    32: Int32StringReceiver,
+_packedPrefixFormats = {
+    8: Struct("!B"),
+    16: Struct("!H"),
+    32: Struct("!I"),
 }
 
-def bytesToIntPrefixed(prefixBits):
+def bytesToIntPrefixed(prefixBits, maxLength=_MAX_PREFIXED_LENGTH,
+                       chunked=False):
     """
     Convert a sequence of byte segments with packed network-endian int prefixes
     of the given bit width into frames of the indicated sizes.
 
+    A frame longer than C{maxLength} stops the flow with L{FrameTooLong} as
+    soon as its prefix is received, so that a peer can't make the parser
+    buffer a huge frame.
+
+    To receive frames too large to buffer, pass C{chunked=True}.  Then, rather
+    than frames, the tube emits a L{FrameHeader} when each frame starts,
+    followed by the parts of its body as they arrive, as L{bytes}; so a frame
+    of any length can be streamed, for example, to a file, in bounded memory.
+    The body is complete once the lengths of the parts after a L{FrameHeader}
+    add up to its C{length}.
+
     @param prefixBits: The number of bits to use for the length prefix: either
         8, 16, or 32.
 
+    @param maxLength: the length of the longest allowed frame.
+    @type maxLength: L{int}
+
+    @param chunked: emit the headers and parts of frames, rather than whole
+        frames?
+    @type chunked: L{bool}
+
     @return: a new L{ITube} that does the conversion.
     """
-    return _SegmentsToFrames(_packedPrefixProtocols[prefixBits]())
+    parser = _ChunkedIntPrefixedParser if chunked else _IntPrefixedParser
+    return parser(_packedPrefixFormats[prefixBits], maxLength)
 
 
 
-def intPrefixedToBytes(prefixBits):
+def intPrefixedToBytes(prefixBits, coalesce=None, reactor=None):
     """
     Prepend packed network endian lengths to a sequence of bytes representing
     frames.
@@ -302,6 +1077,124 @@ def intPrefixedToBytes(prefixBits):
     @param prefixBits: The number of bits to use for the length prefix: either
         8, 16, or 32.
 
+    @param coalesce: see L{linesToBytes}
+
+    @param reactor: see L{linesToBytes}
+
+    @return: a new L{ITube} that does the conversion, or, if C{coalesce}
+        is given, a stage which does the same, as for L{linesToBytes}.
+    """
+    prefix = _packedPrefixFormats[prefixBits]
+    limit = 2 ** prefixBits
+    def encode(frame):
+        if len(frame) >= limit:
+            raise StringTooLongError(
+                "Try to send {0} bytes whereas maximum is {1}"
+                .format(len(frame), limit))
+        return prefix.pack(len(frame)) + frame
+    return _encoderFor(encode, coalesce, reactor)
+
+
+
+_smallVarints = [bytes((length,)) for length in range(0x80)]
+
+def _encodeVarintPrefixed(frame):
+    """
+    Prefix a frame with its length, as a base-128 varint.
+
+    @param frame: a frame.
+    @type frame: L{bytes}
+
+    @return: the prefixed frame.
+    @rtype: L{bytes}
+    """
+    length = len(frame)
+    if length < 0x80:
+        return _smallVarints[length] + frame
+    prefix = bytearray()
+    while length >= 0x80:
+        prefix.append((length & 0x7f) | 0x80)
+        length >>= 7
+    prefix.append(length)
+    prefix += frame
+    return bytes(prefix)
+
+
+
+def bytesToVarintPrefixed(maxLength=_MAX_PREFIXED_LENGTH):
+    """
+    Convert a sequence of byte segments containing frames prefixed with their
+    lengths, as base-128 varints, into frames; this is the format of
+    length-delimited protocol buffer streams.
+
+    A frame longer than C{maxLength} stops the flow with L{FrameTooLong} as
+    soon as its prefix is received.
+
+    @param maxLength: the length of the longest allowed frame.
+    @type maxLength: L{int}
+
     @return: a new L{ITube} that does the conversion.
     """
-    return _FramesToSegments(_packedPrefixProtocols[prefixBits]())
+    return _VarintPrefixedParser(maxLength)
+
+
+
+def varintPrefixedToBytes(coalesce=None, reactor=None):
+    """
+    Prefix a sequence of bytes representing frames with their lengths, as
+    base-128 varints.
+
+    @param coalesce: see L{linesToBytes}
+
+    @param reactor: see L{linesToBytes}
+
+    @return: a new L{ITube} that does the conversion, or, if C{coalesce}
+        is given, a stage which does the same, as for L{linesToBytes}.
+    """
+    return _encoderFor(_encodeVarintPrefixed, coalesce, reactor)
+
+
+
+def bytesToRecords(recordFormat):
+    """
+    Convert a stream of byte segments containing fixed-size binary records
+    into a tuple of the fields of each record, as unpacked by L{struct}.
+
+    All the complete records in each segment are unpacked at once, and
+    delivered together, to an L{IBatchDrain} if the downstream drain is one.
+    Any incomplete record at the end of a segment is kept until the rest of
+    it arrives.
+
+    @param recordFormat: the L{struct} format of each record.
+    @type recordFormat: L{str}
+
+    @return: a new L{ITube} that does the conversion.
+
+    @raise ValueError: if C{recordFormat} describes zero-byte records.
+    """
+    return _RecordParser(recordFormat)
+
+
+
+def bytesToRecordArrays(dtype):
+    """
+    Convert a stream of byte segments containing fixed-size binary records
+    into NumPy structured arrays, for stages which process records in bulk.
+
+    One array is emitted for all the complete records in each segment; when
+    the records did not need to be buffered, it is a read-only view of the
+    segment's memory, rather than a copy.  Any incomplete record at the end of
+    a segment is kept until the rest of it arrives.
+
+    This requires NumPy.
+
+    @param dtype: the NumPy data type of each record; for example,
+        C{[("id", ">u4"), ("value", ">f8")]}.
+
+    @return: a new L{ITube} that does the conversion.
+
+    @raise ValueError: if C{dtype} describes zero-byte records.
+
+    @raise ImportError: if NumPy is not installed.
+    """
+    return _RecordArrayParser(dtype)
@@ -175,6 +175,34 @@ class IDrain(Interface):
 
 
 
+class IBatchDrain(IDrain):
+    """
+    An L{IBatchDrain} is an L{IDrain} which can also receive several items in
+    a single call.
+
+    Founts are not required to use L{receiveBatch}; a fount flowing to a drain
+    which does not provide this interface will call L{IDrain.receive} once for
+    each item instead.
+    """
+
+    def receiveBatch(items):
+        """
+        Several items were received from the fount.
+
+        This must have the same effect as calling L{IDrain.receive} with each
+        item in turn, with one exception: a fount only checks whether it has
+        been paused I{between} batches.  If this drain pauses its fount while
+        processing C{items}, it must still accept all of them, buffering any
+        that it can not yet process.
+
+        @param items: instances of L{IDrain.inputType}, in the order they
+            would have been passed to L{IDrain.receive}.  This may be the
+            very L{list} that a tube produced, so it must not be modified.
+        @type items: L{list}
+        """
+
+
+
 class ITube(Interface):
     """
     A tube transforms input into output.
@@ -7,9 +7,11 @@ Toolkit to alleviate some of the duplication in constructing your own IFount
 and IDrain implementations.
 """
 
+from collections import deque
+
 from zope.interface import implementer
 
-from .itube import AlreadyUnpaused, IPause
+from .itube import AlreadyUnpaused, IPause, IDrain, IFount, IBatchDrain
 
 
 @implementer(IPause)
@@ -17,6 +19,8 @@ class _Pause(object):
     """
     Implementation of L{IPause} for L{Pauser}.
     """
+    __slots__ = ("_friendPauser", "_alive")
+
     def __init__(self, pauser):
         """
         Construct a L{_Pause} from a L{Pauser}.
@@ -52,6 +56,8 @@ class Pauser(object):
     to implement a high-level pause and resume API suitable for use from
     multiple clients, in terms of low-level state change operations.
     """
+    __slots__ = ("_actuallyPause", "_actuallyResume", "_pauses")
+
     def __init__(self, actuallyPause, actuallyResume):
         """
         @param actuallyPause: a callable to be invoked when the underlying
@@ -114,6 +120,33 @@ def beginFlowingTo(fount, drain):
 
 
 
+def _checkFlowTypes(fount, outType, drain, inType):
+    """
+    Check that output of the given type may flow into input of the given
+    type.
+
+    @param fount: the source of the output, for the error message.
+
+    @param outType: the type of the output.
+    @type outType: L{ISpecification} or L{None}
+
+    @param drain: the destination of the output, for the error message.
+
+    @param inType: the type of input required.
+    @type inType: L{ISpecification} or L{None}
+
+    @raise TypeError: if C{outType} is not compatible with C{inType}.
+    """
+    if outType is not None and inType is not None:
+        if not inType.isOrExtends(outType):
+            raise TypeError(
+                ("the output of {fount}, {outType}, is not compatible "
+                 "with the required input type of {drain}, {inType}")
+                .format(inType=inType, outType=outType,
+                        fount=fount, drain=drain))
+
+
+
 def beginFlowingFrom(drain, fount):
     """
     To correctly implement drain.flowingFrom you need to do certian things; do
@@ -126,15 +159,7 @@ def beginFlowingFrom(drain, fount):
     @return: L{None}
     """
     if fount is not None:
-        outType = fount.outputType
-        inType = drain.inputType
-        if outType is not None and inType is not None:
-            if not inType.isOrExtends(outType):
-                raise TypeError(
-                    ("the output of {fount}, {outType}, is not compatible "
-                     "with the required input type of {drain}, {inType}")
-                    .format(inType=inType, outType=outType,
-                            fount=fount, drain=drain))
+        _checkFlowTypes(fount, fount.outputType, drain, drain.inputType)
     oldFount = drain.fount
     drain.fount = fount
     if (
@@ -150,6 +175,7 @@ class NoPause(object):
     """
     A null implementation of L{IPause} that does nothing.
     """
+    __slots__ = ()
 
     def unpause(self):
         """
@@ -162,6 +188,8 @@ class OncePause(object):
     """
     Pause a pauser once, unpause it if necessary.
     """
+    __slots__ = ("_pauser", "_currentlyPaused", "_pause")
+
     def __init__(self, pauser):
         """
         Create a L{OncePause} with the given L{Pauser}.
@@ -192,3 +220,369 @@ class OncePause(object):
         if self._currentlyPaused:
             self._currentlyPaused = False
             self._pause.unpause()
+
+
+
+@implementer(IDrain)
+class _StageDrain(object):
+    """
+    The drain of a L{_Stage}, which receives its inputs.
+    """
+    __slots__ = ("_stage", "fount", "inputType")
+
+    def __init__(self, stage, inputType):
+        """
+        @param stage: the L{_Stage} this drain belongs to.
+
+        @param inputType: the type of the inputs.
+        """
+        self._stage = stage
+        self.fount = None
+        self.inputType = inputType
+
+
+    def flowingFrom(self, fount):
+        """
+        Start receiving inputs from the given fount, keeping it paused if the
+        stage has paused its upstream fount.
+
+        @param fount: see L{IDrain.flowingFrom}
+
+        @return: the stage's fount, flowing to its drain if it has one.
+        """
+        stage = self._stage
+        beginFlowingFrom(self, fount)
+        if stage._upstreamPause is not None:
+            oldPause = stage._upstreamPause
+            stage._upstreamPause = (fount.pauseFlow() if fount is not None
+                                    else NoPause())
+            oldPause.unpause()
+        nextFount = stage.fount
+        if nextFount.drain is None:
+            return nextFount
+        return nextFount.flowTo(nextFount.drain)
+
+
+    def receive(self, item):
+        """
+        Pass an input to the stage.
+
+        @param item: see L{IDrain.receive}
+        """
+        self._stage._receive(item)
+
+
+    def flowStopped(self, reason):
+        """
+        The flow has stopped; tell the stage.
+
+        @param reason: see L{IDrain.flowStopped}
+        """
+        self._stage._flowStopped(reason)
+
+
+
+@implementer(IBatchDrain)
+class _StageBatchDrain(_StageDrain):
+    """
+    The drain of a L{_Stage} which accepts several inputs at once.
+    """
+    __slots__ = ()
+
+    def receiveBatch(self, items):
+        """
+        Pass several inputs to the stage.
+
+        @param items: see L{IBatchDrain.receiveBatch}
+        """
+        self._stage._receiveBatch(items)
+
+
+
+@implementer(IFount)
+class _StageFount(object):
+    """
+    The fount of a L{_Stage}, which emits its outputs.
+    """
+    __slots__ = ("_stage", "drain", "outputType", "_pauser")
+
+    def __init__(self, stage, outputType):
+        """
+        @param stage: the L{_Stage} this fount belongs to.
+
+        @param outputType: the type of the outputs.
+        """
+        self._stage = stage
+        self.drain = None
+        self.outputType = outputType
+        self._pauser = Pauser(stage._pause, stage._resume)
+
+
+    def flowTo(self, drain):
+        """
+        Start emitting outputs to the given drain.
+
+        @param drain: see L{IFount.flowTo}
+
+        @return: see L{IFount.flowTo}
+        """
+        result = beginFlowingTo(self, drain)
+        self._stage._deliver()
+        return result
+
+
+    def pauseFlow(self):
+        """
+        Stop emitting outputs until unpaused.
+
+        @return: an L{IPause}
+        """
+        return self._pauser.pause()
+
+
+    def stopFlow(self):
+        """
+        Discard any outputs which have not been emitted, and stop the flow
+        from upstream.
+        """
+        stage = self._stage
+        stage._discard()
+        fount = stage.drain.fount
+        if fount is not None:
+            fount.stopFlow()
+
+
+
+class _Stage(object):
+    """
+    A L{_Stage} is a drain and a fount with some state between them, for
+    stages which, unlike a tube, need to emit outputs at times other than
+    when they receive inputs, such as when a timer expires or a L{Deferred}
+    fires.  It keeps outputs in C{_ready} while its fount is paused, and
+    pauses its upstream fount when L{_Stage._full} says so.
+
+    By itself, a L{_Stage} passes its inputs through unchanged.  Subclasses
+    override C{_receive} to turn inputs into outputs, and, if they need to,
+    C{_discard}, C{_full} and C{_pending}; a stage which emits something
+    other than the items in C{_ready} overrides C{_deliver} as well.
+
+    @ivar drain: the drain which receives inputs.
+    @type drain: L{_StageDrain}
+
+    @ivar fount: the fount which emits outputs.
+    @type fount: L{_StageFount}
+
+    @ivar _ready: outputs which are ready to emit, in order.
+    @type _ready: L{deque}
+
+    @ivar _paused: is the fount paused?
+
+    @ivar _delivering: are outputs currently being emitted?
+
+    @ivar _stopping: the reason the upstream flow stopped, or L{None}.
+
+    @ivar _done: has the downstream flow been stopped?
+
+    @ivar _upstreamPause: an L{IPause} from the upstream fount while it is
+        paused, otherwise L{None}.
+    """
+
+    def __init__(self, inputType=None, outputType=None, batches=False):
+        """
+        @param inputType: the type of the inputs.
+
+        @param outputType: the type of the outputs.
+
+        @param batches: should the drain provide L{IBatchDrain}?
+        @type batches: L{bool}
+        """
+        self._ready = deque()
+        self._paused = False
+        self._delivering = False
+        self._stopping = None
+        self._done = False
+        self._upstreamPause = None
+        drainType = _StageBatchDrain if batches else _StageDrain
+        self.drain = drainType(self, inputType)
+        self.fount = _StageFount(self, outputType)
+
+
+    def _receive(self, item):
+        """
+        An input was received; emit it as an output.
+
+        @param item: the input.
+        """
+        self._ready.append(item)
+        self._deliver()
+
+
+    def _receiveBatch(self, items):
+        """
+        Several inputs were received at once.
+
+        @param items: the inputs.
+        """
+        for item in items:
+            self._receive(item)
+
+
+    def _flowStopped(self, reason):
+        """
+        The upstream flow has stopped; stop the downstream flow once
+        everything has been emitted.
+
+        @param reason: see L{IDrain.flowStopped}
+        """
+        if self._done:
+            return
+        self._stopping = reason
+        self._deliver()
+
+
+    def _discard(self):
+        """
+        The downstream flow has been stopped; discard everything which has
+        not been emitted.
+        """
+        self._done = True
+        self._ready.clear()
+
+
+    def _pause(self):
+        """
+        The fount has been paused; stop emitting outputs.
+        """
+        self._paused = True
+
+
+    def _resume(self):
+        """
+        The fount has been resumed; emit any outputs which are ready.
+        """
+        self._paused = False
+        self._deliver()
+
+
+    def _pending(self):
+        """
+        Is anything still to be emitted, other than the outputs in
+        C{_ready}?
+
+        @return: L{False}
+        """
+        return False
+
+
+    def _full(self):
+        """
+        Should the upstream fount be paused?
+
+        @return: whether any outputs are waiting to be emitted.
+        """
+        return bool(self._ready)
+
+
+    def _pauseUpstream(self):
+        """
+        Pause the upstream fount, if it is not already paused.
+        """
+        if self._upstreamPause is None:
+            fount = self.drain.fount
+            self._upstreamPause = (fount.pauseFlow() if fount is not None
+                                   else NoPause())
+
+
+    def _resumeUpstream(self):
+        """
+        Resume the upstream fount, if it was paused.
+        """
+        if self._upstreamPause is not None:
+            pause, self._upstreamPause = self._upstreamPause, None
+            pause.unpause()
+
+
+    def _checkFull(self):
+        """
+        Pause the upstream fount if the stage is full, or resume it if not.
+        """
+        if self._full():
+            self._pauseUpstream()
+        else:
+            self._resumeUpstream()
+
+
+    def _emit(self, item):
+        """
+        Emit an output.
+
+        @param item: the output.
+        """
+        self.fount.drain.receive(item)
+
+
+    def _deliver(self):
+        """
+        Emit as many ready outputs as possible, then stop the downstream flow
+        if the upstream flow has stopped and nothing remains, or otherwise
+        pause or resume the upstream fount.
+        """
+        if self._delivering:
+            return
+        self._delivering = True
+        ready = self._ready
+        fount = self.fount
+        while ready and not self._paused and fount.drain is not None:
+            self._emit(ready.popleft())
+        self._delivering = False
+        if self._done:
+            return
+        if (self._stopping is not None and not ready and
+                not self._pending() and fount.drain is not None):
+            self._done = True
+            fount.drain.flowStopped(self._stopping)
+            return
+        self._checkFull()
+
+
+
+class _DrainFactory(object):
+    """
+    A reusable description of a stage of a flow which, like an L{ITube
+    <tubes.itube.ITube>}, may be passed to L{tubes.tube.series} any number of
+    times, creating a new drain each time.  This is for stages, such as a
+    L{_Stage}, which cannot be tubes, or which keep state that no two flows
+    may share.  Calling it creates a new drain, so it may also be used as a
+    stage of a L{tubes.tube.PipelineTemplate}.
+    """
+    __slots__ = ("_newDrain",)
+
+    def __init__(self, newDrain):
+        """
+        @param newDrain: a 0-argument callable returning a new L{IDrain}.
+        """
+        self._newDrain = newDrain
+
+
+    def __call__(self):
+        """
+        Create a new drain.
+
+        @return: the new drain.
+        @rtype: L{IDrain}
+        """
+        return self._newDrain()
+
+
+    def __conform__(self, interface):
+        """
+        Adapt to L{IDrain} by creating a new drain, as L{tubes.tube.series}
+        does for each of its arguments.
+
+        @param interface: the interface to adapt to.
+
+        @return: a new drain if C{interface} is L{IDrain}, otherwise L{None}.
+        """
+        if interface is IDrain:
+            return self()
+        return None
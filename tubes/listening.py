@@ -22,6 +22,7 @@ class Flow(object):
     @ivar drain: A drain.
     @type drain: L{IDrain}
     """
+    __slots__ = ("fount", "drain")
 
     def __init__(self, fount, drain):
         """
@@ -107,6 +108,8 @@ class _OnStop(object):
     """
     Call a callback when the flow stops.
     """
+    __slots__ = ("callback",)
+
     def __init__(self, callback):
         """
         Call the given callback.
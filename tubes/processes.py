@@ -0,0 +1,305 @@
+# -*- test-case-name: tubes.test.test_processes -*-
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Run a stateless receiver in a pool of worker processes, so that CPU-bound
+work can use more than one core.
+
+@see: L{ProcessPoolStage}
+"""
+
+import os
+from importlib import import_module
+from time import perf_counter
+
+from zope.interface import implementer
+
+from twisted.internet.defer import Deferred
+
+from .itube import ITube
+from .tube import receiver as _receiver, series, _Tubule
+from .undefer import _DeferredWindow
+
+__all__ = [
+    "ProcessPoolStage",
+]
+
+_receivers = {}
+
+
+
+def _runBatch(moduleName, name, items):
+    """
+    Pass a batch of items to a receiver, in a worker process.
+
+    @param moduleName: the name of the module where the receiver is defined.
+    @type moduleName: L{str}
+
+    @param name: the name of the receiver in its module.
+    @type name: L{str}
+
+    @param items: the items.
+    @type items: L{list}
+
+    @return: the ID of this process, the time taken, and a L{list} of the
+        outputs for each item.
+    @rtype: 3-L{tuple} of L{int}, L{float}, L{list} of L{list}s
+    """
+    started = perf_counter()
+    key = (moduleName, name)
+    received = _receivers.get(key)
+    if received is None:
+        received = _receivers[key] = getattr(import_module(moduleName),
+                                             name).received
+    outputs = [list(received(item) or ()) for item in items]
+    return os.getpid(), perf_counter() - started, outputs
+
+
+
+@implementer(ITube)
+class _Batcher(object):
+    """
+    A tube which collects the items received in one turn of the reactor, up to
+    a maximum number, into a batch for a L{ProcessPoolStage}.
+
+    @ivar _stage: the L{ProcessPoolStage}.
+
+    @ivar _batch: the items in the batch being collected, or L{None}.
+    @type _batch: L{list}
+
+    @ivar _deferred: the L{Deferred} for the batch being collected.
+
+    @ivar _call: the delayed call which will submit the batch being
+        collected.
+    """
+
+    outputType = None
+
+    def __init__(self, stage):
+        """
+        @param stage: see L{_Batcher._stage}
+        """
+        self._stage = stage
+        self._batch = None
+        self._deferred = None
+        self._call = None
+        self.inputType = stage._receiver.inputType
+
+
+    def started(self):
+        """
+        Nothing to do when the flow starts.
+        """
+
+
+    def received(self, item):
+        """
+        Add an item to the batch being collected, starting a new one if
+        necessary.
+
+        @param item: an input for the receiver.
+
+        @return: a L{Deferred} for the batch, if this item starts a new one.
+        """
+        if self._batch is not None:
+            self._batch.append(item)
+            if len(self._batch) >= self._stage._batchSize:
+                self._call.cancel()
+                self._submit()
+            return None
+        self._batch = [item]
+        self._deferred = Deferred()
+        result = [self._deferred]
+        if self._stage._batchSize == 1:
+            self._submit()
+        else:
+            self._call = self._stage._reactor.callLater(0, self._submit)
+        return result
+
+
+    def stopped(self, reason):
+        """
+        Submit the batch being collected, if any.
+
+        @param reason: ignored.
+
+        @return: no outputs.
+        """
+        if self._batch is not None:
+            self._call.cancel()
+            self._submit()
+        return ()
+
+
+    def _submit(self):
+        """
+        Submit the batch being collected to the pool.
+        """
+        batch, self._batch = self._batch, None
+        d, self._deferred = self._deferred, None
+        self._call = None
+        self._stage._submit(batch).chainDeferred(d)
+
+
+
+class ProcessPoolStage(object):
+    """
+    A L{ProcessPoolStage} passes the inputs of a stateless receiver, created
+    with L{receiver <tubes.tube.receiver>}, to a pool of worker processes, and
+    delivers its outputs in order.
+
+    The receiver must be defined at the top level of a module, so that the
+    worker processes can import it; the items and its outputs must be
+    picklable.  Items received in the same turn of the reactor are sent to
+    the pool in batches of up to C{batchSize}, to reduce the cost of
+    communicating with the workers.  For example, to decode JSON on all of
+    your cores::
+
+        @receiver()
+        def decode(line):
+            return [json.loads(line)]
+
+        stage = ProcessPoolStage(decode, ProcessPoolExecutor())
+        lines.flowTo(series(stage.drain, handler))
+
+    @ivar drain: the drain which receives the receiver's inputs, and whose
+        fount emits its outputs.
+    @type drain: L{IDrain}
+
+    @ivar _receiver: the receiver.
+
+    @ivar _executor: the pool.
+
+    @ivar _batchSize: the maximum number of items in a batch.
+
+    @ivar _reactor: the reactor to deliver outputs in.
+
+    @ivar _startTime: when this stage was created, according to C{_reactor}.
+
+    @ivar _busy: the time spent processing batches by each worker process,
+        by process ID.
+    @type _busy: L{dict}
+    """
+
+    def __init__(self, receiver, executor, batchSize=64, maxInFlight=None,
+                 reactor=None):
+        """
+        @param receiver: the receiver.
+        @type receiver: the result of L{tubes.tube.receiver}
+
+        @param executor: the pool of worker processes.
+        @type executor: L{concurrent.futures.ProcessPoolExecutor}, or any
+            other L{concurrent.futures.Executor}
+
+        @param batchSize: the maximum number of items to send to a worker at
+            once.
+        @type batchSize: L{int}
+
+        @param maxInFlight: the number of batches which may be in the pool,
+            or waiting to be delivered, before the upstream fount is paused;
+            by default, the number of CPUs.
+        @type maxInFlight: L{int}
+
+        @param reactor: the reactor to deliver outputs in; by default, the
+            global reactor.
+
+        @raise TypeError: if C{receiver} is not a receiver defined at the
+            top level of a module.
+        """
+        if reactor is None:
+            from twisted.internet import reactor
+        if maxInFlight is None:
+            maxInFlight = os.cpu_count() or 1
+        self._name = _importableName(receiver)
+        self._receiver = receiver
+        self._executor = executor
+        self._batchSize = batchSize
+        self._reactor = reactor
+        self._startTime = reactor.seconds()
+        self._busy = {}
+
+        @_receiver(outputType=receiver.outputType, name="flatten")
+        def flatten(outputs):
+            return [output for each in outputs for output in each]
+
+        self.drain = series(_Batcher(self),
+                            _DeferredWindow(maxInFlight, True, False).drain,
+                            flatten)
+
+
+    def _submit(self, batch):
+        """
+        Submit a batch of items to the pool.
+
+        @param batch: the items.
+        @type batch: L{list}
+
+        @return: a L{Deferred} firing with a L{list} of the outputs for each
+            item.
+        """
+        d = Deferred()
+        future = self._executor.submit(_runBatch, self._name[0],
+                                       self._name[1], batch)
+        def done(future):
+            self._reactor.callFromThread(self._finished, future, d)
+        future.add_done_callback(done)
+        return d
+
+
+    def _finished(self, future, d):
+        """
+        A batch has been processed; record how long it took, and fire its
+        L{Deferred}.
+
+        @param future: the L{concurrent.futures.Future} for the batch.
+
+        @param d: the L{Deferred} for the batch.
+        """
+        try:
+            pid, elapsed, outputs = future.result()
+        except Exception:
+            d.errback()
+        else:
+            self._busy[pid] = self._busy.get(pid, 0.0) + elapsed
+            d.callback(outputs)
+
+
+    def utilization(self):
+        """
+        How busy has each worker process been since this stage was created?
+
+        @return: the fraction of the time since this stage was created that
+            each worker has spent processing batches for it, by process ID.
+        @rtype: L{dict} mapping L{int} to L{float}
+        """
+        elapsed = self._reactor.seconds() - self._startTime
+        if elapsed <= 0:
+            return {pid: 0.0 for pid in self._busy}
+        return {pid: busy / elapsed for pid, busy in self._busy.items()}
+
+
+
+def _importableName(aReceiver):
+    """
+    Find the module and name by which a receiver can be imported.
+
+    @param aReceiver: the receiver.
+
+    @return: its module name and its name.
+    @rtype: 2-L{tuple} of L{str}
+
+    @raise TypeError: if C{aReceiver} is not a receiver defined at the top
+        level of a module.
+    """
+    if not isinstance(aReceiver, _Tubule):
+        raise TypeError("{0!r} was not created with @receiver"
+                        .format(aReceiver))
+    received = aReceiver.received
+    moduleName = getattr(received, "__module__", None)
+    name = getattr(received, "__qualname__", None)
+    module = import_module(moduleName) if moduleName else None
+    if getattr(module, name or "", None) is not aReceiver:
+        raise TypeError("{0!r} is not defined at the top level of a module"
+                        .format(aReceiver))
+    return moduleName, name
@@ -16,7 +16,7 @@ __all__ = [
 from zope.interface import implementer, implementedBy
 
 from .kit import Pauser, beginFlowingFrom, beginFlowingTo, OncePause
-from .itube import StopFlowCalled, IDrain, IFount, ISegment
+from .itube import StopFlowCalled, IBatchDrain, IFount, ISegment
 from .listening import Flow
 
 from twisted.python.failure import Failure
@@ -36,6 +36,8 @@ if 0:
      IStreamServerEndpoint)
     from twisted.internet.defer import Deferred
     Deferred
+    from .itube import IDrain
+    IDrain
 
 
 
@@ -50,6 +52,8 @@ class _FountProducer(object):
     @ivar _pause: A pause if the fount has been paused by C{pauseProducing}
     @type _pause: L{IPause} or L{types.NoneType}
     """
+    __slots__ = ("_fount", "_pause")
+
     def __init__(self, fount):
         self._fount = fount
         self._pause = None
@@ -79,7 +83,7 @@ class _FountProducer(object):
 
 
 
-@implementer(IDrain)
+@implementer(IBatchDrain)
 class _TransportDrain(object):
     """
     A L{_TransportDrain} is an L{IDrain} that wraps around an object that
@@ -90,11 +94,13 @@ class _TransportDrain(object):
     @type _transport: L{IConsumer} / L{ITransport} provider.
     """
 
-    fount = None
+    __slots__ = ("_transport", "fount")
+
     inputType = ISegment
 
     def __init__(self, transport):
         self._transport = transport
+        self.fount = None
 
 
     def flowingFrom(self, fount):
@@ -122,6 +128,17 @@ class _TransportDrain(object):
         self._transport.write(item)
 
 
+    def receiveBatch(self, items):
+        """
+        Receive several items of data from the fount.  Pass them along to the
+        transport in a single call.
+
+        @param items: fragments of a stream of bytes.
+        @type items: L{list} of L{bytes}
+        """
+        self._transport.writeSequence(items)
+
+
     def flowStopped(self, reason):
         """
         The flow of data that should be written to the underlying transport has
@@ -157,7 +174,9 @@ class _TransportFount(object):
     @type _preReceiveBuffer: L{bytes} or L{types.NoneType}
     """
 
-    drain = None
+    __slots__ = ("_transport", "_pauser", "_preReceivePause",
+                 "_preReceiveBuffer", "drain")
+
     outputType = ISegment
 
     def __repr__(self):
@@ -166,6 +185,7 @@ class _TransportFount(object):
 
 
     def __init__(self, transport):
+        self.drain = None
         self._transport = transport
         self._pauser = Pauser(self._transport.pauseProducing,
                               self._transport.resumeProducing)
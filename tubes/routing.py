@@ -39,13 +39,19 @@ propagated to the "numbers" fount.  If you want to send on outputs to multiple
 drains which may have complex flow-control interrelationships, you can't do
 that by calling the C{receive} method directly since any one of those methods
 might reentrantly pause its fount.
+
+By default, each item sent to a L{Router} is offered to every route, which
+discards it unless it is addressed there.  If you have many routes, pass
+C{indexed=True} to L{Router}; each item will instead be looked up in a table of
+routes and delivered only to the route it is addressed to, with the same
+flow-control behavior.
 """
 
 from zope.interface import implementer
 
 from .tube import receiver, series
 from .itube import IDrain
-from .fan import Out
+from .fan import Out, _OutFount, _OutDrain, _Subscribers
 from .kit import beginFlowingFrom
 
 if 0:
@@ -134,6 +140,7 @@ class _To(object):
     """
     An object destined for a specific destination.
     """
+    __slots__ = ("_where", "_what")
 
     def __init__(self, where, what):
         """
@@ -173,21 +180,148 @@ def to(where, what):
 
 
 
+class _Route(_OutFount):
+    """
+    A route of an indexed L{Router}; a fount that the router's drain delivers
+    to directly.
+    """
+
+    def __init__(self, outputType, name, upstreamPauser, stopper):
+        """
+        Create a L{_Route}.
+
+        @param outputType: see L{IFount.outputType}
+
+        @param name: the name of this route, for debugging purposes.
+        @type name: native L{str} or L{None}
+
+        @param upstreamPauser: see L{_OutFount}
+
+        @param stopper: see L{_OutFount}
+        """
+        super(_Route, self).__init__(upstreamPauser, stopper)
+        self.outputType = outputType
+        self._name = name
+
+
+    def __repr__(self):
+        """
+        @return: an explanatory string including this route's name.
+        """
+        return "<Route {!r}>".format(self._name)
+
+
+
+class _RouterDrain(_OutDrain):
+    """
+    The drain of an indexed L{Router}, which looks up the destination of each
+    item in its table of routes, kept in the same L{_Subscribers} registry
+    that an L{Out} keeps its founts in, and delivers it to only that route.
+    """
+
+    def __init__(self, outputType):
+        """
+        Create a L{_RouterDrain}.
+
+        @param outputType: see L{Router}
+        """
+        super(_RouterDrain, self).__init__(_Subscribers())
+        self._outputType = outputType
+
+
+    @property
+    def inputType(self):
+        """
+        Implement the C{inputType} property as the routed version of the
+        router's output type.
+        """
+        return Routed(self._outputType)
+
+
+    def _newRoute(self, name):
+        """
+        Create a new route and add it to this drain's table.
+
+        @param name: see L{Router.newRoute}
+
+        @return: the new route.
+        @rtype: L{_Route}
+        """
+        route = _Route(self._outputType, name, self._pauser,
+                       self._founts.remove)
+        self._founts.add(route)
+        return route
+
+
+    def receive(self, item):
+        """
+        Deliver the value of a L{to} to the route it is addressed to.  Values
+        addressed to routes which have been stopped, or which belong to other
+        routers, are discarded.
+
+        @param item: a L{to}
+
+        @raise TypeError: if C{item} is not a L{to}.
+        """
+        if not isinstance(item, _To):
+            raise TypeError("{0} is not routed".format(item))
+        where = item._where
+        if where in self._founts._indexes:
+            where._deliverOne(item._what)
+
+
+    def receiveBatch(self, items):
+        """
+        Deliver the value of each of several L{to}s to the route it is
+        addressed to.
+
+        @param items: see L{IBatchDrain.receiveBatch}
+
+        @raise TypeError: if any of C{items} is not a L{to}.
+        """
+        routes = self._founts
+        for item in items:
+            if not isinstance(item, _To):
+                raise TypeError("{0} is not routed".format(item))
+            where = item._where
+            if where in routes._indexes:
+                where._deliverOne(item._what)
+
+
+
 class Router(object):
     """
     A drain with multiple founts that consumes L{Routed}C{(IX)} from its input
     and produces C{IX} to its outputs.
 
-    @ivar _out: A fan-out that consumes L{Routed}C{(X)} and produces C{X}.
-    @type _out: L{Out}
+    @ivar _out: A fan-out that consumes L{Routed}C{(X)} and produces C{X}, or
+        L{None} if this L{Router} is indexed.
+    @type _out: L{Out} or L{None}
 
     @ivar drain: The input to this L{Router}.
     @type drain: L{IDrain}
     """
 
-    def __init__(self, outputType=None):
-        self._out = Out()
+    def __init__(self, outputType=None, indexed=False):
+        """
+        Create a L{Router}.
+
+        @param outputType: The type of value produced by each route, and the
+            routed type (L{Routed}C{(outputType)}) required of its input.
+        @type outputType: L{ISpecification} or L{None}
+
+        @param indexed: If L{True}, dispatch each item by looking up its
+            destination in a table of routes and delivering it only to that
+            route, rather than offering it to every route's filter; each item
+            then costs the same no matter how many routes there are.
+        @type indexed: L{bool}
+        """
         self._outputType = outputType
+        if indexed:
+            self._out = None
+            self.drain = _RouterDrain(outputType)
+            return
+        self._out = Out()
         @implementer(IDrain)
         class NullDrain(object):
             inputType = outputType
@@ -218,6 +352,8 @@ class Router(object):
 
         @return: L{IFount}
         """
+        if self._out is None:
+            return self.drain._newRoute(name)
         @receiver(inputType=Routed(self._outputType),
                   outputType=self._outputType,
                   name=name)
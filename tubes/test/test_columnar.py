@@ -0,0 +1,173 @@
+# -*- test-case-name: tubes.test.test_columnar -*-
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Tests for L{tubes.columnar}.
+"""
+
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+from twisted.trial.unittest import SynchronousTestCase as TestCase
+
+from ..itube import StopFlowCalled
+from ..tube import tube, series
+from .util import FakeFount, FakeDrain
+
+try:
+    from ..columnar import recordsToColumns
+except ImportError:
+    recordsToColumns = None
+
+
+
+class RecordsToColumnsTests(TestCase):
+    """
+    Tests for L{recordsToColumns}.
+    """
+
+    if recordsToColumns is None:
+        skip = "NumPy is not installed."
+
+    def setUp(self):
+        """
+        Set up a fount, a drain and a clock.
+        """
+        self.ff = FakeFount()
+        self.fd = FakeDrain()
+        self.clock = Clock()
+
+
+    def flow(self, *stages, **kwargs):
+        """
+        Connect some stages, then a L{recordsToColumns}, between the fount
+        and the drain.
+
+        @param stages: tubes or drains to put before the batcher.
+
+        @param kwargs: keyword arguments for L{recordsToColumns}.
+        """
+        kwargs.setdefault("reactor", self.clock)
+        self.ff.flowTo(series(*(stages + (recordsToColumns(**kwargs),
+                                          self.fd))))
+
+
+    def batches(self):
+        """
+        Convert the batches the drain received to lists.
+
+        @return: a L{dict} mapping column names to L{list}s of values, for each
+            batch.
+        @rtype: L{list} of L{dict}
+        """
+        return [{column: array.tolist() for column, array in batch.items()}
+                for batch in self.fd.received]
+
+
+    def test_fullBatch(self):
+        """
+        A batch is emitted as soon as it has C{rows} records, which may be
+        tuples or dicts.
+        """
+        self.flow(columns=["x", "n"], rows=2, dtypes={"n": "int32"})
+        self.ff.drain.receive((1.5, 2))
+        self.assertEqual(self.fd.received, [])
+        self.ff.drain.receive({"x": 3.5, "n": 4})
+        self.ff.drain.receive((5.5, 6))
+        self.assertEqual(self.batches(), [{"x": [1.5, 3.5], "n": [2, 4]}])
+        self.assertEqual(self.fd.received[0]["n"].dtype.name, "int32")
+        self.assertEqual(self.fd.received[0]["x"].dtype.name, "float64")
+
+
+    def test_receiveBatch(self):
+        """
+        Records delivered together by an upstream tube are added to batches
+        together.
+        """
+        @tube
+        class Expand(object):
+            def received(self, count):
+                return [(value,) for value in range(count)]
+
+        self.flow(Expand(), columns=["v"], rows=3)
+        self.ff.drain.receive(7)
+        self.assertEqual(self.batches(), [{"v": [0, 1, 2]}, {"v": [3, 4, 5]}])
+
+
+    def test_mixedBatch(self):
+        """
+        Records received together must all be dicts or all be tuples;
+        otherwise, a L{TypeError} is raised, and none of them are added.
+        """
+        self.flow(columns=["v"], rows=2)
+        self.assertRaises(TypeError, self.ff.drain.receiveBatch,
+                          [(1,), (2,), {"v": 3}])
+        self.ff.drain.receiveBatch([{"v": 4}, {"v": 5}])
+        self.assertEqual(self.batches(), [{"v": [4, 5]}])
+
+
+    def test_maxDelay(self):
+        """
+        A batch is emitted C{maxDelay} seconds after its first record arrived,
+        with only as many rows as it has records.
+        """
+        self.flow(columns=["v"], rows=10, maxDelay=0.5)
+        self.ff.drain.receive((1,))
+        self.clock.advance(0.25)
+        self.ff.drain.receive((2,))
+        self.clock.advance(0.25)
+        self.assertEqual(self.batches(), [{"v": [1, 2]}])
+        self.clock.advance(10)
+        self.assertEqual(len(self.fd.received), 1)
+
+
+    def test_pauseAtBatchGranularity(self):
+        """
+        While the downstream drain is paused, records are accepted until a
+        batch is full, and then the upstream fount is paused until it has
+        been emitted.
+        """
+        self.flow(columns=["v"], rows=2)
+        pause = self.fd.fount.pauseFlow()
+        self.ff.drain.receive((1,))
+        self.assertEqual(self.ff.flowIsPaused, 0)
+        self.ff.drain.receive((2,))
+        self.assertEqual(self.ff.flowIsPaused, 1)
+        self.assertEqual(self.fd.received, [])
+        pause.unpause()
+        self.assertEqual(self.ff.flowIsPaused, 0)
+        self.assertEqual(self.batches(), [{"v": [1, 2]}])
+
+
+    def test_flowStopped(self):
+        """
+        When the flow stops, the records gathered so far are emitted, then the
+        downstream flow is stopped.
+        """
+        self.flow(columns=["v"], rows=10, maxDelay=1)
+        self.ff.drain.receive((1,))
+        reason = Failure(StopFlowCalled())
+        self.ff.drain.flowStopped(reason)
+        self.assertEqual(self.batches(), [{"v": [1]}])
+        self.assertEqual(self.fd.stopped, [reason])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+
+    def test_stopFlow(self):
+        """
+        Stopping the flow discards the records gathered so far and stops the
+        upstream fount.
+        """
+        self.flow(columns=["v"], rows=10, maxDelay=1)
+        self.ff.drain.receive((1,))
+        self.fd.fount.stopFlow()
+        self.assertEqual(self.ff.flowIsStopped, 1)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        self.assertEqual(self.fd.received, [])
+
+
+    def test_invalidRows(self):
+        """
+        A batch must have at least one row.
+        """
+        self.assertRaises(ValueError, recordsToColumns, ["v"], rows=0)
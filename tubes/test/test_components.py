@@ -0,0 +1,157 @@
+# -*- test-case-name: tubes.test.test_components -*-
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Tests for L{tubes._components}.
+"""
+
+from threading import Thread
+
+from zope.interface import Interface, implementer, directlyProvides
+
+from twisted.trial.unittest import SynchronousTestCase as TestCase
+from twisted.python.components import registerAdapter, globalRegistry
+
+from .._components import _adapterUsing, _registryAdapting
+from ..tube import series
+from .util import PassthruTube, FakeFount, FakeDrain
+
+
+
+class IFoo(Interface):
+    """
+    An interface to adapt from.
+    """
+
+
+
+class IBar(Interface):
+    """
+    An interface to adapt to.
+    """
+
+
+
+@implementer(IFoo)
+class Foo(object):
+    """
+    A provider of L{IFoo}.
+    """
+
+
+
+@implementer(IBar)
+class Bar(object):
+    """
+    A provider of L{IBar}, adapted from something else.
+    """
+
+    def __init__(self, original):
+        """
+        @param original: the object that was adapted.
+        """
+        self.original = original
+
+
+
+class AdapterUsingTests(TestCase):
+    """
+    Tests for L{_adapterUsing}.
+    """
+
+    def setUp(self):
+        """
+        Create an adapter function for a registry adapting L{IFoo} to
+        L{IBar}.
+        """
+        self.adapt = _adapterUsing(_registryAdapting((IFoo, IBar, Bar)),
+                                   IBar)
+
+
+    def test_adapts(self):
+        """
+        The adapter function adapts objects using the registry.
+        """
+        foo = Foo()
+        bar = self.adapt(foo)
+        self.assertIsInstance(bar, Bar)
+        self.assertIdentical(bar.original, foo)
+
+
+    def test_alreadyProvides(self):
+        """
+        An object which already provides the interface is returned as is.
+        """
+        bar = Bar(None)
+        self.assertIdentical(self.adapt(bar), bar)
+
+
+    def test_directlyProvides(self):
+        """
+        An object which directly provides an interface its class does not is
+        adapted according to the interfaces it provides.
+        """
+        class Plain(object):
+            pass
+        self.assertRaises(TypeError, self.adapt, Plain())
+        plain = Plain()
+        directlyProvides(plain, IFoo)
+        self.assertIdentical(self.adapt(plain).original, plain)
+
+
+    def test_notAdaptable(self):
+        """
+        An object which can't be adapted causes L{TypeError}.
+        """
+        self.assertRaises(TypeError, self.adapt, object())
+
+
+    def test_notGlobal(self):
+        """
+        The registry's adapters are not used when calling the interface.
+        """
+        self.assertRaises(TypeError, IBar, Foo())
+
+
+    def test_globalFallback(self):
+        """
+        If the registry has no suitable adapter, globally-registered adapters
+        are used.
+        """
+        class Baz(object):
+            pass
+        registerAdapter(Bar, Baz, IBar)
+        self.addCleanup(globalRegistry.unregister, [Baz], IBar, '', Bar)
+        self.assertIsInstance(self.adapt(Baz()), Bar)
+
+
+
+class SeriesThreadTests(TestCase):
+    """
+    Tests for calling L{series} from multiple threads.
+    """
+
+    def test_concurrentSeries(self):
+        """
+        L{series} can be called from several threads at once.
+        """
+        errors = []
+
+        def build():
+            try:
+                for ignored in range(200):
+                    ff = FakeFount()
+                    fd = FakeDrain()
+                    ff.flowTo(series(PassthruTube(), PassthruTube(), fd))
+                    ff.drain.receive(1)
+                    assert fd.received == [1]
+            except BaseException as e:
+                errors.append(e)
+
+        threads = [Thread(target=build) for ignored in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
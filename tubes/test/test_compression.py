@@ -0,0 +1,243 @@
+# -*- test-case-name: tubes.test.test_compression -*-
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Tests for L{tubes.compression}.
+"""
+
+import zlib
+
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+from twisted.trial.unittest import SynchronousTestCase as TestCase
+
+from ..compression import (bytesToCompressed, compressedToBytes,
+                           DecompressionLimitExceeded)
+from ..itube import StopFlowCalled
+from ..tube import series
+from .util import FakeFount, FakeDrain
+
+_formats = ["zlib", "gzip", "lzma", "bz2"]
+
+
+
+def compress(stage, *segments):
+    """
+    Pass some segments to a compressor, then stop the flow.
+
+    @param stage: a tube or drain from L{bytesToCompressed}.
+
+    @param segments: L{bytes} segments.
+
+    @return: the drain which the compressed segments flowed to.
+    @rtype: L{FakeDrain}
+    """
+    ff = FakeFount()
+    fd = FakeDrain()
+    ff.flowTo(series(stage, fd))
+    for segment in segments:
+        ff.drain.receive(segment)
+    ff.drain.flowStopped(Failure(StopFlowCalled()))
+    return fd
+
+
+
+def decompress(format, *segments):
+    """
+    Decompress some segments.
+
+    @param format: the name of the compression format.
+
+    @param segments: L{bytes} segments of compressed data.
+
+    @return: the decompressed data.
+    @rtype: L{bytes}
+    """
+    ff = FakeFount()
+    fd = FakeDrain()
+    ff.flowTo(series(compressedToBytes(format), fd))
+    for segment in segments:
+        ff.drain.receive(segment)
+    return b"".join(fd.received)
+
+
+
+class CompressionTests(TestCase):
+    """
+    Tests for L{bytesToCompressed} and L{compressedToBytes}.
+    """
+
+    def test_roundTrip(self):
+        """
+        Each format's compressed stream decompresses to the original data,
+        even when cut into single bytes.
+        """
+        data = [b"hello ", b"compressed ", b"world" * 100]
+        for format in _formats:
+            for flush in [None, "segment", 64]:
+                fd = compress(bytesToCompressed(format, flush=flush), *data)
+                compressed = b"".join(fd.received)
+                self.assertEqual(decompress(format, compressed),
+                                 b"".join(data), (format, flush))
+                self.assertEqual(
+                    decompress(format, *[compressed[i:i + 1]
+                                         for i in range(len(compressed))]),
+                    b"".join(data), (format, flush))
+
+
+    def test_interoperable(self):
+        """
+        zlib and gzip streams can be decompressed by L{zlib} itself.
+        """
+        fd = compress(bytesToCompressed("zlib"), b"some data")
+        self.assertEqual(zlib.decompress(b"".join(fd.received)), b"some data")
+        fd = compress(bytesToCompressed("gzip"), b"some data")
+        self.assertEqual(zlib.decompress(b"".join(fd.received),
+                                         16 + zlib.MAX_WBITS), b"some data")
+
+
+    def test_flushEverySegment(self):
+        """
+        By default, each segment's compressed data is emitted as soon as it
+        is received, and can be decompressed right away.
+        """
+        for format in _formats:
+            ff = FakeFount()
+            fd = FakeDrain()
+            ff.flowTo(series(bytesToCompressed(format), fd))
+            ff.drain.receive(b"first")
+            ff.drain.receive(b"second")
+            self.assertEqual(len(fd.received), 2, format)
+            self.assertEqual(decompress(format, fd.received[0]), b"first")
+            self.assertEqual(decompress(format, *fd.received),
+                             b"firstsecond")
+
+
+    def test_flushEveryNBytes(self):
+        """
+        Given a number of bytes, the compressed stream is flushed once at
+        least that many bytes have been received since the last flush.
+        """
+        ff = FakeFount()
+        fd = FakeDrain()
+        ff.flowTo(series(bytesToCompressed(flush=10), fd))
+        ff.drain.receive(b"12345")
+        self.assertEqual(decompress("zlib", *fd.received), b"")
+        ff.drain.receive(b"67890")
+        self.assertEqual(decompress("zlib", *fd.received), b"1234567890")
+        ff.drain.receive(b"abc")
+        self.assertEqual(decompress("zlib", *fd.received), b"1234567890")
+
+
+    def test_flushWhenIdle(self):
+        """
+        With C{flush="idle"}, the segments compressed in one reactor turn are
+        emitted as one flushed segment at the end of the turn.
+        """
+        clock = Clock()
+        ff = FakeFount()
+        fd = FakeDrain()
+        ff.flowTo(series(bytesToCompressed("zlib", flush="idle",
+                                           reactor=clock), fd))
+        ff.drain.receive(b"one")
+        ff.drain.receive(b"two")
+        self.assertEqual(fd.received, [])
+        clock.advance(0)
+        self.assertEqual(len(fd.received), 1)
+        self.assertEqual(decompress("zlib", *fd.received), b"onetwo")
+        ff.drain.receive(b"three")
+        reason = Failure(StopFlowCalled())
+        ff.drain.flowStopped(reason)
+        self.assertEqual(zlib.decompress(b"".join(fd.received)),
+                         b"onetwothree")
+        self.assertEqual(fd.stopped, [reason])
+
+
+    def test_flushWhenResumed(self):
+        """
+        With C{flush="idle"}, nothing is emitted while the downstream drain
+        is paused, and everything compressed meanwhile is flushed when it
+        resumes.
+        """
+        clock = Clock()
+        ff = FakeFount()
+        fd = FakeDrain()
+        ff.flowTo(series(bytesToCompressed("lzma", flush="idle",
+                                           reactor=clock), fd))
+        pause = fd.fount.pauseFlow()
+        ff.drain.receive(b"waiting")
+        clock.advance(0)
+        self.assertEqual(fd.received, [])
+        pause.unpause()
+        self.assertEqual(decompress("lzma", *fd.received), b"waiting")
+
+
+    def test_reusable(self):
+        """
+        The result of L{bytesToCompressed} may be used in several pipelines,
+        each of which gets its own compressed stream.
+        """
+        clock = Clock()
+        for flush in ["segment", None, "idle"]:
+            compressor = bytesToCompressed("gzip", flush=flush,
+                                           reactor=clock)
+            first = FakeFount()
+            second = FakeFount()
+            firstOut = FakeDrain()
+            secondOut = FakeDrain()
+            first.flowTo(series(compressor, firstOut))
+            second.flowTo(series(compressor, secondOut))
+            first.drain.receive(b"first")
+            second.drain.receive(b"second")
+            for ff in [first, second]:
+                ff.drain.flowStopped(Failure(StopFlowCalled()))
+            self.assertEqual(
+                [zlib.decompress(b"".join(fd.received), 16 + zlib.MAX_WBITS)
+                 for fd in [firstOut, secondOut]],
+                [b"first", b"second"], flush
+            )
+
+
+    def test_decompressionLimit(self):
+        """
+        A segment which decompresses to more than C{maxOutput} bytes stops
+        the flow with L{DecompressionLimitExceeded}, without decompressing
+        all of it.
+        """
+        bomb = zlib.compress(b"\x00" * (10 * 1024 * 1024))
+        ff = FakeFount()
+        fd = FakeDrain()
+        ff.flowTo(series(compressedToBytes(maxOutput=1024), fd))
+        ff.drain.receive(bomb)
+        self.assertEqual(fd.received, [])
+        fd.stopped[0].trap(DecompressionLimitExceeded)
+        self.assertEqual(fd.stopped[0].value.maxOutput, 1024)
+        self.assertEqual(
+            len(self.flushLoggedErrors(DecompressionLimitExceeded)), 1
+        )
+
+
+    def test_limitIsPerSegment(self):
+        """
+        The limit applies to each segment, not to the whole stream.
+        """
+        compressed = zlib.compress(b"x" * 3000)
+        self.assertEqual(decompress("zlib", compressed[:len(compressed) // 2],
+                                    compressed[len(compressed) // 2:]),
+                         b"x" * 3000)
+        ff = FakeFount()
+        fd = FakeDrain()
+        ff.flowTo(series(compressedToBytes(maxOutput=2000), fd))
+        for segment in [zlib.compress(b"x" * 1500)] * 2:
+            ff.drain.receive(segment)
+        self.assertEqual(b"".join(fd.received), b"x" * 3000)
+
+
+    def test_unknownFormat(self):
+        """
+        Unknown formats and flush policies are rejected.
+        """
+        self.assertRaises(ValueError, bytesToCompressed, "zip")
+        self.assertRaises(ValueError, compressedToBytes, "zip")
+        self.assertRaises(ValueError, bytesToCompressed, flush="sometimes")
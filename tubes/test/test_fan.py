@@ -8,13 +8,15 @@ Tests for L{tubes.fan}.
 
 from zope.interface.verify import verifyObject
 
+from twisted.python.failure import Failure
 from twisted.trial.unittest import SynchronousTestCase
 
-from ..itube import IFount, IDrain
+from ..itube import IFount, IDrain, IBatchDrain, StopFlowCalled
 
-from ..test.util import FakeFount, FakeDrain
-from ..tube import receiver, series
-from ..fan import Out, In, Thru
+from ..test.util import FakeFount, FakeDrain, FakeBatchDrain
+from ..tube import receiver, series, tube
+from ..fan import Out, In, Thru, Broadcast, SlowDrain, _Subscribers
+from ..framing import linesToBytes
 
 
 class FakeIntermediateDrain(FakeDrain):
@@ -265,6 +267,332 @@ class FanOutTests(SynchronousTestCase):
 
 
 
+class SubscribersTests(SynchronousTestCase):
+    """
+    Tests for L{tubes.fan._Subscribers}, the registry of a fan.L{Out}'s
+    founts.
+    """
+
+    def test_orderAfterRemovals(self):
+        """
+        Founts are iterated over in the order they were added, skipping any
+        which were removed, including after the registry has been compacted.
+        """
+        subscribers = _Subscribers()
+        for n in range(1, 11):
+            subscribers.add(n)
+        for n in range(1, 11, 3):
+            subscribers.remove(n)
+        self.assertEqual(list(subscribers), [2, 3, 5, 6, 8, 9])
+        for n in [2, 5, 8]:
+            subscribers.remove(n)
+        subscribers.remove(8)
+        subscribers.add(11)
+        self.assertEqual(list(subscribers), [3, 6, 9, 11])
+        self.assertEqual(len(subscribers), 4)
+        self.assertIn(11, subscribers)
+        self.assertNotIn(8, subscribers)
+
+
+    def test_changesDuringIteration(self):
+        """
+        Founts added while iterating are not included in that iteration;
+        founts removed while iterating are skipped if they have not been
+        reached yet.
+        """
+        subscribers = _Subscribers()
+        for n in range(1, 6):
+            subscribers.add(n)
+        seen = []
+        for n in subscribers:
+            seen.append(n)
+            if n == 1:
+                subscribers.add(6)
+                subscribers.remove(2)
+                subscribers.remove(4)
+        self.assertEqual(seen, [1, 3, 5])
+        self.assertEqual(list(subscribers), [1, 3, 5, 6])
+
+
+    def test_subscribeInReceive(self):
+        """
+        A fount created while L{Out.drain} is delivering an item does not
+        receive that item, but receives the next one.
+        """
+        ff = FakeFount()
+        out = Out()
+        ff.flowTo(out.drain)
+        late = FakeDrain()
+        class Subscribing(FakeDrain):
+            def receive(self, item):
+                super(Subscribing, self).receive(item)
+                if late.fount is None:
+                    out.newFount().flowTo(late)
+        out.newFount().flowTo(Subscribing())
+        ff.drain.receive(1)
+        ff.drain.receive(2)
+        self.assertEqual(late.received, [2])
+
+
+
+class FanOutBatchTests(SynchronousTestCase):
+    """
+    Tests for L{tubes.fan.Out} receiving batches of items.
+    """
+
+    def setUp(self):
+        """
+        Create an L{Out} with a fount flowing into it.
+        """
+        self.ff = FakeFount()
+        self.out = Out()
+        self.ff.flowTo(self.out.drain)
+
+
+    def test_provides(self):
+        """
+        L{Out.drain} provides L{IBatchDrain}.
+        """
+        verifyObject(IBatchDrain, self.out.drain)
+
+
+    def test_batchToBatchDrains(self):
+        """
+        A batch received by L{Out.drain} is passed on whole to each
+        L{IBatchDrain} and one item at a time to each other L{IDrain}.
+        """
+        batchDrain = FakeBatchDrain()
+        plainDrain = FakeDrain()
+        self.out.newFount().flowTo(batchDrain)
+        self.out.newFount().flowTo(plainDrain)
+        self.ff.drain.receiveBatch([1, 2, 3])
+        self.assertEqual(batchDrain.batches, [[1, 2, 3]])
+        self.assertEqual(plainDrain.received, [1, 2, 3])
+
+
+    def test_pausedFountBuffersBatch(self):
+        """
+        A batch received while one of L{Out}'s founts is paused is buffered by
+        that fount rather than delivered as a batch, and all of it is
+        delivered when the fount resumes.
+        """
+        batchDrain = FakeBatchDrain()
+        self.out.newFount().flowTo(batchDrain)
+        pause = batchDrain.fount.pauseFlow()
+        self.ff.drain.receiveBatch([1, 2])
+        self.assertEqual(batchDrain.received, [])
+        pause.unpause()
+        self.assertEqual(batchDrain.batches, [])
+        self.assertEqual(batchDrain.received, [1, 2])
+
+
+    def test_pausedPartwayThroughBatch(self):
+        """
+        If a drain pauses partway through a batch delivered one item at a
+        time, the rest of the batch is delivered to it when it resumes, before
+        any later items.
+        """
+        @tube
+        class Triple(object):
+            def received(self, item):
+                return [item + "1", item + "2", item + "3"]
+        pauses = []
+        class PauseOnce(FakeDrain):
+            def receive(self, item):
+                super(PauseOnce, self).receive(item)
+                if not pauses:
+                    pauses.append(self.fount.pauseFlow())
+        fd = PauseOnce()
+        self.out.newFount().flowTo(fd)
+        ff = FakeFount()
+        ff.flowTo(series(Triple(), self.out.drain))
+        ff.drain.receive("a")
+        self.assertEqual(fd.received, ["a1"])
+        pauses[0].unpause()
+        ff.drain.receive("b")
+        self.assertEqual(fd.received, ["a1", "a2", "a3", "b1", "b2", "b3"])
+
+
+
+class FanOutBufferTests(SynchronousTestCase):
+    """
+    Tests for L{tubes.fan.Out} with a buffer for each fount.
+    """
+
+    def flow(self, bufferSize, overflow):
+        """
+        Create an L{Out} with a fount flowing into it, and two founts of its
+        own flowing to drains; pause the first drain.
+
+        @param bufferSize: see L{Out}
+
+        @param overflow: see L{Out}
+
+        @return: the pause of the first drain.
+        """
+        self.ff = FakeFount()
+        self.out = Out(bufferSize, overflow)
+        self.ff.flowTo(self.out.drain)
+        self.slow = FakeDrain()
+        self.fast = FakeDrain()
+        self.out.newFount().flowTo(self.slow)
+        self.out.newFount().flowTo(self.fast)
+        return self.slow.fount.pauseFlow()
+
+
+    def test_slowDrainDoesNotPauseOthers(self):
+        """
+        While one fount's drain is paused, items are buffered for it without
+        pausing the upstream fount, and the other founts keep delivering.
+        When it resumes, it receives every buffered item, in order.
+        """
+        pause = self.flow(3, "pause")
+        for item in [1, 2, 3]:
+            self.ff.drain.receive(item)
+        self.assertEqual(self.ff.flowIsPaused, 0)
+        self.assertEqual(self.slow.received, [])
+        self.assertEqual(self.fast.received, [1, 2, 3])
+        pause.unpause()
+        self.assertEqual(self.slow.received, [1, 2, 3])
+
+
+    def test_overflowPauses(self):
+        """
+        Under the C{"pause"} policy, a full buffer pauses the upstream fount
+        until it has been delivered.
+        """
+        pause = self.flow(2, "pause")
+        for item in [1, 2, 3]:
+            self.ff.drain.receive(item)
+        self.assertEqual(self.ff.flowIsPaused, 1)
+        self.assertEqual(self.out.overflowPauses, 1)
+        pause.unpause()
+        self.assertEqual(self.ff.flowIsPaused, 0)
+        self.assertEqual(self.slow.received, [1, 2, 3])
+
+
+    def test_dropOldest(self):
+        """
+        Under the C{"dropOldest"} policy, a full buffer drops its oldest item
+        to make room, and counts it.
+        """
+        pause = self.flow(2, "dropOldest")
+        for item in [1, 2, 3, 4]:
+            self.ff.drain.receive(item)
+        self.assertEqual(self.ff.flowIsPaused, 0)
+        self.assertEqual((self.out.dropped, self.slow.fount.dropped), (2, 2))
+        pause.unpause()
+        self.assertEqual(self.slow.received, [3, 4])
+        self.assertEqual(self.fast.received, [1, 2, 3, 4])
+
+
+    def test_dropNewest(self):
+        """
+        Under the C{"dropNewest"} policy, items which arrive when the buffer
+        is full are dropped, and counted.
+        """
+        pause = self.flow(2, "dropNewest")
+        for item in [1, 2, 3, 4]:
+            self.ff.drain.receive(item)
+        self.assertEqual(self.out.dropped, 2)
+        pause.unpause()
+        self.assertEqual(self.slow.received, [1, 2])
+
+
+    def test_disconnect(self):
+        """
+        Under the C{"disconnect"} policy, a fount whose buffer overflows stops
+        flowing to its drain with a L{SlowDrain} failure, and is counted;
+        other founts keep delivering.
+        """
+        pause = self.flow(2, "disconnect")
+        for item in [1, 2, 3, 4]:
+            self.ff.drain.receive(item)
+        self.assertEqual(self.out.disconnected, 1)
+        self.assertEqual(len(self.slow.stopped), 1)
+        self.slow.stopped[0].trap(SlowDrain)
+        self.assertEqual(self.slow.stopped[0].value.bufferSize, 2)
+        self.assertEqual(self.fast.received, [1, 2, 3, 4])
+        pause.unpause()
+        self.slow.fount.stopFlow()
+        self.assertEqual(self.slow.received, [])
+        self.assertFalse(self.ff.flowIsStopped)
+
+
+    def test_flowStoppedAfterBuffer(self):
+        """
+        When the flow stops while items are buffered for a paused drain, the
+        drain's flow stops after they have been delivered.
+        """
+        pause = self.flow(2, "dropNewest")
+        self.ff.drain.receive(1)
+        reason = Failure(StopFlowCalled())
+        self.ff.drain.flowStopped(reason)
+        self.assertEqual(self.fast.stopped, [reason])
+        self.assertEqual(self.slow.stopped, [])
+        pause.unpause()
+        self.assertEqual(self.slow.received, [1])
+        self.assertEqual(self.slow.stopped, [reason])
+
+
+    def test_invalidPolicy(self):
+        """
+        Unknown policies, policies other than C{"pause"} without a buffer
+        size, and empty buffers are rejected.
+        """
+        self.assertRaises(ValueError, Out, 1, "sometimes")
+        self.assertRaises(ValueError, Out, None, "dropOldest")
+        self.assertRaises(ValueError, Out, 0)
+
+
+
+class BroadcastTests(SynchronousTestCase):
+    """
+    Tests for L{tubes.fan.Broadcast}.
+    """
+
+    def test_stagesRunOnce(self):
+        """
+        The stages given to L{Broadcast} run once for each item, and every
+        fount's drain receives the same output object.
+        """
+        calls = []
+        @receiver()
+        def encode(item):
+            calls.append(item)
+            yield item.encode("ascii")
+        ff = FakeFount()
+        broadcast = Broadcast(encode, linesToBytes())
+        ff.flowTo(broadcast.drain)
+        drains = [FakeDrain() for ignored in range(3)]
+        for drain in drains:
+            broadcast.newFount().flowTo(drain)
+        ff.drain.receive("hello")
+        self.assertEqual(calls, ["hello"])
+        self.assertEqual([drain.received for drain in drains],
+                         [[b"hello\r\n"]] * 3)
+        self.assertIdentical(drains[0].received[0], drains[2].received[0])
+
+
+    def test_pauseReachesUpstream(self):
+        """
+        Pausing one of a L{Broadcast}'s founts pauses the fount flowing into
+        its shared stages, unless it has a buffer.
+        """
+        ff = FakeFount()
+        broadcast = Broadcast(receiver()(lambda item: [item]))
+        ff.flowTo(broadcast.drain)
+        broadcast.newFount().pauseFlow()
+        self.assertEqual(ff.flowIsPaused, 1)
+
+        ff = FakeFount()
+        broadcast = Broadcast(receiver()(lambda item: [item]), bufferSize=1)
+        ff.flowTo(broadcast.drain)
+        broadcast.newFount().pauseFlow()
+        self.assertEqual(ff.flowIsPaused, 0)
+
+
+
 class FanInTests(SynchronousTestCase):
     """
     Tests for L{tubes.fan.In}.
@@ -406,6 +734,208 @@ class FanInTests(SynchronousTestCase):
 
 
 
+class FanInBookkeepingTests(SynchronousTestCase):
+    """
+    Tests for the bookkeeping of L{tubes.fan.In}'s drains.
+    """
+
+    def test_drainWithoutFount(self):
+        """
+        Pausing and resuming L{In.fount} skips drains which have no fount.
+        """
+        fanIn = In()
+        fd = FakeDrain()
+        fanIn.fount.flowTo(fd)
+        fanIn.newDrain()
+        ff = FakeFount()
+        ff.flowTo(fanIn.newDrain())
+        pause = fd.fount.pauseFlow()
+        self.assertEqual(ff.flowIsPaused, 1)
+        pause.unpause()
+        self.assertEqual(ff.flowIsPaused, 0)
+
+
+    def test_stoppedDrainsForgotten(self):
+        """
+        Once its fount stops, a drain is no longer paused or stopped along
+        with L{In.fount}, and stopping again is harmless.
+        """
+        fanIn = In()
+        fd = FakeDrain()
+        fanIn.fount.flowTo(fd)
+        stopped = FakeFount()
+        drain = fanIn.newDrain()
+        stopped.flowTo(drain)
+        remaining = FakeFount()
+        remaining.flowTo(fanIn.newDrain())
+        drain.flowStopped(None)
+        drain.flowStopped(None)
+        fd.fount.pauseFlow()
+        self.assertEqual((stopped.flowIsPaused, remaining.flowIsPaused),
+                         (0, 1))
+        fd.fount.stopFlow()
+        self.assertEqual((stopped.flowIsStopped, remaining.flowIsStopped),
+                         (0, 1))
+
+
+
+class FairFanInTests(SynchronousTestCase):
+    """
+    Tests for L{tubes.fan.In} with a buffer for each drain.
+    """
+
+    def flow(self, bufferSize, *weights):
+        """
+        Create an L{In} flowing to a drain, and a fount flowing into a new
+        drain of the L{In} for each weight.
+
+        @param bufferSize: see L{In}
+
+        @param weights: see L{In.newDrain}
+
+        @return: the founts.
+        @rtype: L{list} of L{FakeFount}
+        """
+        self.fanIn = In(bufferSize)
+        self.fd = FakeDrain()
+        self.fanIn.fount.flowTo(self.fd)
+        founts = []
+        for weight in weights:
+            ff = FakeFount()
+            ff.flowTo(self.fanIn.newDrain(weight))
+            founts.append(ff)
+        return founts
+
+
+    def test_passThrough(self):
+        """
+        While the L{In}'s fount is flowing, items are delivered as they are
+        received.
+        """
+        a, b = self.flow(2, 1, 1)
+        a.drain.receive("a1")
+        b.drain.receive("b1")
+        self.assertEqual(self.fd.received, ["a1", "b1"])
+
+
+    def test_onlyFullBuffersPause(self):
+        """
+        Pausing the L{In}'s fount does not pause the founts flowing into it;
+        only a fount whose drain's buffer fills up is paused, until the
+        buffer has room again.
+        """
+        a, b = self.flow(2, 1, 1)
+        pause = self.fd.fount.pauseFlow()
+        self.assertEqual((a.flowIsPaused, b.flowIsPaused), (0, 0))
+        a.drain.receive("a1")
+        a.drain.receive("a2")
+        b.drain.receive("b1")
+        self.assertEqual((a.flowIsPaused, b.flowIsPaused), (1, 0))
+        self.assertEqual(self.fd.received, [])
+        pause.unpause()
+        self.assertEqual((a.flowIsPaused, b.flowIsPaused), (0, 0))
+        self.assertEqual(self.fd.received, ["a1", "b1", "a2"])
+
+
+    def test_roundRobin(self):
+        """
+        Buffered items are delivered in rounds, one from each drain with
+        buffered items, so items from a quiet fount don't wait behind a
+        flood.
+        """
+        a, b, c = self.flow(4, 1, 1, 1)
+        pause = self.fd.fount.pauseFlow()
+        for item in ["a1", "a2", "a3", "a4"]:
+            a.drain.receive(item)
+        b.drain.receive("b1")
+        c.drain.receive("c1")
+        c.drain.receive("c2")
+        pause.unpause()
+        self.assertEqual(self.fd.received,
+                         ["a1", "b1", "c1", "a2", "c2", "a3", "a4"])
+
+
+    def test_weighted(self):
+        """
+        Each drain delivers as many buffered items in each round as its
+        weight.
+        """
+        a, b = self.flow(4, 2, 1)
+        pause = self.fd.fount.pauseFlow()
+        for item in ["a1", "a2", "a3", "a4"]:
+            a.drain.receive(item)
+        b.drain.receive("b1")
+        b.drain.receive("b2")
+        pause.unpause()
+        self.assertEqual(self.fd.received,
+                         ["a1", "a2", "b1", "a3", "a4", "b2"])
+
+
+    def test_pauseDuringDelivery(self):
+        """
+        If the downstream drain pauses while buffered items are being
+        delivered, delivery stops, and resumes where it left off, including
+        the rest of the current drain's turn.
+        """
+        a, b = self.flow(4, 2, 1)
+        pause = self.fd.fount.pauseFlow()
+        for item in ["a1", "a2", "a3"]:
+            a.drain.receive(item)
+        b.drain.receive("b1")
+        pauses = []
+        class PauseOnce(FakeDrain):
+            def receive(self, item):
+                super(PauseOnce, self).receive(item)
+                if not pauses:
+                    pauses.append(self.fount.pauseFlow())
+        downstream = PauseOnce()
+        self.fanIn.fount.flowTo(downstream)
+        pause.unpause()
+        self.assertEqual(downstream.received, ["a1"])
+        pauses[0].unpause()
+        self.assertEqual(downstream.received, ["a1", "a2", "b1", "a3"])
+
+
+    def test_stoppedFountDeliversBuffer(self):
+        """
+        Items buffered for a drain whose fount stops are still delivered.
+        """
+        [a] = self.flow(2, 1)
+        pause = self.fd.fount.pauseFlow()
+        a.drain.receive("a1")
+        a.drain.flowStopped(None)
+        pause.unpause()
+        self.assertEqual(self.fd.received, ["a1"])
+
+
+    def test_lazyPause(self):
+        """
+        With a buffer of one item, pausing the L{In}'s fount pauses only the
+        founts which deliver an item while it is paused, and resuming it
+        resumes only those founts.
+        """
+        founts = self.flow(1, *[1] * 5)
+        pause = self.fd.fount.pauseFlow()
+        self.assertEqual([ff.flowIsPaused for ff in founts], [0] * 5)
+        founts[3].drain.receive("x")
+        self.assertEqual([ff.flowIsPaused for ff in founts], [0, 0, 0, 1, 0])
+        late = FakeFount()
+        late.flowTo(self.fanIn.newDrain())
+        self.assertEqual(late.flowIsPaused, 0)
+        pause.unpause()
+        self.assertEqual([ff.flowIsPaused for ff in founts], [0] * 5)
+        self.assertEqual(self.fd.received, ["x"])
+
+
+    def test_invalid(self):
+        """
+        Buffers must hold at least one item, and weights must be at least 1.
+        """
+        self.assertRaises(ValueError, In, 0)
+        self.assertRaises(ValueError, In(1).newDrain, 0)
+
+
+
 class FanThruTests(SynchronousTestCase):
     """
     Tests for L{Thru}.
@@ -4,15 +4,92 @@
 Tests for framing protocols.
 """
 
-from unittest import TestCase
+from struct import pack
+
+from zope.interface import implementer
+
+from twisted.trial.unittest import SynchronousTestCase as TestCase
 
 from ..framing import bytesToNetstrings
 
 from ..test.util import FakeFount, FakeDrain
-from ..tube import tube, series
+from ..tube import tube, series, PipelineTemplate
 
 from ..framing import (netstringsToBytes, bytesToLines, linesToBytes,
-                       bytesToIntPrefixed, intPrefixedToBytes)
+                       bytesToIntPrefixed, intPrefixedToBytes,
+                       bytesDelimitedBy, FrameTooLong, FrameHeader,
+                       bytesToVarintPrefixed, varintPrefixedToBytes,
+                       bytesToRecords, bytesToRecordArrays)
+
+from ..itube import StopFlowCalled, IBatchDrain
+
+from twisted.internet.task import Clock
+from twisted.protocols.basic import NetstringParseError, StringTooLongError
+from twisted.python.failure import Failure
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+
+def flowThrough(aTube, *segments):
+    """
+    Pass some segments to a tube.
+
+    @param aTube: a parser.
+
+    @param segments: L{bytes} segments.
+
+    @return: the drain which the tube's output flowed to.
+    @rtype: L{FakeDrain}
+    """
+    ff = FakeFount()
+    fd = FakeDrain()
+    ff.flowTo(series(aTube)).flowTo(fd)
+    for segment in segments:
+        ff.drain.receive(segment)
+    return fd
+
+
+
+def parse(aTube, *segments):
+    """
+    Pass some segments to a tube.
+
+    @param aTube: a parser.
+
+    @param segments: L{bytes} segments.
+
+    @return: the frames which the parser produced.
+    @rtype: L{list}
+    """
+    return flowThrough(aTube, *segments).received
+
+
+
+def assertFlowFails(testCase, exceptionType, aTube, *segments):
+    """
+    Assert that passing some segments to a tube stops its flow with an
+    exception.
+
+    @param testCase: the test case.
+    @type testCase: L{TestCase}
+
+    @param exceptionType: the type of the exception.
+
+    @param aTube: a parser.
+
+    @param segments: L{bytes} segments.
+
+    @return: the exception.
+    """
+    fd = flowThrough(aTube, *segments)
+    testCase.assertEqual(len(fd.stopped), 1)
+    fd.stopped[0].trap(exceptionType)
+    testCase.assertEqual(len(testCase.flushLoggedErrors(exceptionType)), 1)
+    return fd.stopped[0].value
 
 class NetstringTests(TestCase):
     """
@@ -62,6 +139,41 @@ class NetstringTests(TestCase):
         self.assertEqual(fd.received, [b"x", b"yz"])
 
 
+    def test_netstringAcrossSegments(self):
+        """
+        A netstring's length, payload and comma may arrive in different
+        segments.
+        """
+        self.assertEqual(parse(netstringsToBytes(), b"1", b"2:hello", b" ",
+                               b"world!", b",0:,"),
+                         [b"hello world!", b""])
+
+
+    def test_invalidNetstring(self):
+        """
+        Netstrings with lengths which aren't digits, have leading zeros or
+        which aren't followed by a comma can't be parsed.
+        """
+        for data in [b"x:", b"01:x,", b"1:xy", b"123"]:
+            assertFlowFails(self, NetstringParseError,
+                            netstringsToBytes(), b"1:a," + data + b"q")
+
+
+    def test_netstringTooLong(self):
+        """
+        A netstring longer than 99999 bytes can't be parsed, even before its
+        whole length has been received.
+        """
+        error = assertFlowFails(self, FrameTooLong, netstringsToBytes(),
+                                b"100000:")
+        self.assertEqual((error.length, error.maxLength), (100000, 99999))
+        for header in [b"1000000:", b"1000000"]:
+            error = assertFlowFails(self, FrameTooLong, netstringsToBytes(),
+                                    header)
+            self.assertIs(error.length, None)
+            self.assertNotIn("100000-byte", str(error))
+
+
 
 class LineTests(TestCase):
     """
@@ -82,6 +194,65 @@ class LineTests(TestCase):
         splitALine(b"\r\n")
 
 
+    def test_carriageReturns(self):
+        """
+        A carriage return is removed only from the end of a line, even if its
+        line feed arrives in a later segment.
+        """
+        self.assertEqual(parse(bytesToLines(), b"a\rb\r\nc\r", b"\nd\r\r\n",
+                               b"\r"),
+                         [b"a\rb", b"c", b"d\r"])
+
+
+    def test_reassembleCarriageReturns(self):
+        """
+        When the flow is diverted, lines not yet delivered are reassembled
+        with their carriage returns, followed by the unparsed data.
+        """
+        lines = bytesToLines()
+        ff = FakeFount()
+        fd = FakeDrain()
+        diverted = FakeDrain()
+
+        @tube
+        class Switcher(object):
+            def received(self, line):
+                if line == b"switch":
+                    lines.divert(diverted)
+                else:
+                    yield line
+
+        ff.flowTo(series(lines, Switcher(), fd))
+        ff.drain.receive(b"one\r\nswitch\ntwo\r\nthree\nfo")
+        ff.drain.receive(b"ur\r")
+        self.assertEqual(fd.received, [b"one"])
+        self.assertEqual(b"".join(diverted.received),
+                         b"two\r\nthree\nfour\r")
+
+
+    def test_delimiterAcrossSegments(self):
+        """
+        A delimiter of several bytes may be split across segments.
+        """
+        self.assertEqual(parse(bytesDelimitedBy(b"\r\n"), b"alpha\r",
+                               b"\nbeta\r\ngam", b"ma\r", b"\n"),
+                         [b"alpha", b"beta", b"gamma"])
+
+
+    def test_lineTooLong(self):
+        """
+        A line longer than 16384 bytes can't be parsed, whether it is complete
+        or not.
+        """
+        assertFlowFails(self, FrameTooLong, bytesDelimitedBy(b"\n"),
+                        b"x" * 16385 + b"\n")
+        assertFlowFails(self, FrameTooLong, bytesDelimitedBy(b"\n"),
+                        b"x" * 10000, b"x" * 10000)
+        self.assertEqual(parse(bytesDelimitedBy(b"\n"), b"x" * 10000,
+                               b"\n" + b"x" * 10000 + b"\n"),
+                         [b"x" * 10000] * 2)
+
+
     def test_linesToBytes(self):
         """
         Writing out lines delimits them, with the delimiter.
@@ -182,3 +353,361 @@ class PackedPrefixTests(TestCase):
         ff.drain.receive(b'bc')
         ff.drain.receive(b'def')
         self.assertEqual(fd.received, [b'\x01a', b'\x02bc', b'\x03def'])
+
+
+    def test_prefixAcrossSegments(self):
+        """
+        A length prefix and its frame may be split across segments, and
+        several frames may arrive in one segment.
+        """
+        self.assertEqual(parse(bytesToIntPrefixed(16), b"\x00", b"\x03ab",
+                               b"c\x00\x00\x00\x01d\x00"),
+                         [b"abc", b"", b"d"])
+        self.assertEqual(parse(bytesToIntPrefixed(32),
+                               b"\x00\x00\x00\x02hi\x00\x00"),
+                         [b"hi"])
+
+
+    def test_prefixTooLong(self):
+        """
+        A frame longer than 99999 bytes can't be parsed.
+        """
+        assertFlowFails(self, FrameTooLong, bytesToIntPrefixed(32),
+                        b"\x00\x01\x86\xa0")
+
+
+    def test_maxLength(self):
+        """
+        The maximum length of a frame is configurable, and a longer frame
+        stops the flow with a L{FrameTooLong} saying how long it was, as soon
+        as its prefix is received.
+        """
+        self.assertEqual(parse(bytesToIntPrefixed(16, maxLength=3),
+                               b"\x00\x03abc"), [b"abc"])
+        fd = flowThrough(bytesToIntPrefixed(16, maxLength=3), b"\x00\x04")
+        fd.stopped[0].trap(FrameTooLong)
+        error = fd.stopped[0].value
+        self.assertEqual((error.length, error.maxLength), (4, 3))
+        self.assertEqual(str(error),
+                         "4-byte frame is longer than the maximum of 3 bytes")
+        self.assertEqual(len(self.flushLoggedErrors(FrameTooLong)), 1)
+
+
+    def test_chunked(self):
+        """
+        In chunked mode, each frame is emitted as a L{FrameHeader} followed by
+        the parts of its body in each segment.
+        """
+        received = parse(bytesToIntPrefixed(16, maxLength=2 ** 16,
+                                            chunked=True),
+                         b"\x00\x05ab", b"c", b"de\x00\x00\x00",
+                         b"\x01f\x00\x02gh")
+        self.assertEqual(
+            [(item.length if isinstance(item, FrameHeader) else item)
+             for item in received],
+            [5, b"ab", b"c", b"de", 0, 1, b"f", 2, b"gh"]
+        )
+
+
+    def test_chunkedMaxLength(self):
+        """
+        In chunked mode, the maximum length still applies.
+        """
+        assertFlowFails(self, FrameTooLong,
+                        bytesToIntPrefixed(8, maxLength=1, chunked=True),
+                        b"\x01a\x02")
+
+
+    def test_prefixOutTooLong(self):
+        """
+        A frame too long for the prefix can't be sent.
+        """
+        assertFlowFails(self, StringTooLongError, intPrefixedToBytes(8),
+                        b"x" * 256)
+
+
+
+class CoalescingTests(TestCase):
+    """
+    Tests for encoders which join the segments encoded in one reactor turn.
+    """
+
+    def setUp(self):
+        """
+        Set up a fount, a drain and a clock.
+        """
+        self.ff = FakeFount()
+        self.fd = FakeDrain()
+        self.clock = Clock()
+
+
+    def test_joinedAtEndOfTurn(self):
+        """
+        The lines received in one turn of the reactor are emitted as one
+        segment at the end of the turn.
+        """
+        self.ff.flowTo(series(linesToBytes(coalesce=1024, reactor=self.clock),
+                              self.fd))
+        self.ff.drain.receive(b"hello")
+        self.ff.drain.receive(b"world")
+        self.assertEqual(self.fd.received, [])
+        self.clock.advance(0)
+        self.assertEqual(self.fd.received, [b"hello\r\nworld\r\n"])
+        self.clock.advance(0)
+        self.assertEqual(self.fd.received, [b"hello\r\nworld\r\n"])
+
+
+    def test_reusable(self):
+        """
+        A coalescing encoder may be used in several pipelines, each of which
+        gathers its own segments.
+        """
+        encoder = linesToBytes(coalesce=1024, reactor=self.clock)
+        pipelines = []
+        for ignored in range(2):
+            ff = FakeFount()
+            fd = FakeDrain()
+            ff.flowTo(series(encoder, fd))
+            pipelines.append((ff, fd))
+        template = PipelineTemplate(encoder)
+        ff = FakeFount()
+        fd = FakeDrain()
+        ff.flowTo(template.newDrain()).flowTo(fd)
+        pipelines.append((ff, fd))
+        for index, (ff, fd) in enumerate(pipelines):
+            ff.drain.receive(str(index).encode("ascii"))
+        self.clock.advance(0)
+        self.assertEqual([fd.received for ff, fd in pipelines],
+                         [[b"0\r\n"], [b"1\r\n"], [b"2\r\n"]])
+
+
+    def test_batch(self):
+        """
+        All the frames produced by a tube for one input are encoded at once.
+        """
+        @tube
+        class Split(object):
+            def received(self, item):
+                return item.split()
+
+        self.ff.flowTo(series(Split(), bytesToNetstrings(coalesce=1024,
+                                                         reactor=self.clock),
+                              self.fd))
+        self.ff.drain.receive(b"a bc def")
+        self.clock.advance(0)
+        self.assertEqual(self.fd.received, [b"1:a,2:bc,3:def,"])
+
+
+    def test_maxBytes(self):
+        """
+        The gathered segment is emitted as soon as it reaches C{coalesce}
+        bytes.
+        """
+        self.ff.flowTo(series(intPrefixedToBytes(8, coalesce=4,
+                                                 reactor=self.clock),
+                              self.fd))
+        self.ff.drain.receive(b"a")
+        self.assertEqual(self.fd.received, [])
+        self.ff.drain.receive(b"b")
+        self.assertEqual(self.fd.received, [b"\x01a\x01b"])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+
+    def test_paused(self):
+        """
+        While the downstream drain is paused, the upstream fount is paused,
+        and segments are gathered until the downstream drain resumes.
+        """
+        self.ff.flowTo(series(linesToBytes(coalesce=1, reactor=self.clock),
+                              self.fd))
+        pause = self.fd.fount.pauseFlow()
+        self.assertEqual(self.ff.flowIsPaused, 1)
+        self.ff.drain.receive(b"a")
+        self.ff.drain.receive(b"b")
+        self.clock.advance(0)
+        self.assertEqual(self.fd.received, [])
+        pause.unpause()
+        self.assertEqual(self.ff.flowIsPaused, 0)
+        self.assertEqual(self.fd.received, [b"a\r\nb\r\n"])
+
+
+    def test_flowStopped(self):
+        """
+        When the flow stops, the gathered segment is emitted right away, then
+        the downstream flow is stopped.
+        """
+        self.ff.flowTo(series(linesToBytes(coalesce=1024, reactor=self.clock),
+                              self.fd))
+        self.ff.drain.receive(b"a")
+        reason = Failure(StopFlowCalled())
+        self.ff.drain.flowStopped(reason)
+        self.assertEqual(self.fd.received, [b"a\r\n"])
+        self.assertEqual(self.fd.stopped, [reason])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+
+    def test_stopFlow(self):
+        """
+        Stopping the flow discards the gathered segment and stops the upstream
+        fount.
+        """
+        self.ff.flowTo(series(linesToBytes(coalesce=1024, reactor=self.clock),
+                              self.fd))
+        self.ff.drain.receive(b"a")
+        self.fd.fount.stopFlow()
+        self.assertEqual(self.ff.flowIsStopped, 1)
+        self.clock.advance(0)
+        self.assertEqual(self.fd.received, [])
+
+
+    def test_encodingFails(self):
+        """
+        An exception raised while encoding a frame stops the flow.
+        """
+        self.ff.flowTo(series(intPrefixedToBytes(8, coalesce=1024,
+                                                 reactor=self.clock),
+                              self.fd))
+        self.ff.drain.receive(b"x" * 256)
+        self.assertEqual(self.ff.flowIsStopped, 1)
+        self.assertEqual(len(self.fd.stopped), 1)
+        self.fd.stopped[0].trap(StringTooLongError)
+        self.assertEqual(len(self.flushLoggedErrors(StringTooLongError)), 1)
+        self.ff.drain.flowStopped(Failure(StopFlowCalled()))
+        self.assertEqual(len(self.fd.stopped), 1)
+
+
+
+class VarintPrefixTests(TestCase):
+    """
+    Tests for L{bytesToVarintPrefixed} and L{varintPrefixedToBytes}.
+    """
+
+    def test_prefixOut(self):
+        """
+        Each frame is prefixed with its length as a base-128 varint, least
+        significant group first.
+        """
+        self.assertEqual(parse(varintPrefixedToBytes(), b"", b"a",
+                               b"x" * 300),
+                         [b"\x00", b"\x01a", b"\xac\x02" + b"x" * 300])
+
+
+    def test_prefixIn(self):
+        """
+        Frames are parsed, however their prefixes and bodies are split into
+        segments.
+        """
+        data = b"".join(parse(varintPrefixedToBytes(), b"abc", b"",
+                              b"y" * 200, b"z" * 20000))
+        for size in [1, 2, 7, len(data)]:
+            segments = [data[offset:offset + size]
+                        for offset in range(0, len(data), size)]
+            self.assertEqual(parse(bytesToVarintPrefixed(), *segments),
+                             [b"abc", b"", b"y" * 200, b"z" * 20000])
+
+
+    def test_maxLength(self):
+        """
+        A frame longer than the maximum length stops the flow as soon as its
+        prefix is received.
+        """
+        assertFlowFails(self, FrameTooLong, bytesToVarintPrefixed(200),
+                        b"\xc9\x01")
+        self.assertEqual(parse(bytesToVarintPrefixed(200), b"\xc8\x01"), [])
+
+
+    def test_prefixTooLong(self):
+        """
+        A varint prefix longer than 10 bytes can't be parsed.
+        """
+        assertFlowFails(self, ValueError, bytesToVarintPrefixed(),
+                        b"\x80" * 10 + b"\x00")
+        self.assertEqual(parse(bytesToVarintPrefixed(),
+                               b"\x81" + b"\x80" * 8 + b"\x00a"), [b"a"])
+
+
+
+class RecordTests(TestCase):
+    """
+    Tests for L{bytesToRecords}.
+    """
+
+    def test_records(self):
+        """
+        All the complete records in a segment are unpacked, and an incomplete
+        record is kept until the rest of it arrives.
+        """
+        data = pack("!HI", 1, 2) + pack("!HI", 3, 4) + pack("!HI", 5, 6)
+        self.assertEqual(parse(bytesToRecords("!HI"), data[:8], data[8:10],
+                               data[10:]),
+                         [(1, 2), (3, 4), (5, 6)])
+
+
+    def test_batch(self):
+        """
+        The records in a segment are delivered to an L{IBatchDrain} together.
+        """
+        ff = FakeFount()
+        batches = []
+
+        @implementer(IBatchDrain)
+        class BatchDrain(FakeDrain):
+            def receiveBatch(self, items):
+                batches.append(list(items))
+
+        ff.flowTo(series(bytesToRecords("!B"), BatchDrain()))
+        ff.drain.receive(b"\x01\x02\x03")
+        self.assertEqual(batches, [[(1,), (2,), (3,)]])
+
+
+    def test_zeroSize(self):
+        """
+        A format which describes zero-byte records is rejected with
+        L{ValueError}.
+        """
+        for recordFormat in ["", "0s", "!"]:
+            self.assertRaises(ValueError, bytesToRecords, recordFormat)
+
+
+
+class RecordArrayTests(TestCase):
+    """
+    Tests for L{bytesToRecordArrays}.
+    """
+
+    if numpy is None:
+        skip = "NumPy is not installed."
+
+    dtype = [("id", ">u2"), ("value", ">u4")]
+
+    def test_arrays(self):
+        """
+        One structured array is emitted for the complete records in each
+        segment.
+        """
+        data = pack("!HI", 1, 2) + pack("!HI", 3, 4) + pack("!HI", 5, 6)
+        arrays = parse(bytesToRecordArrays(self.dtype), data[:8], data[8:10],
+                       data[10:])
+        self.assertEqual([array.tolist() for array in arrays],
+                         [[(1, 2)], [(3, 4), (5, 6)]])
+        self.assertEqual(list(arrays[1]["value"]), [4, 6])
+
+
+    def test_zeroSize(self):
+        """
+        A data type which describes zero-byte records is rejected with
+        L{ValueError}.
+        """
+        self.assertRaises(ValueError, bytesToRecordArrays, [])
+
+
+    def test_copiedFromBuffer(self):
+        """
+        An array of records which were buffered does not share the buffer's
+        memory, which is reused for later records.
+        """
+        parser = bytesToRecordArrays(self.dtype)
+        first = list(parser.received(b"\x00\x01\x00"))
+        first += parser.received(b"\x00\x00\x02\x00")
+        parser.received(b"\x03\x00\x00\x00\x04")
+        self.assertEqual(first[0].tolist(), [(1, 2)])
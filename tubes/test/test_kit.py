@@ -10,8 +10,9 @@ from zope.interface.verify import verifyObject
 
 from twisted.trial.unittest import SynchronousTestCase as TestCase
 
-from ..itube import IPause, AlreadyUnpaused
-from ..kit import Pauser
+from ..itube import IPause, AlreadyUnpaused, IDrain, IBatchDrain, IFount
+from ..kit import Pauser, _Stage
+from .util import FakeFount, FakeDrain
 
 def countingCallable():
     """
@@ -126,3 +127,119 @@ class PauserTests(TestCase):
         self.assertEqual(pause.d, 2)
         anotherPause.unpause()
         self.assertEqual(resume.d, 2)
+
+
+
+class Doubler(_Stage):
+    """
+    A L{_Stage} which emits each of its inputs twice.
+    """
+
+    def _receive(self, item):
+        """
+        Emit an item twice.
+
+        @param item: the item.
+        """
+        self._ready.extend([item, item])
+        self._deliver()
+
+
+
+class StageTests(TestCase):
+    """
+    Tests for L{_Stage}, the base for stages with a separate drain and fount.
+    """
+
+    def test_interfaces(self):
+        """
+        A L{_Stage}'s drain provides L{IBatchDrain} only if C{batches} is
+        true, and its fount provides L{IFount}.
+        """
+        stage = Doubler()
+        self.assertTrue(verifyObject(IDrain, stage.drain))
+        self.assertFalse(IBatchDrain.providedBy(stage.drain))
+        self.assertTrue(verifyObject(IFount, stage.fount))
+        self.assertTrue(verifyObject(IBatchDrain,
+                                     Doubler(batches=True).drain))
+
+
+    def test_passThrough(self):
+        """
+        By default, a L{_Stage} emits each of its inputs unchanged.
+        """
+        stage = _Stage()
+        ff = FakeFount()
+        fd = FakeDrain()
+        ff.flowTo(stage.drain).flowTo(fd)
+        ff.drain.receive(1)
+        ff.drain.receive(2)
+        self.assertEqual(fd.received, [1, 2])
+
+
+    def test_bufferWhilePaused(self):
+        """
+        While a L{_Stage}'s fount is paused, its outputs wait in C{_ready},
+        and its upstream fount is paused; when it resumes, they are emitted
+        in order, and the upstream fount is resumed.
+        """
+        stage = Doubler()
+        ff = FakeFount()
+        fd = FakeDrain()
+        ff.flowTo(stage.drain).flowTo(fd)
+        pause = fd.fount.pauseFlow()
+        ff.drain.receive(1)
+        self.assertEqual((fd.received, ff.flowIsPaused), ([], 1))
+        pause.unpause()
+        self.assertEqual((fd.received, ff.flowIsPaused), ([1, 1], 0))
+
+
+    def test_upstreamPauseFollowsFount(self):
+        """
+        When a paused L{_Stage} starts flowing from a new fount, the new fount
+        is paused and the old one is resumed.
+        """
+        stage = Doubler()
+        old = FakeFount()
+        new = FakeFount()
+        fd = FakeDrain()
+        old.flowTo(stage.drain).flowTo(fd)
+        fd.fount.pauseFlow()
+        old.drain.receive(1)
+        new.flowTo(stage.drain)
+        self.assertEqual((old.flowIsPaused, new.flowIsPaused), (0, 1))
+
+
+    def test_flowStoppedWhenEmpty(self):
+        """
+        When the upstream flow stops, the downstream flow stops only once the
+        outputs waiting in C{_ready} have been emitted.
+        """
+        stage = Doubler()
+        ff = FakeFount()
+        fd = FakeDrain()
+        ff.flowTo(stage.drain).flowTo(fd)
+        pause = fd.fount.pauseFlow()
+        ff.drain.receive(1)
+        reason = object()
+        ff.drain.flowStopped(reason)
+        self.assertEqual(fd.stopped, [])
+        pause.unpause()
+        self.assertEqual((fd.received, fd.stopped), ([1, 1], [reason]))
+
+
+    def test_stopFlow(self):
+        """
+        Stopping a L{_Stage}'s fount discards its outputs and stops its
+        upstream fount.
+        """
+        stage = Doubler()
+        ff = FakeFount()
+        fd = FakeDrain()
+        ff.flowTo(stage.drain).flowTo(fd)
+        fd.fount.pauseFlow()
+        ff.drain.receive(1)
+        fd.fount.stopFlow()
+        self.assertEqual((list(stage._ready), ff.flowIsStopped), ([], True))
+        ff.drain.flowStopped(object())
+        self.assertEqual(fd.stopped, [])
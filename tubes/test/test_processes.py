@@ -0,0 +1,249 @@
+# -*- test-case-name: tubes.test.test_processes -*-
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Tests for L{tubes.processes}.
+"""
+
+import os
+from concurrent.futures import Future
+
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+from twisted.trial.unittest import SynchronousTestCase as TestCase
+
+from ..itube import StopFlowCalled
+from ..processes import ProcessPoolStage
+from ..tube import receiver, series
+from .. import tube as _tube
+from .util import FakeFount, FakeDrain
+
+
+
+@receiver()
+def double(item):
+    """
+    Produce an item twice, or nothing for C{None}.
+
+    @param item: anything.
+    """
+    if item is None:
+        return [_tube.skip]
+    return [item, item]
+
+
+
+@receiver()
+def explode(item):
+    """
+    Fail.
+
+    @param item: ignored.
+    """
+    raise ZeroDivisionError(item)
+
+
+
+class FakeExecutor(object):
+    """
+    A fake L{concurrent.futures.Executor} which runs work only when told to.
+
+    @ivar calls: the work given to this executor, which has not yet been run.
+    @type calls: L{list}
+    """
+
+    def __init__(self):
+        self.calls = []
+
+
+    def submit(self, f, *args):
+        """
+        Remember some work to run later.
+
+        @param f: the work.
+
+        @param args: positional arguments for C{f}.
+
+        @return: a L{Future} for the work's result.
+        """
+        future = Future()
+        self.calls.append((future, f, args))
+        return future
+
+
+    def runOne(self, index=0):
+        """
+        Run the given piece of work.
+
+        @param index: the index of the work in C{self.calls}.
+        """
+        future, f, args = self.calls.pop(index)
+        try:
+            result = f(*args)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+
+
+
+class ThreadlessClock(Clock):
+    """
+    A L{Clock} which runs calls from threads immediately.
+    """
+
+    def callFromThread(self, f, *args, **kwargs):
+        """
+        Call C{f} right away.
+
+        @param f: a callable.
+
+        @param args: positional arguments for C{f}.
+
+        @param kwargs: keyword arguments for C{f}.
+        """
+        f(*args, **kwargs)
+
+
+
+class ProcessPoolStageTests(TestCase):
+    """
+    Tests for L{ProcessPoolStage}.
+    """
+
+    def setUp(self):
+        """
+        Set up a stage in front of a L{FakeDrain}.
+        """
+        self.executor = FakeExecutor()
+        self.clock = ThreadlessClock()
+        self.ff = FakeFount()
+        self.fd = FakeDrain()
+
+
+    def flow(self, aReceiver=double, **kwargs):
+        """
+        Create a L{ProcessPoolStage} and connect it.
+
+        @param aReceiver: the receiver.
+
+        @param kwargs: keyword arguments for L{ProcessPoolStage}.
+
+        @return: the stage.
+        """
+        stage = ProcessPoolStage(aReceiver, self.executor, reactor=self.clock,
+                                 **kwargs)
+        self.ff.flowTo(series(stage.drain, self.fd))
+        return stage
+
+
+    def test_batchPerTurn(self):
+        """
+        Items received in the same turn of the reactor are sent to the pool as
+        one batch, whose outputs are delivered in order.
+        """
+        self.flow()
+        self.ff.drain.receive(1)
+        self.ff.drain.receive(None)
+        self.ff.drain.receive(2)
+        self.assertEqual(self.executor.calls, [])
+        self.clock.advance(0)
+        self.assertEqual(len(self.executor.calls), 1)
+        self.ff.drain.receive(3)
+        self.clock.advance(0)
+        self.assertEqual(len(self.executor.calls), 2)
+        self.executor.runOne(1)
+        self.assertEqual(self.fd.received, [])
+        self.executor.runOne()
+        self.assertEqual(self.fd.received, [1, 1, 2, 2, 3, 3])
+
+
+    def test_batchSize(self):
+        """
+        A batch is sent as soon as it has C{batchSize} items.
+        """
+        self.flow(batchSize=2)
+        for item in range(5):
+            self.ff.drain.receive(item)
+        self.assertEqual([args[2] for f, ignored, args
+                          in self.executor.calls], [[0, 1], [2, 3]])
+        self.clock.advance(0)
+        self.assertEqual(self.executor.calls[-1][2][2], [4])
+
+
+    def test_backpressure(self):
+        """
+        The upstream fount is paused while C{maxInFlight} batches are in the
+        pool, and resumed as they finish.
+        """
+        self.flow(batchSize=1, maxInFlight=2)
+        self.ff.drain.receive(1)
+        self.assertEqual(self.ff.flowIsPaused, 0)
+        self.ff.drain.receive(2)
+        self.assertEqual(self.ff.flowIsPaused, 1)
+        self.executor.runOne()
+        self.assertEqual(self.ff.flowIsPaused, 0)
+        self.assertEqual(self.fd.received, [1, 1])
+
+
+    def test_stopSubmitsBatch(self):
+        """
+        When the flow stops, the batch being collected is sent right away, and
+        the flow stops downstream once its outputs have been delivered.
+        """
+        self.flow()
+        self.ff.drain.receive(1)
+        reason = Failure(StopFlowCalled())
+        self.ff.drain.flowStopped(reason)
+        self.assertEqual(len(self.executor.calls), 1)
+        self.assertEqual(self.fd.stopped, [])
+        self.executor.runOne()
+        self.assertEqual(self.fd.received, [1, 1])
+        self.assertEqual(self.fd.stopped, [reason])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+
+    def test_failure(self):
+        """
+        An exception raised by the receiver in the pool stops the flow.
+        """
+        self.flow(explode)
+        self.ff.drain.receive(1)
+        self.clock.advance(0)
+        self.executor.runOne()
+        self.assertEqual(len(self.fd.stopped), 1)
+        self.fd.stopped[0].trap(ZeroDivisionError)
+        self.assertIn("explode", [frame[0] for frame
+                                  in self.fd.stopped[0].frames])
+        self.assertEqual(self.ff.flowIsStopped, 1)
+
+
+    def test_utilization(self):
+        """
+        L{ProcessPoolStage.utilization} reports how busy each worker has been
+        since the stage was created.
+        """
+        stage = self.flow()
+        self.assertEqual(stage.utilization(), {})
+        self.ff.drain.receive(1)
+        self.clock.advance(0)
+        self.executor.runOne()
+        self.clock.advance(10)
+        utilization = stage.utilization()
+        self.assertEqual(list(utilization), [os.getpid()])
+        self.assertTrue(0 <= utilization[os.getpid()] < 1)
+
+
+    def test_notImportable(self):
+        """
+        L{ProcessPoolStage} raises L{TypeError} for a receiver which worker
+        processes could not import.
+        """
+        @receiver()
+        def local(item):
+            return [item]
+        self.assertRaises(TypeError, ProcessPoolStage, local, self.executor,
+                          reactor=self.clock)
+        self.assertRaises(TypeError, ProcessPoolStage, lambda item: [item],
+                          self.executor, reactor=self.clock)
@@ -119,6 +119,16 @@ class FlowConnectorTests(TestCase):
         self.assertEqual(self.endpoint.transports[0].io.getvalue(), hello)
 
 
+    def test_drainReceivingBatchWritesToTransport(self):
+        """
+        Calling L{receiveBatch} on a L{_TransportDrain} will send all of the
+        data to the wrapped transport.
+        """
+        self.adaptedDrain.receiveBatch([b"hello ", b"world!"])
+        self.assertEqual(self.endpoint.transports[0].io.getvalue(),
+                         b"hello world!")
+
+
     def test_stopFlowStopsConnection(self):
         """
         L{_TransportFount.stopFlow} will close the underlying connection by
@@ -22,8 +22,23 @@ if 0:
 class RouterTests(TestCase):
     """
     Tests for L{Router}.
+
+    @ivar indexed: the C{indexed} argument to pass to L{Router}.
     """
 
+    indexed = False
+
+    def router(self, outputType=None):
+        """
+        Create a L{Router} of the kind being tested.
+
+        @param outputType: see L{Router}
+
+        @return: a new L{Router}.
+        """
+        return Router(outputType, indexed=self.indexed)
+
+
     def test_twoRoutes(self):
         """
         The L{IFount} feeding into a L{Router} may yield L{to} each route
@@ -35,7 +50,7 @@ class RouterTests(TestCase):
                 yield to(odd, item)
             else:
                 yield to(even, item)
-        router = Router()
+        router = self.router()
         even = router.newRoute("even")
         evens = FakeDrain()
         even.flowTo(evens)
@@ -56,7 +71,7 @@ class RouterTests(TestCase):
         It's useful to C{repr} a route for debugging purposes; if we give it a
         name, its C{repr} will contain that name.
         """
-        router = Router()
+        router = self.router()
         route = router.newRoute("hello")
         self.assertTrue("hello" in repr(route))
 
@@ -66,7 +81,7 @@ class RouterTests(TestCase):
         L{Router}'s drain accepts only L{Routed} objects; if no other type is
         specified, L{Routed}C{(None)}.
         """
-        router = Router()
+        router = self.router()
         ff = FakeFount(IFakeOutput)
         self.assertEqual(router.drain.inputType, Routed(None))
         self.assertRaises(TypeError, ff.flowTo, router.drain)
@@ -79,7 +94,7 @@ class RouterTests(TestCase):
         type of output that its routes will provide, and also the routed type
         required as an input.
         """
-        router = Router(IFakeInput)
+        router = self.router(IFakeInput)
         incorrect = FakeDrain(IFakeOutput)
         correct = FakeDrain(IFakeInput)
         self.assertEqual(router.drain.inputType, Routed(IFakeInput))
@@ -92,6 +107,162 @@ class RouterTests(TestCase):
         self.assertEqual(None, correctFount.flowTo(router.drain))
 
 
+    def test_pausingOneRoutePausesUpstream(self):
+        """
+        When the drain of one route pauses its fount, the fount flowing into
+        L{Router.drain} is paused until it is unpaused; other routes still
+        receive the items addressed to them.
+        """
+        router = self.router()
+        one = router.newRoute("one")
+        two = router.newRoute("two")
+        oneDrain = FakeDrain()
+        twoDrain = FakeDrain()
+        one.flowTo(oneDrain)
+        two.flowTo(twoDrain)
+        ff = FakeFount()
+        ff.flowTo(router.drain)
+        pause = oneDrain.fount.pauseFlow()
+        self.assertEqual(ff.flowIsPaused, 1)
+        ff.drain.receive(to(two, 2))
+        self.assertEqual(twoDrain.received, [2])
+        pause.unpause()
+        self.assertEqual(ff.flowIsPaused, 0)
+
+
+    def test_itemsWhilePausedAreBuffered(self):
+        """
+        An item addressed to a paused route is delivered to that route's drain
+        once it is unpaused.
+        """
+        router = self.router()
+        route = router.newRoute()
+        fd = FakeDrain()
+        route.flowTo(fd)
+        ff = FakeFount()
+        ff.flowTo(router.drain)
+        pause = fd.fount.pauseFlow()
+        ff.drain.receive(to(route, "hello"))
+        self.assertEqual(fd.received, [])
+        pause.unpause()
+        self.assertEqual(fd.received, ["hello"])
+
+
+    def test_stoppedRouteReceivesNothing(self):
+        """
+        Once a route's flow has been stopped, items addressed to it are
+        discarded.
+        """
+        router = self.router()
+        route = router.newRoute()
+        fd = FakeDrain()
+        route.flowTo(fd)
+        ff = FakeFount()
+        ff.flowTo(router.drain)
+        ff.drain.receive(to(route, 1))
+        fd.fount.stopFlow()
+        ff.drain.receive(to(route, 2))
+        self.assertEqual(fd.received, [1])
+
+
+
+class IndexedRouterTests(RouterTests):
+    """
+    Tests for L{Router} with C{indexed=True}.
+    """
+
+    indexed = True
+
+    def test_notRouted(self):
+        """
+        An item which was not constructed with L{to} is rejected with a
+        L{TypeError}.
+        """
+        router = self.router()
+        ff = FakeFount()
+        ff.flowTo(router.drain)
+        self.assertRaises(TypeError, ff.drain.receive, 1)
+        self.assertRaises(TypeError, ff.drain.receiveBatch, [1])
+
+
+    def test_receiveBatch(self):
+        """
+        Each item in a batch received by an indexed L{Router}'s drain is
+        delivered to the route it is addressed to.
+        """
+        router = self.router()
+        one = router.newRoute()
+        two = router.newRoute()
+        oneDrain = FakeDrain()
+        twoDrain = FakeDrain()
+        one.flowTo(oneDrain)
+        two.flowTo(twoDrain)
+        ff = FakeFount()
+        ff.flowTo(router.drain)
+        ff.drain.receiveBatch([to(one, 1), to(two, 2), to(one, 3)])
+        self.assertEqual(oneDrain.received, [1, 3])
+        self.assertEqual(twoDrain.received, [2])
+
+
+    def test_pausedPartwayThroughBatch(self):
+        """
+        If a route's drain pauses partway through a batch, the rest of the
+        batch is delivered to it when it resumes, before any later items.
+        """
+        router = self.router()
+        route = router.newRoute()
+        pauses = []
+        class PauseOnce(FakeDrain):
+            def receive(self, item):
+                super(PauseOnce, self).receive(item)
+                if not pauses:
+                    pauses.append(self.fount.pauseFlow())
+        fd = PauseOnce()
+        route.flowTo(fd)
+        ff = FakeFount()
+        ff.flowTo(router.drain)
+        ff.drain.receiveBatch([to(route, "a1"), to(route, "a2"),
+                               to(route, "a3")])
+        self.assertEqual(fd.received, ["a1"])
+        pauses[0].unpause()
+        ff.drain.receiveBatch([to(route, "b1"), to(route, "b2")])
+        self.assertEqual(fd.received, ["a1", "a2", "a3", "b1", "b2"])
+        self.assertEqual(ff.flowIsPaused, 0)
+
+
+    def test_otherRoutersRoutes(self):
+        """
+        An item addressed to a route of a different L{Router} is discarded.
+        """
+        router = self.router()
+        route = router.newRoute()
+        fd = FakeDrain()
+        route.flowTo(fd)
+        other = self.router().newRoute()
+        ff = FakeFount()
+        ff.flowTo(router.drain)
+        ff.drain.receive(to(other, 1))
+        self.assertEqual(fd.received, [])
+
+
+    def test_flowStopped(self):
+        """
+        When the flow into an indexed L{Router}'s drain stops, every route's
+        drain is notified.
+        """
+        router = self.router()
+        routes = [router.newRoute(), router.newRoute()]
+        drains = [FakeDrain(), FakeDrain()]
+        for route, drain in zip(routes, drains):
+            route.flowTo(drain)
+        ff = FakeFount()
+        ff.flowTo(router.drain)
+        reason = object()
+        ff.drain.flowStopped(reason)
+        self.assertEqual([drain.stopped for drain in drains],
+                         [[reason], [reason]])
+
+
 
 class RoutedTests(TestCase):
     """
@@ -0,0 +1,248 @@
+# -*- test-case-name: tubes.test.test_threaded -*-
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Tests for L{tubes.threaded}.
+"""
+
+from twisted.trial.unittest import SynchronousTestCase as TestCase
+from twisted.python.failure import Failure
+
+from ..threaded import threadedTube
+from ..tube import tube, series
+from .util import FakeFount, FakeDrain
+
+
+
+class FakeThreadPool(object):
+    """
+    A fake L{twisted.python.threadpool.ThreadPool} which runs work only when
+    told to.
+
+    @ivar calls: the work given to this pool, which has not yet been run.
+    @type calls: L{list}
+    """
+
+    def __init__(self):
+        self.calls = []
+
+
+    def callInThreadWithCallback(self, onResult, f, *args, **kwargs):
+        """
+        Remember some work to run later.
+
+        @param onResult: a callable to call with the work's success and its
+            result.
+
+        @param f: the work.
+
+        @param args: positional arguments for C{f}.
+
+        @param kwargs: keyword arguments for C{f}.
+        """
+        self.calls.append((onResult, f, args, kwargs))
+
+
+    def runOne(self, index=0):
+        """
+        Run the given piece of work.
+
+        @param index: the index of the work in C{self.calls}.
+        """
+        onResult, f, args, kwargs = self.calls.pop(index)
+        try:
+            result = f(*args, **kwargs)
+        except:
+            onResult(False, Failure())
+        else:
+            onResult(True, result)
+
+
+
+class FakeReactor(object):
+    """
+    A fake reactor which runs calls from threads immediately.
+    """
+
+    def callFromThread(self, f, *args, **kwargs):
+        """
+        Call C{f} right away.
+
+        @param f: a callable.
+
+        @param args: positional arguments for C{f}.
+
+        @param kwargs: keyword arguments for C{f}.
+        """
+        f(*args, **kwargs)
+
+
+
+@tube
+class Splitter(object):
+    """
+    A tube which splits its inputs on whitespace, remembering what it has
+    received.
+    """
+
+    def __init__(self):
+        self.inputs = []
+
+
+    def received(self, item):
+        """
+        Split an item.
+
+        @param item: a L{str}
+
+        @return: the words in C{item}.
+        """
+        self.inputs.append(item)
+        for word in item.split():
+            yield word
+
+
+    def stopped(self, reason):
+        """
+        Say goodbye.
+
+        @param reason: ignored.
+
+        @return: a farewell.
+        """
+        return ["bye"]
+
+
+
+class ThreadedTubeTests(TestCase):
+    """
+    Tests for L{threadedTube}.
+    """
+
+    def setUp(self):
+        """
+        Create a fount, a drain, a fake thread pool and a fake reactor.
+        """
+        self.ff = FakeFount()
+        self.fd = FakeDrain()
+        self.pool = FakeThreadPool()
+        self.reactor = FakeReactor()
+
+
+    def connect(self, aTube, **kwargs):
+        """
+        Connect C{self.ff} to C{self.fd} through a L{threadedTube}.
+
+        @param aTube: the tube to wrap.
+
+        @param kwargs: keyword arguments for L{threadedTube}.
+        """
+        self.ff.flowTo(series(threadedTube(aTube, self.pool,
+                                           reactor=self.reactor, **kwargs),
+                              self.fd))
+
+
+    def test_receivedInPool(self):
+        """
+        The wrapped tube's C{received} method is only called by the thread
+        pool, and its outputs are delivered once it returns.
+        """
+        splitter = Splitter()
+        self.connect(splitter)
+        self.ff.drain.receive("hello world")
+        self.assertEqual((splitter.inputs, self.fd.received), ([], []))
+        self.pool.runOne()
+        self.assertEqual(splitter.inputs, ["hello world"])
+        self.assertEqual(self.fd.received, ["hello", "world"])
+
+
+    def test_maxInFlight(self):
+        """
+        As many as C{maxInFlight} inputs are passed to the pool before the
+        upstream fount is paused, and outputs are delivered in order.
+        """
+        self.connect(Splitter(), maxInFlight=2)
+        self.ff.drain.receive("a")
+        self.assertEqual(self.ff.flowIsPaused, 0)
+        self.ff.drain.receive("b")
+        self.assertEqual(self.ff.flowIsPaused, 1)
+        self.assertEqual(len(self.pool.calls), 2)
+        self.pool.runOne(1)
+        self.assertEqual(self.fd.received, [])
+        self.pool.runOne()
+        self.assertEqual(self.fd.received, ["a", "b"])
+        self.assertEqual(self.ff.flowIsPaused, 0)
+
+
+    def test_maxInFlightWithBatches(self):
+        """
+        When the upstream stage delivers several inputs at once, still no
+        more than C{maxInFlight} of them are passed to the pool at once; the
+        rest are passed on as earlier ones finish.
+        """
+        @tube
+        class Expand(object):
+            def received(self, count):
+                return [str(n) for n in range(count)]
+
+        splitter = Splitter()
+        self.ff.flowTo(series(Expand(),
+                              threadedTube(splitter, self.pool, maxInFlight=1,
+                                           reactor=self.reactor),
+                              self.fd))
+        self.ff.drain.receive(8)
+        self.assertEqual(len(self.pool.calls), 1)
+        self.assertEqual(self.ff.flowIsPaused, 1)
+        for ignored in range(8):
+            self.assertEqual(len(self.pool.calls), 1)
+            self.pool.runOne()
+        self.assertEqual(self.pool.calls, [])
+        self.assertEqual(splitter.inputs, [str(n) for n in range(8)])
+        self.assertEqual(self.fd.received, [str(n) for n in range(8)])
+        self.assertEqual(self.ff.flowIsPaused, 0)
+
+
+    def test_unordered(self):
+        """
+        With C{ordered=False}, outputs are delivered as soon as they are
+        ready.
+        """
+        self.connect(Splitter(), maxInFlight=2, ordered=False)
+        self.ff.drain.receive("a")
+        self.ff.drain.receive("b")
+        self.pool.runOne(1)
+        self.assertEqual(self.fd.received, ["b"])
+
+
+    def test_stoppedAfterReceived(self):
+        """
+        The wrapped tube's C{stopped} method is called in the pool once all
+        of its inputs have been processed, and its outputs are delivered
+        before the downstream flow stops.
+        """
+        self.connect(Splitter(), maxInFlight=2)
+        self.ff.drain.receive("a")
+        reason = Failure(ZeroDivisionError())
+        self.ff.drain.flowStopped(reason)
+        self.assertEqual(len(self.pool.calls), 1)
+        self.pool.runOne()
+        self.pool.runOne()
+        self.assertEqual(self.fd.received, ["a", "bye"])
+        self.assertEqual(self.fd.stopped, [reason])
+
+
+    def test_exception(self):
+        """
+        An exception raised by the wrapped tube in the pool stops the flow.
+        """
+        @tube
+        class Broken(object):
+            def received(self, item):
+                raise ZeroDivisionError()
+
+        self.connect(Broken())
+        self.ff.drain.receive("a")
+        self.pool.runOne()
+        self.assertEqual(self.ff.flowIsStopped, 1)
+        self.assertEqual(self.fd.stopped[0].type, ZeroDivisionError)
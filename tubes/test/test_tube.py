@@ -16,17 +16,20 @@ from twisted.trial.unittest import SynchronousTestCase as TestCase
 
 from twisted.python.failure import Failure
 
-from ..itube import IDivertable, ITube, IFount
-from ..tube import tube, series, Diverter
+from ..itube import IDivertable, ITube, IFount, IBatchDrain, StopFlowCalled
+from ..tube import (tube, series, Diverter, receiver, PipelineTemplate,
+                    bounded)
+# Imported under another name since trial skips a module with a 'skip'.
+from ..tube import skip as skipToken
 
 # Currently, this private implementation detail is imported only to test the
 # repr.  Is it *possible* to even get access to a _Siphon via the public
 # interface?  When would you see this repr?  Hmm. -glyph
-from .._siphon import _Siphon
+from .._siphon import _Siphon, SiphonPendingValues, suspended, finished
 
 from ..test.util import (TesterTube, FakeFount, FakeDrain, IFakeInput,
                          IFakeOutput, NullTube, PassthruTube, ReprTube,
-                         FakeFountWithBuffer)
+                         FakeFountWithBuffer, FakeBatchDrain)
 
 
 
@@ -727,6 +730,18 @@ class SeriesTests(TestCase):
                          '<_Siphon for <Tube for Testing>>')
 
 
+    def test_siphonCompact(self):
+        """
+        A L{_Siphon} and the objects it is made of have no instance
+        dictionaries, since a process may have a great many of them.
+        """
+        siphon = _Siphon(ReprTube())
+        for piece in [siphon, siphon._tfount, siphon._tdrain, siphon._pending,
+                      siphon._tfount._pauser, siphon._pauseBecauseNoDrain,
+                      siphon._tfount.pauseFlow()]:
+            self.assertFalse(hasattr(piece, "__dict__"), piece)
+
+
     def test_diverterRepr(self):
         """
         repr for L{Diverter} includes a reference to its tube.
@@ -876,6 +891,807 @@ class SeriesTests(TestCase):
 
 
 
+class BatchDeliveryTests(TestCase):
+    """
+    Tests for the delivery of batches of values between L{_Siphon}s and
+    L{IBatchDrain}s.
+    """
+
+    def setUp(self):
+        """
+        Create a fake fount and a fake batch drain.
+        """
+        self.ff = FakeFount()
+        self.fd = FakeBatchDrain()
+
+
+    def test_provides(self):
+        """
+        The drain returned by L{series} provides L{IBatchDrain}.
+        """
+        verifyObject(IBatchDrain, series(PassthruTube()))
+
+
+    def test_listDeliveredAsBatch(self):
+        """
+        When L{ITube.received} returns a L{list}, all of its values are
+        delivered to an L{IBatchDrain} in a single batch.
+        """
+        @tube
+        class Splitter(object):
+            def received(self, item):
+                return item.split()
+
+        self.ff.flowTo(series(Splitter())).flowTo(self.fd)
+        self.ff.drain.receive("a b c")
+        self.assertEqual(self.fd.batches, [["a", "b", "c"]])
+
+
+    def test_generatorDeliveredOneAtATime(self):
+        """
+        Values yielded from a generator are delivered one at a time, since the
+        generator may have side effects after yielding each one.
+        """
+        @tube
+        class Splitter(object):
+            def received(self, item):
+                for part in item.split():
+                    yield part
+
+        self.ff.flowTo(series(Splitter())).flowTo(self.fd)
+        self.ff.drain.receive("a b c")
+        self.assertEqual(self.fd.batches, [])
+        self.assertEqual(self.fd.received, ["a", "b", "c"])
+
+
+    def test_skipOmittedFromBatch(self):
+        """
+        L{tubes.tube.skip} in a returned L{list} is not delivered.
+        """
+        @tube
+        class Skipper(object):
+            def received(self, item):
+                return [item, skipToken, item]
+
+        self.ff.flowTo(series(Skipper())).flowTo(self.fd)
+        self.ff.drain.receive(1)
+        self.assertEqual(self.fd.batches, [[1, 1]])
+
+
+    def test_pauseAtBatchBoundary(self):
+        """
+        If an L{IBatchDrain} pauses its fount while receiving a batch, the
+        whole batch is still delivered, but no further batches are delivered
+        until the fount is resumed.
+        """
+        pauses = []
+
+        @implementer(IBatchDrain)
+        class PausingDrain(FakeBatchDrain):
+            def receiveBatch(self, items):
+                super(PausingDrain, self).receiveBatch(items)
+                pauses.append(self.fount.pauseFlow())
+
+        @tube
+        class Doubler(object):
+            def received(self, item):
+                return [item, item]
+
+        fd = PausingDrain()
+        self.ff.flowTo(series(Doubler())).flowTo(fd)
+        self.ff.drain.receive(1)
+        self.ff.drain.receive(2)
+        self.assertEqual(fd.batches, [[1, 1]])
+        pauses.pop().unpause()
+        self.assertEqual(fd.batches, [[1, 1], [2, 2]])
+
+
+    def test_bufferedListsCombined(self):
+        """
+        The values of several L{list}s returned while a L{_Siphon} was paused
+        are delivered as a single batch when it resumes.
+        """
+        @tube
+        class Doubler(object):
+            def received(self, item):
+                return [item, item]
+
+        self.ff.flowTo(series(Doubler())).flowTo(self.fd)
+        pause = self.fd.fount.pauseFlow()
+        self.ff.drain.receive(1)
+        self.ff.drain.receive(2)
+        pause.unpause()
+        self.assertEqual(self.fd.batches, [[1, 1, 2, 2]])
+
+
+    def test_receiveBatchIsReceive(self):
+        """
+        L{_SiphonDrain.receiveBatch} passes each item to the tube, delivering
+        the results of each one before passing on the next.
+        """
+        events = []
+
+        @tube
+        class Recorder(object):
+            def received(self, item):
+                events.append(("received", item))
+                return [item]
+
+        @implementer(IBatchDrain)
+        class RecordingDrain(FakeBatchDrain):
+            def receiveBatch(self, items):
+                events.append(("delivered", items))
+
+        drain = series(Recorder())
+        self.ff.flowTo(drain).flowTo(RecordingDrain())
+        drain.receiveBatch([1, 2])
+        self.assertEqual(events, [("received", 1), ("delivered", [1]),
+                                  ("received", 2), ("delivered", [2])])
+
+
+    def test_batchesBetweenSiphons(self):
+        """
+        A batch delivered from one L{_Siphon} to the next is processed like
+        the same items delivered one at a time.
+        """
+        @tube
+        class Splitter(object):
+            def received(self, item):
+                return item.split()
+
+        @tube
+        class Upper(object):
+            def received(self, item):
+                return [item.upper()]
+
+        self.ff.flowTo(series(Splitter(), Upper())).flowTo(self.fd)
+        self.ff.drain.receive("a b")
+        self.assertEqual(self.fd.received, ["A", "B"])
+
+
+    def test_stopFlowDuringBatch(self):
+        """
+        If the downstream drain stops the flow while a batch is being
+        processed, the rest of the batch is not passed to the tube, just as
+        if the items had been delivered one at a time.
+        """
+        @tube
+        class Source(object):
+            def received(self, item):
+                return [1, 2, 3]
+
+        seen = []
+
+        @tube
+        class Identity(object):
+            def received(self, item):
+                seen.append(item)
+                return [item]
+
+        class StoppingDrain(FakeDrain):
+            def receive(self, item):
+                super(StoppingDrain, self).receive(item)
+                self.fount.stopFlow()
+
+        fd = StoppingDrain()
+        self.ff.flowTo(series(Source(), Identity())).flowTo(fd)
+        self.ff.drain.receive("go")
+        self.assertEqual(fd.received, [1])
+        self.assertEqual(seen, [1])
+
+
+    def test_pauseDuringBatch(self):
+        """
+        If a L{_Siphon}'s fount is paused while it is processing a batch, the
+        rest of the batch is not passed to its tube until it resumes.
+        """
+        seen = []
+
+        @tube
+        class Identity(object):
+            def received(self, item):
+                seen.append(item)
+                return [item]
+
+        pauses = []
+
+        class PausingDrain(FakeDrain):
+            def receive(self, item):
+                super(PausingDrain, self).receive(item)
+                if not pauses:
+                    pauses.append(self.fount.pauseFlow())
+
+        fd = PausingDrain()
+        drain = series(Identity())
+        self.ff.flowTo(drain).flowTo(fd)
+        drain.receiveBatch([1, 2, 3])
+        drain.receive(4)
+        self.assertEqual(seen, [1])
+        self.assertEqual(self.ff.flowIsPaused, 1)
+        pauses[0].unpause()
+        self.assertEqual(seen, [1, 2, 3, 4])
+        self.assertEqual(fd.received, [1, 2, 3, 4])
+        self.assertEqual(self.ff.flowIsPaused, 0)
+
+
+    def test_flowStoppedAfterUnprocessedBatch(self):
+        """
+        If the flow stops while the rest of a batch is waiting for a
+        L{_Siphon}'s fount to resume, the tube is stopped after the rest of
+        the batch has been processed.
+        """
+        events = []
+
+        @tube
+        class Recorder(object):
+            def received(self, item):
+                events.append(item)
+                return [item]
+            def stopped(self, reason):
+                events.append("stopped")
+                return []
+
+        drain = series(Recorder())
+        self.ff.flowTo(drain).flowTo(self.fd)
+        pause = self.fd.fount.pauseFlow()
+        drain.receiveBatch([1, 2])
+        drain.flowStopped(Failure(StopFlowCalled()))
+        self.assertEqual(events, [1])
+        pause.unpause()
+        self.assertEqual(events, [1, 2, "stopped"])
+        self.assertEqual(self.fd.received, [1, 2])
+        self.assertEqual(len(self.fd.stopped), 1)
+
+
+    def test_divertableNotBatched(self):
+        """
+        Values from an L{IDivertable} are not batched, so that diverting it
+        can reassemble whatever has not yet been delivered.
+        """
+        @implementer(IDivertable)
+        @tube
+        class ListPassthru(object):
+            def received(self, item):
+                return [item, item]
+            def reassemble(self, data):
+                return data
+
+        self.ff.flowTo(series(Diverter(ListPassthru()))).flowTo(self.fd)
+        self.ff.drain.receive(1)
+        self.assertEqual(self.fd.batches, [])
+        self.assertEqual(self.fd.received, [1, 1])
+
+
+
+class FusedSeriesTests(TestCase):
+    """
+    Tests for L{series} of adjacent tubes created by L{receiver}.
+    """
+
+    def setUp(self):
+        """
+        Create a fake fount and drain, and some receivers.
+        """
+        self.ff = FakeFount()
+        self.fd = FakeDrain()
+
+        @receiver(name="split")
+        def split(item):
+            for part in item.split():
+                yield part
+        self.split = split
+
+        @receiver(name="double")
+        def double(item):
+            return [item, item]
+        self.double = double
+
+        @receiver(name="upper")
+        def upper(item):
+            yield item.upper()
+        self.upper = upper
+
+
+    def test_sameOutput(self):
+        """
+        Fused receivers produce the same outputs, in the same order, as the
+        same receivers in separate L{series}.
+        """
+        self.ff.flowTo(series(self.split, self.double, self.upper,
+                              self.fd))
+        self.ff.drain.receive("a b")
+        unfused = FakeDrain()
+        ff = FakeFount()
+        ff.flowTo(series(series(self.split), series(self.double),
+                         series(self.upper), unfused))
+        ff.drain.receive("a b")
+        self.assertEqual(self.fd.received, ["A", "A", "B", "B"])
+        self.assertEqual(self.fd.received, unfused.received)
+
+
+    def test_singleSiphon(self):
+        """
+        A run of adjacent receivers is handled by a single drain, whose
+        C{inputType} is the first receiver's and whose fount's C{outputType}
+        is the last receiver's.
+        """
+        @receiver(IFakeInput, IFakeOutput, name="first")
+        def first(item):
+            yield item
+
+        @receiver(IFakeOutput, IFakeInput, name="second")
+        def second(item):
+            yield item
+
+        drain = series(first, second)
+        self.assertEqual(repr(drain), "<Drain for fused(first, second)>")
+        self.assertEqual(drain.inputType, IFakeInput)
+        self.assertEqual(drain.flowingFrom(None).outputType, IFakeInput)
+
+
+    def test_typeChecking(self):
+        """
+        L{series} raises L{TypeError} if the C{outputType} of one fused
+        receiver is incompatible with the C{inputType} of the next.
+        """
+        @receiver(outputType=IFakeOutput, name="first")
+        def first(item):
+            yield item
+
+        @receiver(inputType=IFakeInput, name="second")
+        def second(item):
+            yield item
+
+        self.assertRaises(TypeError, series, first, second)
+
+
+    def test_pauseWhileFused(self):
+        """
+        If the downstream drain pauses its fount, no further values are
+        produced by any fused receiver until it is resumed.
+        """
+        produced = []
+
+        @receiver()
+        def count(item):
+            for each in range(item):
+                produced.append(each)
+                yield each
+
+        @receiver()
+        def passthru(item):
+            yield item
+
+        pauses = []
+
+        class PausingDrain(FakeDrain):
+            def receive(self, item):
+                super(PausingDrain, self).receive(item)
+                pauses.append(self.fount.pauseFlow())
+
+        fd = PausingDrain()
+        self.ff.flowTo(series(count, passthru, fd))
+        self.ff.drain.receive(3)
+        self.assertEqual(produced, [0])
+        self.assertEqual(self.ff.flowIsPaused, 1)
+        pauses.pop().unpause()
+        self.assertEqual(produced, [0, 1])
+        self.assertEqual(fd.received, [0, 1])
+
+
+    def test_innerReceivedRaises(self):
+        """
+        If a fused receiver other than the first raises an exception from its
+        C{received}, the exception is logged, the upstream fount is stopped,
+        and the downstream drain's flow is stopped, as they would be if it
+        were not fused.
+        """
+        @receiver()
+        def explode(item):
+            raise ZeroDivisionError()
+
+        self.ff.flowTo(series(self.double, explode, self.fd))
+        self.ff.drain.receive("a")
+        self.assertEqual(len(self.flushLoggedErrors(ZeroDivisionError)), 1)
+        self.assertEqual(self.ff.flowIsStopped, 1)
+        self.assertEqual(self.fd.received, [])
+        self.assertEqual(self.fd.stopped[0].type, ZeroDivisionError)
+
+
+
+class PipelineTemplateTests(TestCase):
+    """
+    Tests for L{PipelineTemplate}.
+    """
+
+    def test_newDrain(self):
+        """
+        L{PipelineTemplate.newDrain} creates a new pipeline, with a new
+        instance of each stage's tube, each time it is called.
+        """
+        @receiver()
+        def double(item):
+            return [item, item]
+
+        template = PipelineTemplate(TesterTube, double, PassthruTube)
+        drains = [template.newDrain(), template.newDrain()]
+        results = []
+        for value, drain in zip(["a", "b"], drains):
+            ff = FakeFount()
+            fd = FakeDrain()
+            ff.flowTo(drain).flowTo(fd)
+            ff.drain.receive(value)
+            results.append(ff.drain._tube.allReceivedItems)
+        self.assertEqual(results, [["a"], ["b"]])
+
+
+    def test_output(self):
+        """
+        A pipeline created by L{PipelineTemplate.newDrain} produces the same
+        output as a L{series} of the same stages.
+        """
+        @receiver()
+        def double(item):
+            return [item, item]
+
+        @receiver()
+        def upper(item):
+            yield item.upper()
+
+        template = PipelineTemplate(PassthruTube, double, upper,
+                                    lambda: series(PassthruTube()))
+        ff = FakeFount()
+        fd = FakeDrain()
+        ff.flowTo(template.newDrain()).flowTo(fd)
+        ff.drain.receive("a")
+        self.assertEqual(fd.received, ["A", "A"])
+
+
+    def test_terminalDrain(self):
+        """
+        The last stage of a L{PipelineTemplate} may be a terminal drain.
+        """
+        drains = []
+
+        def terminal():
+            drains.append(FakeDrain())
+            return drains[-1]
+
+        template = PipelineTemplate(PassthruTube, terminal)
+        ff = FakeFount()
+        self.assertIdentical(ff.flowTo(template.newDrain()), None)
+        ff.drain.receive(1)
+        self.assertEqual(drains[-1].received, [1])
+
+
+    def test_typeChecked(self):
+        """
+        L{PipelineTemplate.newDrain} raises L{TypeError} if the output of one
+        stage is not compatible with the input of the next.
+        """
+        @tube
+        class Output(object):
+            outputType = IFakeOutput
+
+        @tube
+        class Input(object):
+            inputType = IFakeInput
+
+        template = PipelineTemplate(Output, Input)
+        self.assertRaises(TypeError, template.newDrain)
+        self.assertRaises(TypeError, template.newDrain)
+
+
+    def test_notCallable(self):
+        """
+        L{PipelineTemplate} raises L{TypeError} for a stage which is neither a
+        receiver nor callable.
+        """
+        self.assertRaises(TypeError, PipelineTemplate, TesterTube())
+
+
+    def test_notTubeOrDrain(self):
+        """
+        L{PipelineTemplate.newDrain} raises L{TypeError} for a stage whose
+        callable returns something which is neither an L{ITube} nor an
+        L{IDrain}.
+        """
+        template = PipelineTemplate(object)
+        self.assertRaises(TypeError, template.newDrain)
+
+
+    def test_factoriesNotCalledUntilNewDrain(self):
+        """
+        Creating a L{PipelineTemplate} does not call its stages' callables;
+        each is called once for each pipeline created.
+        """
+        calls = []
+
+        def factory():
+            calls.append(None)
+            return PassthruTube()
+
+        template = PipelineTemplate(factory, PassthruTube)
+        self.assertEqual(calls, [])
+        template.newDrain()
+        template.newDrain()
+        self.assertEqual(len(calls), 2)
+
+
+    def test_noStages(self):
+        """
+        L{PipelineTemplate} raises L{TypeError} if given no stages.
+        """
+        self.assertRaises(TypeError, PipelineTemplate)
+
+
+    def test_noAdaptation(self):
+        """
+        L{PipelineTemplate.newDrain} does not adapt its stages to L{IDrain}
+        as L{series} does.
+        """
+        template = PipelineTemplate(TesterTube, PassthruTube)
+
+        def noAdaptation(original):
+            raise AssertionError("adapted {0!r}".format(original))
+
+        from .. import tube as tubeModule
+        self.patch(tubeModule, "_tubeToDrain", noAdaptation)
+        ff = FakeFount()
+        ff.flowTo(template.newDrain())
+        ff.drain.receive(1)
+        self.assertEqual(ff.drain._tube.allReceivedItems, [1])
+
+
+
+class BoundedTests(TestCase):
+    """
+    Tests for L{bounded}.
+    """
+
+    def setUp(self):
+        """
+        Create a fake fount flowing to a L{bounded} tube which returns each of
+        its inputs twice, flowing to a fake drain which is paused.
+        """
+        @tube
+        class Doubler(object):
+            def received(self, item):
+                return [item, item]
+
+        self.ff = FakeFount()
+        self.fd = FakeDrain()
+        self.drain = bounded(Doubler(), 4, 2)
+        self.ff.flowTo(self.drain).flowTo(self.fd)
+        self.pause = self.fd.fount.pauseFlow()
+
+
+    def test_occupancy(self):
+        """
+        The C{occupancy} of a L{bounded} drain is the number of values waiting
+        to be delivered.
+        """
+        self.assertEqual(self.drain.occupancy, 0)
+        self.ff.drain.receive(1)
+        self.assertEqual(self.drain.occupancy, 2)
+        self.pause.unpause()
+        self.assertEqual(self.drain.occupancy, 0)
+        self.assertEqual(self.fd.received, [1, 1])
+
+
+    def test_pausesAboveHighWater(self):
+        """
+        The upstream fount is not paused when the downstream drain pauses,
+        but only once more than C{highWater} values are waiting to be
+        delivered.
+        """
+        self.ff.drain.receive(1)
+        self.ff.drain.receive(2)
+        self.assertEqual(self.ff.flowIsPaused, 0)
+        self.ff.drain.receive(3)
+        self.assertEqual(self.ff.flowIsPaused, 1)
+        self.assertEqual(self.drain.occupancy, 6)
+
+
+    def test_resumesAtLowWater(self):
+        """
+        Once the values waiting to be delivered have drained to C{lowWater},
+        the upstream fount is resumed.
+        """
+        for item in range(3):
+            self.ff.drain.receive(item)
+        pauses = []
+
+        class PausingDrain(FakeDrain):
+            def receive(self, item):
+                super(PausingDrain, self).receive(item)
+                if len(self.received) in (3, 4):
+                    pauses.append(self.fount.pauseFlow())
+
+        fd = PausingDrain()
+        self.fd.fount.flowTo(fd)
+        self.pause.unpause()
+        self.assertEqual(fd.received, [0, 0, 1])
+        self.assertEqual(self.drain.occupancy, 3)
+        self.assertEqual(self.ff.flowIsPaused, 1)
+        pauses.pop().unpause()
+        self.assertEqual(fd.received, [0, 0, 1, 1])
+        self.assertEqual(self.drain.occupancy, 2)
+        self.assertEqual(self.ff.flowIsPaused, 0)
+
+
+    def test_noDrain(self):
+        """
+        A L{bounded} drain buffers output while its fount has no drain, up to
+        C{highWater}.
+        """
+        drain = bounded(PassthruTube(), 1)
+        self.ff.flowTo(drain)
+        self.assertEqual(self.ff.flowIsPaused, 0)
+        self.ff.drain.receive(1)
+        self.assertEqual(self.ff.flowIsPaused, 1)
+
+
+    def test_sizeOf(self):
+        """
+        If C{sizeOf} is given, the C{occupancy} of a L{bounded} drain is the
+        sum of the sizes of the values waiting to be delivered.
+        """
+        @tube
+        class Splitter(object):
+            def received(self, item):
+                return item.split()
+
+        ff = FakeFount()
+        fd = FakeDrain()
+        drain = bounded(Splitter(), 5, sizeOf=len)
+        ff.flowTo(drain).flowTo(fd)
+        pause = fd.fount.pauseFlow()
+        ff.drain.receive("abc de")
+        self.assertEqual((drain.occupancy, ff.flowIsPaused), (5, 0))
+        ff.drain.receive("f")
+        self.assertEqual((drain.occupancy, ff.flowIsPaused), (6, 1))
+        pause.unpause()
+        self.assertEqual((drain.occupancy, ff.flowIsPaused), (0, 0))
+        self.assertEqual(fd.received, ["abc", "de", "f"])
+
+
+    def test_generatorPausesUpstream(self):
+        """
+        Values which a generator has not yet yielded do not count towards the
+        C{occupancy} of a L{bounded} drain, but while they are waiting to be
+        delivered the upstream fount is paused.
+        """
+        pauses = []
+
+        @tube
+        class PausingTube(object):
+            def received(self, item):
+                yield item
+                pauses.append(fd.fount.pauseFlow())
+                yield item + 1
+                yield item + 2
+
+        ff = FakeFount()
+        fd = FakeDrain()
+        drain = bounded(PausingTube(), 10)
+        ff.flowTo(drain).flowTo(fd)
+        ff.drain.receive(1)
+        self.assertEqual(fd.received, [1])
+        self.assertEqual(drain.occupancy, 1)
+        self.assertEqual(ff.flowIsPaused, 1)
+        pauses.pop().unpause()
+        self.assertEqual(fd.received, [1, 2, 3])
+        self.assertEqual(drain.occupancy, 0)
+        self.assertEqual(ff.flowIsPaused, 0)
+
+
+    def test_newFountWhileFull(self):
+        """
+        If a L{bounded} drain is full when it starts flowing from a new fount,
+        the new fount is paused instead of the old one.
+        """
+        for item in range(3):
+            self.ff.drain.receive(item)
+        newFount = FakeFount()
+        newFount.flowTo(self.drain)
+        self.assertEqual((self.ff.flowIsPaused, newFount.flowIsPaused),
+                         (0, 1))
+        self.pause.unpause()
+        self.assertEqual(newFount.flowIsPaused, 0)
+
+
+
+class SiphonPendingValuesTests(TestCase):
+    """
+    Tests for L{SiphonPendingValues}.
+    """
+
+    def popAll(self, pending):
+        """
+        Pop all the values from a L{SiphonPendingValues}.
+
+        @param pending: the L{SiphonPendingValues}.
+
+        @return: a L{list} of the values popped.
+        """
+        result = []
+        while True:
+            value = pending.popPendingValue()
+            if value is finished:
+                return result
+            result.append(value)
+
+
+    def test_inOrder(self):
+        """
+        Values from lists, tuples, generators and other iterables are popped
+        in the order they were appended.
+        """
+        pending = SiphonPendingValues()
+        pending.append([1, 2])
+        pending.append((3,))
+        pending.append(x for x in [4, 5])
+        pending.append(iter([6]))
+        pending.append(set([7]))
+        self.assertEqual(self.popAll(pending), [1, 2, 3, 4, 5, 6, 7])
+        self.assertEqual((pending.occupancy, pending.lazy), (0, 0))
+
+
+    def test_suspendedWhileGenerating(self):
+        """
+        If a L{SiphonPendingValues} is suspended while a generator is
+        producing a value, that value is kept, counted in its C{occupancy},
+        and popped first once it is resumed.
+        """
+        pending = SiphonPendingValues()
+
+        def generator():
+            yield 1
+            pending.suspend()
+            yield 2
+            yield 3
+
+        pending.append(generator())
+        pending.append([4])
+        self.assertEqual(pending.popPendingValue(), 1)
+        self.assertIs(pending.popPendingValue(), suspended)
+        self.assertEqual((pending.occupancy, pending.lazy), (2, 1))
+        pending.resume()
+        self.assertEqual(self.popAll(pending), [2, 3, 4])
+
+
+    def test_batchIsList(self):
+        """
+        If the only sequence at the beginning of the queue is a L{list}, that
+        L{list} is returned from L{SiphonPendingValues.popPendingBatch} as is.
+        """
+        pending = SiphonPendingValues()
+        values = [1, 2]
+        pending.append(values)
+        pending.append(x for x in [3])
+        self.assertIs(pending.popPendingBatch(), values)
+        self.assertIs(pending.popPendingBatch(), None)
+        self.assertEqual(self.popAll(pending), [3])
+
+
+    def test_batchCombined(self):
+        """
+        L{SiphonPendingValues.popPendingBatch} combines the remaining values
+        of all the sequences at the beginning of the queue, omitting
+        L{skip}.
+        """
+        pending = SiphonPendingValues()
+        pending.append([1, 2])
+        pending.append((skipToken, 3))
+        pending.append([4])
+        self.assertEqual(pending.popPendingValue(), 1)
+        self.assertEqual(pending.popPendingBatch(), [2, 3, 4])
+        self.assertEqual(pending.occupancy, 0)
+        self.assertIs(pending.popPendingValue(), finished)
+
+
+
 class ErrorBehaviorTests(TestCase):
     """
     Test cases for when unexpected exceptions are raised.
@@ -170,3 +170,224 @@ class DeferredIntegrationTests(SynchronousTestCase):
         self.ff.drain.receive(2)
         self.ff.drain.flowStopped(Failure(ZeroDivisionError()))
         self.assertEqual(list(self.successResultOf(d)), [1, 2])
+
+
+
+class DeferredWindowTests(SynchronousTestCase):
+    """
+    Tests for L{deferredToResult} with C{maxInFlight}.
+    """
+
+    def setUp(self):
+        """
+        Create a fount flowing to a L{deferredToResult} which waits on up to
+        3 L{Deferred}s at once, flowing to a drain.
+        """
+        self.ff = FakeFount()
+        self.fd = FakeDrain()
+        self.ff.flowTo(series(deferredToResult(maxInFlight=3), self.fd))
+
+
+    def test_severalInFlight(self):
+        """
+        Up to C{maxInFlight} L{Deferred}s are accepted before the upstream
+        fount is paused.
+        """
+        ds = [Deferred() for each in range(3)]
+        self.ff.drain.receive(ds[0])
+        self.ff.drain.receive(ds[1])
+        self.assertEqual(self.ff.flowIsPaused, 0)
+        self.ff.drain.receive(ds[2])
+        self.assertEqual(self.ff.flowIsPaused, 1)
+        ds[0].callback("a")
+        self.assertEqual(self.fd.received, ["a"])
+        self.assertEqual(self.ff.flowIsPaused, 0)
+
+
+    def test_inOrder(self):
+        """
+        Results are delivered in the order that their L{Deferred}s were
+        received, no matter what order they fire in.
+        """
+        ds = [Deferred() for each in range(3)]
+        for d in ds:
+            self.ff.drain.receive(d)
+        ds[2].callback("c")
+        ds[1].callback("b")
+        self.assertEqual(self.fd.received, [])
+        self.assertEqual(self.ff.flowIsPaused, 1)
+        ds[0].callback("a")
+        self.assertEqual(self.fd.received, ["a", "b", "c"])
+        self.assertEqual(self.ff.flowIsPaused, 0)
+
+
+    def test_alreadyFired(self):
+        """
+        The result of an already-fired L{Deferred} is delivered immediately if
+        no earlier L{Deferred}s are outstanding.
+        """
+        self.ff.drain.receive(succeed(1))
+        self.assertEqual(self.fd.received, [1])
+        d = Deferred()
+        self.ff.drain.receive(d)
+        self.ff.drain.receive(succeed(3))
+        self.assertEqual(self.fd.received, [1])
+        d.callback(2)
+        self.assertEqual(self.fd.received, [1, 2, 3])
+
+
+    def test_pausedResultsFillWindow(self):
+        """
+        Results waiting for the downstream drain to resume count towards
+        C{maxInFlight}.
+        """
+        pause = self.fd.fount.pauseFlow()
+        for each in range(3):
+            self.ff.drain.receive(succeed(each))
+        self.assertEqual(self.fd.received, [])
+        self.assertEqual(self.ff.flowIsPaused, 1)
+        pause.unpause()
+        self.assertEqual(self.fd.received, [0, 1, 2])
+        self.assertEqual(self.ff.flowIsPaused, 0)
+
+
+    def test_flowStoppedWaits(self):
+        """
+        When the upstream flow stops, the downstream flow is stopped only once
+        all outstanding results have been delivered.
+        """
+        d = Deferred()
+        self.ff.drain.receive(d)
+        reason = Failure(ZeroDivisionError())
+        self.ff.drain.flowStopped(reason)
+        self.assertEqual(self.fd.stopped, [])
+        d.callback(1)
+        self.assertEqual(self.fd.received, [1])
+        self.assertEqual(self.fd.stopped, [reason])
+
+
+    def test_failure(self):
+        """
+        When a L{Deferred} fails, the upstream fount is stopped and the
+        downstream flow is stopped with the failure, once the results before
+        it have been delivered.
+        """
+        ds = [Deferred() for each in range(2)]
+        for d in ds:
+            self.ff.drain.receive(d)
+        ds[1].errback(ZeroDivisionError())
+        self.assertEqual(self.fd.stopped, [])
+        ds[0].callback(1)
+        self.assertEqual(self.fd.received, [1])
+        self.assertEqual(self.ff.flowIsStopped, 1)
+        self.assertEqual(len(self.fd.stopped), 1)
+        self.assertEqual(self.fd.stopped[0].type, ZeroDivisionError)
+
+
+    def test_stopFlow(self):
+        """
+        Stopping the flow stops the upstream fount and discards any results
+        not yet delivered.
+        """
+        d = Deferred()
+        self.ff.drain.receive(d)
+        self.fd.fount.stopFlow()
+        self.assertEqual(self.ff.flowIsStopped, 1)
+        d.callback(1)
+        self.assertEqual(self.fd.received, [])
+
+
+    def test_maxInFlightTooSmall(self):
+        """
+        L{deferredToResult} raises L{ValueError} if C{maxInFlight} is less
+        than 1.
+        """
+        self.assertRaises(ValueError, deferredToResult, maxInFlight=0)
+
+
+
+class UnorderedDeferredWindowTests(SynchronousTestCase):
+    """
+    Tests for L{deferredToResult} with C{ordered=False}.
+    """
+
+    def setUp(self):
+        """
+        Create a fount flowing to an unordered L{deferredToResult} which waits
+        on up to 2 L{Deferred}s at once, flowing to a drain.
+        """
+        self.ff = FakeFount()
+        self.fd = FakeDrain()
+        self.ff.flowTo(series(deferredToResult(maxInFlight=2, ordered=False),
+                              self.fd))
+
+
+    def test_asTheyFire(self):
+        """
+        Results are delivered as soon as their L{Deferred}s fire.
+        """
+        ds = [Deferred() for each in range(2)]
+        for d in ds:
+            self.ff.drain.receive(d)
+        self.assertEqual(self.ff.flowIsPaused, 1)
+        ds[1].callback("b")
+        self.assertEqual(self.fd.received, ["b"])
+        self.assertEqual(self.ff.flowIsPaused, 0)
+        ds[0].callback("a")
+        self.assertEqual(self.fd.received, ["b", "a"])
+
+
+    def test_failureStopsFlow(self):
+        """
+        By default, when a L{Deferred} fails, the upstream fount is stopped,
+        the downstream flow is stopped with the failure, and the results of
+        any outstanding L{Deferred}s are discarded.
+        """
+        ds = [Deferred() for each in range(2)]
+        for d in ds:
+            self.ff.drain.receive(d)
+        ds[0].errback(ZeroDivisionError())
+        self.assertEqual(self.ff.flowIsStopped, 1)
+        self.assertEqual(self.fd.stopped[0].type, ZeroDivisionError)
+        ds[1].callback("b")
+        self.assertEqual(self.fd.received, [])
+
+
+    def test_flowStoppedWaits(self):
+        """
+        When the upstream flow stops, the downstream flow is stopped only once
+        every outstanding L{Deferred} has fired.
+        """
+        d = Deferred()
+        self.ff.drain.receive(d)
+        reason = Failure(ZeroDivisionError())
+        self.ff.drain.flowStopped(reason)
+        self.assertEqual(self.fd.stopped, [])
+        d.callback(1)
+        self.assertEqual(self.fd.received, [1])
+        self.assertEqual(self.fd.stopped, [reason])
+
+
+
+class DeliverFailuresTests(SynchronousTestCase):
+    """
+    Tests for L{deferredToResult} with C{deliverFailures=True}.
+    """
+
+    def test_failuresDelivered(self):
+        """
+        A L{Failure} is delivered as a result, and the flow carries on.
+        """
+        for ordered in [True, False]:
+            ff = FakeFount()
+            fd = FakeDrain()
+            ff.flowTo(series(deferredToResult(ordered=ordered,
+                                              deliverFailures=True), fd))
+            d = Deferred()
+            ff.drain.receive(d)
+            d.errback(ZeroDivisionError())
+            ff.drain.receive(succeed(2))
+            [failure, two] = fd.received
+            self.assertEqual(failure.type, ZeroDivisionError)
+            self.assertEqual(two, 2)
+            self.assertEqual((fd.stopped, ff.flowIsStopped), ([], 0))
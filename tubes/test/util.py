@@ -15,7 +15,7 @@ from twisted.internet.interfaces import (
     IStreamClientEndpoint, IStreamServerEndpoint, IListeningPort, IPushProducer
 )
 
-from ..itube import IDrain, IFount, IDivertable
+from ..itube import IDrain, IFount, IDivertable, IBatchDrain
 from ..tube import tube
 from ..kit import Pauser, beginFlowingFrom, beginFlowingTo
 
@@ -128,6 +128,36 @@ verifyClass(IDrain, FakeDrain)
 
 
 
+@implementer(IBatchDrain)
+class FakeBatchDrain(FakeDrain):
+    """
+    A L{FakeDrain} which can also receive batches of items.
+
+    @ivar batches: All the batches that have thus far been received.
+    @type batches: L{list} of L{list}s
+    """
+
+    def __init__(self, inputType=None):
+        super(FakeBatchDrain, self).__init__(inputType)
+        self.batches = []
+
+
+    def receiveBatch(self, items):
+        """
+        Append a batch to L{FakeBatchDrain.batches} and its items to
+        L{FakeDrain.received}.
+
+        @param items: see L{IBatchDrain}
+        """
+        self.batches.append(list(items))
+        for item in items:
+            self.receive(item)
+
+
+verifyClass(IBatchDrain, FakeBatchDrain)
+
+
+
 @implementer(IFount)
 class FakeFount(object):
     """
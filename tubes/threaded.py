@@ -0,0 +1,174 @@
+# -*- test-case-name: tubes.test.test_threaded -*-
+# Copyright (c) Twisted Matrix Laboratories.
+# See LICENSE for details.
+
+"""
+Run the work of a tube in a thread pool, so that tubes which do a lot of
+computation, or call blocking APIs, don't block the reactor.
+
+@see: L{threadedTube}
+"""
+
+from zope.interface import implementer
+
+from twisted.internet.defer import DeferredList, succeed
+from twisted.internet.threads import deferToThreadPool
+
+from .itube import ITube
+from .tube import receiver, series
+from .undefer import _DeferredWindow
+
+__all__ = [
+    "threadedTube",
+]
+
+
+
+def _listFrom(method, argument):
+    """
+    Call a method of a tube, and produce all of its output.
+
+    @param method: a method of an L{ITube}, like C{received} or C{stopped}.
+
+    @param argument: the argument to pass to C{method}.
+
+    @return: all the values in the iterable returned by C{method}.
+    @rtype: L{list}
+    """
+    return list(method(argument) or ())
+
+
+
+@implementer(ITube)
+class _ThreadDispatcher(object):
+    """
+    A tube which calls the C{received} method of another tube in a thread
+    pool, producing a L{Deferred} which fires with a L{list} of its outputs
+    for each input.
+
+    @ivar _tube: the tube whose work is done in the thread pool.
+
+    @ivar _pool: the thread pool.
+
+    @ivar _reactor: the reactor to deliver results to.
+
+    @ivar _outstanding: the L{Deferred}s for C{received} calls which have not
+        yet finished.
+    @type _outstanding: L{set}
+    """
+
+    outputType = None
+
+    def __init__(self, tube, pool, reactor):
+        """
+        @param tube: see L{_ThreadDispatcher._tube}
+
+        @param pool: see L{_ThreadDispatcher._pool}
+
+        @param reactor: see L{_ThreadDispatcher._reactor}
+        """
+        self._tube = tube
+        self._pool = pool
+        self._reactor = reactor
+        self._outstanding = set()
+        self.inputType = tube.inputType
+
+
+    def _inThread(self, method, argument):
+        """
+        Call a method of the wrapped tube in the thread pool.
+
+        @param method: see L{_listFrom}
+
+        @param argument: see L{_listFrom}
+
+        @return: a L{Deferred} firing with a L{list} of the method's outputs.
+        """
+        return deferToThreadPool(self._reactor, self._pool, _listFrom,
+                                 method, argument)
+
+
+    def started(self):
+        """
+        Start the wrapped tube, in the reactor thread.
+
+        @return: a L{Deferred} firing with a L{list} of its outputs.
+        """
+        return [succeed(list(self._tube.started() or ()))]
+
+
+    def received(self, item):
+        """
+        Pass an item to the wrapped tube in the thread pool.
+
+        @param item: an input for the wrapped tube.
+
+        @return: a L{Deferred} firing with a L{list} of its outputs.
+        """
+        d = self._inThread(self._tube.received, item)
+        self._outstanding.add(d)
+        def finished(result):
+            self._outstanding.discard(d)
+            return result
+        return [d.addBoth(finished)]
+
+
+    def stopped(self, reason):
+        """
+        Stop the wrapped tube in the thread pool, once all of its inputs have
+        been processed.
+
+        @param reason: see L{ITube.stopped}
+
+        @return: a L{Deferred} firing with a L{list} of its outputs.
+        """
+        waiting = DeferredList(list(self._outstanding))
+        return [waiting.addCallback(
+            lambda ignored: self._inThread(self._tube.stopped, reason))]
+
+
+
+def threadedTube(tube, pool, maxInFlight=1, ordered=True, reactor=None):
+    """
+    Convert an L{ITube} to an L{IDrain} which calls its C{received} and
+    C{stopped} methods in a thread pool, and delivers their output back in
+    the reactor thread.
+
+    As many as C{maxInFlight} inputs are passed to the thread pool at once;
+    the upstream fount is paused when that many are waiting for a thread, or
+    to have their outputs delivered, so the thread pool's queue is bounded.
+    If C{maxInFlight} is more than 1, C{tube.received} is called from several
+    threads at once, so it must be safe to do so; for example, by not keeping
+    any state.
+
+    Exceptions raised by the tube stop the flow, just as they would if it were
+    not in a thread pool.
+
+    @param tube: the tube.
+    @type tube: L{ITube}
+
+    @param pool: the thread pool, which must be started.
+    @type pool: L{twisted.python.threadpool.ThreadPool}
+
+    @param maxInFlight: the number of inputs to process at once.
+    @type maxInFlight: L{int}
+
+    @param ordered: deliver outputs in the order of the inputs they came from,
+        rather than the order those inputs finished processing?
+    @type ordered: L{bool}
+
+    @param reactor: the reactor to deliver outputs in; by default, the global
+        reactor.
+
+    @return: a drain for C{tube}.
+    @rtype: L{IDrain}
+    """
+    if reactor is None:
+        from twisted.internet import reactor
+
+    @receiver(outputType=tube.outputType, name="flatten")
+    def flatten(outputs):
+        return outputs
+
+    return series(_ThreadDispatcher(tube, pool, reactor),
+                  _DeferredWindow(maxInFlight, ordered, False).drain, flatten)
@@ -8,6 +8,8 @@ See L{tube}.
 
 from __future__ import print_function
 
+from functools import partial
+
 from zope.interface import implementer
 from zope.interface.verify import verifyClass
 
@@ -15,12 +17,13 @@ from twisted.python.components import proxyForInterface
 from twisted.python.failure import Failure
 
 from .itube import IDrain, ITube, IDivertable, IFount, StopFlowCalled
-from ._siphon import _tubeRegistry, _Siphon, skip
-from ._components import _registryActive
-from .kit import NoPause as _PlaceholderPause
+from ._siphon import _tubeToDrain, _tube2drain, _Siphon, skip
+from .kit import NoPause as _PlaceholderPause, _checkFlowTypes
 
 __all__ = [
+    "bounded",
     "Diverter",
+    "PipelineTemplate",
     "receiver",
     "tube",
     "skip"
@@ -167,6 +170,186 @@ class _Tubule(object):
 
 
 
+@implementer(ITube)
+class _FusedTubules(object):
+    """
+    A tube which does the work of several adjacent L{_Tubule}s in a L{series},
+    so that they can share a single L{_Siphon}.
+
+    Each value produced by one tubule is passed to the next as soon as it is
+    produced, just as it would be by separate L{_Siphon}s.
+
+    @ivar _siphon: The L{_Siphon} which this tube was created for.
+    @type _siphon: L{_Siphon}
+
+    @ivar _broken: Has one of the tubules raised an exception from
+        C{received}?  If so, no further values will be produced.
+    @type _broken: L{bool}
+    """
+
+    def __init__(self, tubules):
+        """
+        @param tubules: the tubules to fuse, in the order that values flow
+            through them.
+        @type tubules: L{list} of at least two L{_Tubule}s
+
+        @raise TypeError: if the C{outputType} of any tubule is not compatible
+            with the C{inputType} of the next.
+        """
+        for upstream, downstream in zip(tubules, tubules[1:]):
+            _checkFlowTypes("<Fount for {0!r}>".format(upstream),
+                            upstream.outputType,
+                            "<Drain for {0!r}>".format(downstream),
+                            downstream.inputType)
+        self._tubules = tubules
+        self._receiveds = [tubule.received for tubule in tubules]
+        self._last = len(tubules) - 1
+        self.inputType = tubules[0].inputType
+        self.outputType = tubules[-1].outputType
+        self._siphon = None
+        self._broken = False
+
+
+    def started(self):
+        """
+        Tubules cannot produce a greeting.
+
+        @return: an empty iterable.
+        """
+        return ()
+
+
+    def received(self, item):
+        """
+        Pass the item to the first tubule, and return an iterable that passes
+        each of its outputs through the rest.
+
+        @param item: an input for the first tubule.
+
+        @return: an iterable of the outputs of the last tubule, or L{None}.
+        """
+        if self._broken:
+            return None
+        result = self._receiveds[0](item)
+        if result is None:
+            return None
+        return self._receivedFrom(1, result)
+
+
+    def _receivedFrom(self, index, values):
+        """
+        Pass values through the tubules starting at the given index.
+
+        @param index: the index in C{self._tubules} of the tubule to pass
+            C{values} to.
+        @type index: L{int}
+
+        @param values: an iterable of inputs to that tubule.
+
+        @return: a generator of the outputs of the last tubule.
+        """
+        received = self._receiveds[index]
+        last = index == self._last
+        for value in values:
+            if self._broken:
+                return
+            if value is skip:
+                yield skip
+                continue
+            try:
+                result = received(value)
+            except:
+                self._failed(received)
+                return
+            if result is None:
+                continue
+            if last:
+                yield from result
+            else:
+                yield from self._receivedFrom(index + 1, result)
+
+
+    def _failed(self, received):
+        """
+        A tubule other than the first raised an exception from C{received}.
+        Behave as its own L{_Siphon} would: log it, stop the upstream fount,
+        and stop the downstream drain's flow.
+
+        This must be called while the exception is being handled.
+
+        @param received: the C{received} callable that raised.
+        """
+        self._broken = True
+        self._siphon._noMore(input=True, output=False)
+        self._siphon._deliveryFailed(received)
+
+
+    def stopped(self, reason):
+        """
+        Tubules cannot produce a farewell.
+
+        @param reason: the reason the flow stopped.
+
+        @return: an empty iterable.
+        """
+        return ()
+
+
+    def __repr__(self):
+        """
+        @return: the names of the fused L{_Tubule}s.
+        """
+        return "fused({0})".format(", ".join(repr(tubule)
+                                             for tubule in self._tubules))
+
+
+
+def _fusedDrain(tubules):
+    """
+    Create a drain which does the work of several L{_Tubule}s.
+
+    @param tubules: the tubules to fuse.
+    @type tubules: L{list} of at least two L{_Tubule}s
+
+    @return: L{IDrain}
+    """
+    fused = _FusedTubules(tubules)
+    siphon = fused._siphon = _Siphon(fused)
+    return siphon._tdrain
+
+
+
+def _fuseTubules(tubes, fuse=_fusedDrain):
+    """
+    Replace each run of more than one adjacent L{_Tubule} with a single drain
+    that does all of their work.
+
+    @param tubes: a sequence of objects to be connected by L{series}.
+
+    @param fuse: a 1-argument callable taking a L{list} of at least two
+        L{_Tubule}s and returning what to replace them with; by default,
+        L{_fusedDrain}.
+
+    @return: a L{list} of the same objects, with each run of L{_Tubule}s
+        replaced with the result of C{fuse}.
+    """
+    result = []
+    run = []
+    for each in list(tubes) + [None]:
+        if type(each) is _Tubule:
+            run.append(each)
+            continue
+        if len(run) > 1:
+            result.append(fuse(run))
+        else:
+            result.extend(run)
+        run = []
+        result.append(each)
+    result.pop()
+    return result
+
+
+
 def receiver(inputType=None, outputType=None, name=None):
     """
     Decorator for a stateless function which receives inputs.
@@ -214,6 +397,11 @@ def series(start, *tubes):
     with the additional feature that C{series} will convert C{a}, C{b}, and
     C{c} to the requisite L{IDrain} objects first.
 
+    Adjacent stateless tubes created with L{receiver} share a single L{IDrain}
+    which passes each of their outputs directly to the next, rather than each
+    being converted separately; this behaves the same, but is much cheaper.
+    (If you need to keep them separate, pass C{series(aReceiver)} instead.)
+
     @param start: The initial element in the chain; the object that will
         consume inputs passed to the result of this call to C{series}.
     @type start: an L{ITube}, or anything adaptable to L{IDrain}.
@@ -229,16 +417,194 @@ def series(start, *tubes):
     @raise TypeError: if C{start}, or any element of C{plumbing} is not
         adaptable to L{IDrain}.
     """
-    with _registryActive(_tubeRegistry):
-        result = IDrain(start)
-        currentFount = result.flowingFrom(None)
-        drains = [IDrain(tube) for tube in tubes]
+    start, *tubes = _fuseTubules((start,) + tubes)
+    result = _tubeToDrain(start)
+    currentFount = result.flowingFrom(None)
+    drains = [_tubeToDrain(tube) for tube in tubes]
     for drain in drains:
         currentFount = currentFount.flowTo(drain)
     return result
 
 
 
+def bounded(tube, highWater, lowWater=None, sizeOf=None):
+    """
+    Convert an L{ITube} to an L{IDrain} which buffers a limited amount of the
+    tube's output while its downstream drain is paused.
+
+    Ordinarily, when the downstream drain of a tube pauses, the fount flowing
+    into that tube is paused immediately.  Instead, the resulting drain
+    continues to accept input, buffering the tube's output, until that output
+    occupies more than C{highWater}; only then is its fount paused, and it is
+    resumed once the buffered output has drained to C{lowWater}.  This smooths
+    out the flow to a downstream drain which pauses briefly and often, while
+    still putting a hard limit on the memory used for each flow.  For example,
+    to buffer roughly 64KiB of output for a slow client::
+
+        series(bounded(linesToBytes(), 65536, sizeOf=len), transportDrain)
+
+    Only output which the tube has already produced, by returning a L{list}
+    or L{tuple}, occupies space; a generator could produce any number of
+    values, so the fount is paused whenever a generator's output is waiting
+    to be delivered.  Since a tube may return any number of values for a
+    single input, the buffered output may still briefly exceed C{highWater}.
+
+    @param tube: the tube.
+    @type tube: L{ITube}
+
+    @param highWater: the size beyond which to pause the upstream fount.
+    @type highWater: L{int}
+
+    @param lowWater: the size at or below which to resume the upstream fount;
+        by default, half of C{highWater}.
+    @type lowWater: L{int}
+
+    @param sizeOf: a 1-argument callable returning the size of one of the
+        tube's outputs, such as L{len} to limit the number of bytes buffered;
+        by default, each output has a size of 1.
+
+    @return: an L{IDrain} for C{tube}, whose C{occupancy} attribute is the
+        total size of its buffered output.
+    @rtype: L{IDrain}
+    """
+    return _Siphon(tube, highWater, lowWater, sizeOf)._tdrain
+
+
+
+def _factoryDrain(factory):
+    """
+    Create a drain for a new tube.
+
+    @param factory: a 0-argument callable returning an L{ITube}.
+
+    @return: L{IDrain}
+    """
+    return _tube2drain(factory())
+
+
+
+class PipelineTemplate(object):
+    """
+    A L{PipelineTemplate} is a reusable description of a L{series}, for
+    creating many identical pipelines, such as one for each connection
+    accepted by a L{tubes.listening.Listener}::
+
+        template = PipelineTemplate(bytesToLines, Reverser, linesToBytes)
+
+        def reverseFlow(flow):
+            flow.fount.flowTo(template.newDrain()).flowTo(flow.drain)
+
+    Creating a pipeline from a template is cheaper than calling L{series},
+    since the work of deciding how to convert each stage to an L{IDrain} is
+    done only once, when the first pipeline is created, rather than by
+    adapting each stage.
+
+    @ivar _stages: each stage of the pipeline, with each run of adjacent
+        receivers replaced by a 0-argument callable creating a drain which
+        does all of their work.
+    @type _stages: L{list}
+
+    @ivar _builders: for each stage of the pipeline, a 0-argument callable
+        that creates its L{IDrain}, or L{None} until the first pipeline has
+        been created.
+    @type _builders: L{list} of L{callable}
+    """
+
+    def __init__(self, *stages):
+        """
+        Create a L{PipelineTemplate}.  No stage's callable is called until the
+        first pipeline is created.
+
+        @param stages: Each stage of the pipeline, in order.  A stage may be a
+            0-argument callable which returns a new L{ITube} or L{IDrain}
+            each time it is called; it must return the same kind of object
+            each time, but their input and output types may vary, since each
+            new pipeline is type-checked as it is connected.  Since they are
+            stateless, a tube created with L{receiver} may also be used
+            directly.
+
+        @raise TypeError: if there are no stages, or if a stage is neither a
+            receiver nor callable.
+        """
+        if not stages:
+            raise TypeError("A PipelineTemplate requires at least one stage.")
+        for stage in stages:
+            if type(stage) is not _Tubule and not callable(stage):
+                raise TypeError(
+                    "{0!r} is neither a receiver nor a callable".format(stage)
+                )
+        self._stages = _fuseTubules(stages,
+                                    lambda run: partial(_fusedDrain, run))
+        self._builders = None
+
+
+    def newDrain(self):
+        """
+        Create a new pipeline.
+
+        @return: an L{IDrain}, like the return value of L{series}, which
+            consumes inputs for the first stage and whose C{flowingFrom}
+            returns an L{IFount} producing the outputs of the last stage.
+
+        @raise TypeError: if a stage's callable returns something which is
+            neither an L{ITube} nor an L{IDrain}, or if the output of one
+            stage is not compatible with the input of the next.
+        """
+        if self._builders is None:
+            return self._firstDrain()
+        return _connectDrains([build() for build in self._builders])
+
+
+    def _firstDrain(self):
+        """
+        Create the first pipeline, deciding how to create each stage's drain
+        from what its callable returns.
+
+        @return: see L{PipelineTemplate.newDrain}
+        """
+        builders = []
+        drains = []
+        for stage in self._stages:
+            if type(stage) is _Tubule:
+                builders.append(partial(_tube2drain, stage))
+                drains.append(builders[-1]())
+                continue
+            made = stage()
+            if IDrain.providedBy(made):
+                builders.append(stage)
+                drains.append(made)
+            elif ITube.providedBy(made):
+                builders.append(partial(_factoryDrain, stage))
+                drains.append(_tube2drain(made))
+            else:
+                raise TypeError(
+                    "{0!r} returned {1!r}, which is neither an ITube nor an "
+                    "IDrain".format(stage, made)
+                )
+        result = _connectDrains(drains)
+        self._builders = builders
+        return result
+
+
+
+def _connectDrains(drains):
+    """
+    Connect a sequence of drains, each to the fount returned by the
+    C{flowingFrom} of the one before it.
+
+    @param drains: the drains to connect.
+    @type drains: L{list} of L{IDrain}
+
+    @return: the first drain.
+    """
+    result = drains[0]
+    currentFount = result.flowingFrom(None)
+    for drain in drains[1:]:
+        currentFount = currentFount.flowTo(drain)
+    return result
+
+
+
 @tube
 class _DrainingTube(object):
     """
@@ -6,20 +6,52 @@
 L{Deferred} support for Tubes.
 """
 
+from collections import deque
+
 from .tube import receiver, series, skip
 from .itube import IDrain
+from .kit import _Stage
 
 from zope.interface import implementer
 from twisted.internet.defer import Deferred
 from twisted.python.failure import Failure
 
-def deferredToResult():
+def deferredToResult(maxInFlight=1, ordered=True, deliverFailures=False):
     """
     Convert L{Deferred}s into their results.
 
+    By default, each L{Deferred} must fire before the next is accepted, so
+    only one operation is in progress at a time.  Pass C{maxInFlight} to let
+    several be in progress at once: as many as C{maxInFlight} L{Deferred}s are
+    accepted before the upstream fount is paused.  Results are still emitted
+    in the order that their L{Deferred}s were received, so a result which is
+    waiting for an earlier L{Deferred} to fire, or for the downstream drain to
+    resume, also counts towards C{maxInFlight}.  Pass C{ordered=False} to
+    emit each result as soon as its L{Deferred} fires instead, so that one
+    slow L{Deferred} does not hold up the results of those received after it.
+
+    By default, when a L{Deferred} fails, the flow is stopped in both
+    directions, and the downstream drain's C{flowStopped} is called with the
+    L{Failure}.  Pass C{deliverFailures=True} to emit the L{Failure} as a
+    result instead, and carry on.
+
+    @param maxInFlight: the number of L{Deferred}s to wait on at once.
+    @type maxInFlight: L{int}
+
+    @param ordered: emit results in the order their L{Deferred}s were
+        received, rather than the order they fire in?
+    @type ordered: L{bool}
+
+    @param deliverFailures: emit L{Failure}s as results, rather than stopping
+        the flow?
+    @type deliverFailures: L{bool}
+
     @return: a L{drain <tubes.tube.IDrain>} that receives L{Deferred}s and
         emits the values that are the results of those L{Deferred}s.
     """
+    if maxInFlight != 1 or not ordered or deliverFailures:
+        return _DeferredWindow(maxInFlight, ordered, deliverFailures).drain
+
     @receiver()
     def received(item):
         if isinstance(item, Deferred):
@@ -42,6 +74,177 @@ def deferredToResult():
 
 
 
+def _notYet():
+    """
+    A token value meaning that a L{Deferred} in a L{_DeferredWindow} has not
+    yet fired.
+    """
+
+
+
+class _DeferredWindow(_Stage):
+    """
+    A L{_DeferredWindow} waits on several L{Deferred}s at once, and emits their
+    results, either in the order that it received them or in the order that
+    they fire.
+
+    @ivar drain: the drain which receives L{Deferred}s.
+    @type drain: L{_StageDrain}
+
+    @ivar fount: the fount which emits results.
+    @type fount: L{_StageFount}
+
+    @ivar _maxInFlight: the number of L{Deferred}s which may be waiting, or
+        whose results may be waiting to be delivered, before the upstream
+        fount is paused.
+
+    @ivar _ordered: are results emitted in the order that their L{Deferred}s
+        were received?
+
+    @ivar _deliverFailures: are L{Failure}s emitted as results?
+
+    @ivar _slots: if C{_ordered}, a 1-L{list} for each L{Deferred} whose
+        result is not yet ready to deliver, in the order they were received,
+        containing L{_notYet} or the L{Deferred}'s result.
+    @type _slots: L{deque}
+
+    @ivar _inFlight: if not C{_ordered}, the number of L{Deferred}s which
+        have not yet fired.
+    @type _inFlight: L{int}
+
+    @ivar _discarding: has the flow been stopped, so that the results of any
+        outstanding L{Deferred}s should be discarded?
+    """
+
+    def __init__(self, maxInFlight, ordered, deliverFailures):
+        """
+        @param maxInFlight: see L{_DeferredWindow._maxInFlight}
+
+        @param ordered: see L{_DeferredWindow._ordered}
+
+        @param deliverFailures: see L{_DeferredWindow._deliverFailures}
+        """
+        if maxInFlight < 1:
+            raise ValueError("maxInFlight must be at least 1, not {0!r}"
+                             .format(maxInFlight))
+        super(_DeferredWindow, self).__init__()
+        self._maxInFlight = maxInFlight
+        self._ordered = ordered
+        self._deliverFailures = deliverFailures
+        self._slots = deque()
+        self._inFlight = 0
+        self._discarding = False
+
+
+    def _receive(self, deferred):
+        """
+        Wait on a L{Deferred}.
+
+        @param deferred: a L{Deferred}; other values are ignored.
+        """
+        if not isinstance(deferred, Deferred):
+            return
+        if self._ordered:
+            slot = [_notYet]
+            self._slots.append(slot)
+            self._checkFull()
+            deferred.addBoth(self._fired, slot)
+        else:
+            self._inFlight += 1
+            self._checkFull()
+            deferred.addBoth(self._firedUnordered)
+
+
+    def _fired(self, result, slot):
+        """
+        A L{Deferred} fired, in ordered mode.
+
+        @param result: its result.
+
+        @param slot: its slot in C{self._slots}.
+        """
+        if self._discarding:
+            return
+        slot[0] = result
+        slots = self._slots
+        while slots and slots[0][0] is not _notYet:
+            self._ready.append(slots.popleft()[0])
+        self._deliver()
+
+
+    def _firedUnordered(self, result):
+        """
+        A L{Deferred} fired, in unordered mode.
+
+        @param result: its result.
+        """
+        if self._discarding:
+            return
+        self._inFlight -= 1
+        self._ready.append(result)
+        self._deliver()
+
+
+    def _discard(self):
+        """
+        Discard all the results which have not yet been delivered, including
+        those of L{Deferred}s which have not yet fired.
+        """
+        self._discarding = True
+        self._slots.clear()
+        self._ready.clear()
+        self._inFlight = 0
+
+
+    def _pending(self):
+        """
+        Are any L{Deferred}s still to fire?
+
+        @return: L{True} if so.
+        """
+        return bool(self._slots or self._inFlight)
+
+
+    def _full(self):
+        """
+        Is the window full?
+
+        @return: L{True} if as many as C{_maxInFlight} L{Deferred}s are
+            waiting to fire or to have their results delivered.
+        """
+        return (len(self._slots) + self._inFlight + len(self._ready) >=
+                self._maxInFlight)
+
+
+    def _emit(self, result):
+        """
+        Deliver a result, or stop the flow if it is a L{Failure} and failures
+        are not delivered.
+
+        @param result: the result.
+        """
+        if isinstance(result, Failure) and not self._deliverFailures:
+            self._fail(result)
+        else:
+            self.fount.drain.receive(result)
+
+
+    def _fail(self, reason):
+        """
+        A L{Deferred} failed; stop the flow in both directions.
+
+        @param reason: the failure.
+        @type reason: L{Failure}
+        """
+        self._done = True
+        self._discard()
+        upstream = self.drain.fount
+        if upstream is not None and self._stopping is None:
+            upstream.stopFlow()
+        self.fount.drain.flowStopped(reason)
+
+
+
 @implementer(IDrain)
 class _DeferredAggregatingDrain(object):
     """